@@ -0,0 +1,131 @@
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules too slow to import just to parse the command line; commands import what they need
+HEAVY_MODULES = ['pandas', 'numpy', 'faker', 'cryptography', 'pyarrow', 'duckdb']
+
+# Entry point of every command per part, as (module, function, default arguments).
+# The modules are imported only when their command runs.
+COMMANDS = {
+    'part1': {
+        'create': ('create_table', 'main', []),
+        'reset': ('empty_table', 'main', []),
+        'generate': ('generate_mock_data', 'main', []),
+        'load': ('main', 'main', []),
+        'load-parallel': ('main_multiprocessing', 'main', []),
+        'export': ('export', 'main', []),
+        'partitions': ('partitions', 'main', ['list']),
+    },
+    'part2': {
+        'create': ('create_tables', 'create_tables', []),
+        'reset': ('reset', 'main', ['truncate']),
+        'generate': ('generate_mock_data', 'main', []),
+        'load': ('main', 'main', []),
+        'export': ('analytics', 'main', ['export']),
+        'bench': ('benchmark_queries', 'main', []),
+    },
+}
+
+# Commands that must start without importing any of HEAVY_MODULES
+LIGHT_COMMANDS = ['create', 'reset']
+
+def enter_part(part):
+    """Run from the root of a part, as its scripts expect, with its source folders importable."""
+    part_dir = os.path.join(ROOT, part)
+    os.chdir(part_dir)
+    for path in (os.path.join(part_dir, 'src', 'database'), os.path.join(part_dir, 'src'), part_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+def resolve(part, command):
+    """Import the module of a command and return (function, default arguments)."""
+    module_name, function_name, defaults = COMMANDS[part][command]
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name), defaults
+
+def run_command(part, command, arguments):
+    """Run a command with the arguments of its script, e.g. `bench --runs 10`."""
+    enter_part(part)
+    function, defaults = resolve(part, command)
+    module_name = COMMANDS[part][command][0]
+    # Default arguments stand in for a missing action, e.g. `export --full` is `export export --full`
+    if not arguments or arguments[0].startswith('-'):
+        arguments = defaults + list(arguments)
+    sys.argv = [f"{module_name}.py"] + arguments
+    function()
+    return 0
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+def check_imports(part, command):
+    """Import the module of a command without running it and print the heavy modules it pulled in."""
+    enter_part(part)
+    resolve(part, command)
+    print(','.join(loaded_heavy_modules()))
+    return 0
+
+def time_startup(part, command, runs):
+    """Best wall time of `cli.py <part> --check-imports <command>` in a fresh interpreter; returns (seconds, heavy modules)."""
+    best, heavy = None, ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(ROOT, 'cli.py'), '--part', part, '--check-imports', command],
+                                capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        heavy = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+    return best, heavy
+
+def check_startup(part, runs=3, limit=1.0):
+    """Time the startup of every command of a part.
+
+    Fails when a command of LIGHT_COMMANDS imports a module of HEAVY_MODULES
+    or takes longer than limit seconds to start. Returns the exit status.
+    """
+    failures = 0
+    for command in COMMANDS[part]:
+        seconds, heavy = time_startup(part, command, runs)
+        problem = ''
+        if command in LIGHT_COMMANDS and (heavy or seconds > limit):
+            problem = '  <-- too slow for a light command' if not heavy else '  <-- imports heavy modules'
+            failures += 1
+        print(f"{part} {command:<14} {seconds * 1000:7.0f} ms  heavy imports: {heavy or '-'}{problem}")
+    return 1 if failures else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the ETL (part1) and Data Vault (part2) operations.")
+    parser.add_argument('--part', choices=sorted(COMMANDS), default='part2', help='Project to run the command in.')
+    parser.add_argument('--check-imports', action='store_true',
+                        help="Import the command's module without running it and list the heavy modules it imported.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in sorted(set().union(*COMMANDS.values())):
+        # Without a help option of their own, -h and every other argument go to the script
+        commands.add_parser(command, add_help=False, help=f"Run {command}; other arguments go to the script.")
+    startup = commands.add_parser('startup', help='Time the startup of every command of the part.')
+    startup.add_argument('--runs', type=int, default=3, help='Runs per command; the best is reported.')
+    startup.add_argument('--limit', type=float, default=1.0, help='Seconds a light command may take to start.')
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, arguments = parser.parse_known_args(argv)
+    if args.command == 'startup' and arguments:
+        parser.error(f"unrecognized arguments: {' '.join(arguments)}")
+    if args.command == 'startup':
+        return check_startup(args.part, args.runs, args.limit)
+    if args.command not in COMMANDS[args.part]:
+        print(f"{args.command} is not available in {args.part}.")
+        return 2
+    if args.check_imports:
+        return check_imports(args.part, args.command)
+    return run_command(args.part, args.command, arguments)
+
+if __name__ == "__main__":
+    sys.exit(main())
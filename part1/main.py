@@ -1,15 +1,26 @@
+import argparse
 import pandas as pd
 import logging
-from src.database.database_utils import connect_to_database, load_config, close_connection, get_table_schema, update_table_schema
+from src.database.database_utils import pooled_connection, load_config, close_all_pools, get_table_schema, update_table_schema
+from src.database.logging_utils import configure_logging, describe_frame
+from src.database.partitions import is_partitioned, ensure_partitions, sale_months
 from cryptography.fernet import Fernet
+from psycopg2.extras import execute_values
+from src.encryption import load_or_create_key, key_file_from_config
+from src.bloom_filter import drop_loaded_transactions
+from src.compact import compact_sales_data, expand_for_load, memory_report
+from src.csv_reader import read_sales_csv
+from src.outliers import handle_group_outliers
+from src.profiling import add_profile_argument, profiling_settings, start_profiling, stop_profiling, stage
+from src.validation import validate_sales_data, quarantine_rows
+from src.vault_handoff import hand_off_to_vault
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
-# Generate a key for encryption
-key = Fernet.generate_key()
-cipher_suite = Fernet(key)
+# Encryption key, loaded by main() from the key file configured in config.yaml
+key = None
+cipher_suite = None
 
 # Function to encrypt customer_id
 def encrypt_customer_id(customer_id):
@@ -20,9 +31,9 @@ def decrypt_customer_id(encrypted_customer_id):
     return cipher_suite.decrypt(encrypted_customer_id).decode()
 
 # Function to read data from CSV file
-def read_csv_file(file_path):
+def read_csv_file(file_path, engine='c'):
     try:
-        df = pd.read_csv(file_path)
+        df = read_sales_csv(file_path, engine)
         logging.info("CSV file read successfully.")
         return df
     except Exception as e:
@@ -53,11 +64,11 @@ def transform_sales_data(sales_data):
 
         # Handle missing or inconsistent product IDs
         missing_values = [None, 'N/A', '', 'NA']
-        df['product_id'] = df['product_id'].apply(lambda x: 'Unknown' if x in missing_values else x)
+        df['product_id'] = df['product_id'].where(~df['product_id'].isin(missing_values) & df['product_id'].notna(), 'Unknown')
 
-        # Handle missing timestamps
+        # Missing or unparseable timestamps stay empty (NaT); validate_sales_data quarantines
+        # these rows instead of loading them with the current time
         df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce')
-        df['sale_date'] = df['sale_date'].fillna(pd.Timestamp.now())  # Fill missing timestamps with current time
 
         return df
     except Exception as e:
@@ -82,9 +93,15 @@ def detect_outliers(df, column):
     return outliers
 
 # Function to handle outliers
-def handle_outliers(df, column):
-    """Handle outliers in a DataFrame column."""
+def handle_outliers(df, column, outliers_config=None):
+    """Handle outliers in a DataFrame column.
+
+    With outliers.group_by configured, the bounds are per group (see src/outliers.py).
+    """
     try:
+        if (outliers_config or {}).get('group_by'):
+            return handle_group_outliers(df, column, outliers_config)
+
         # Detect outliers using detect_outliers function
         outliers = detect_outliers(df, column)
 
@@ -102,24 +119,33 @@ def handle_outliers(df, column):
         return None
 
 # Function to load data into database
-def load_data(conn, df):
+def load_data(conn, df, page_size=1000):
+    """Insert the sales rows, page_size rows per statement, in one transaction.
+
+    A transaction already in the table, e.g. from an earlier run while the
+    dedup filter was off or missing, is skipped rather than failing the load,
+    and quarantined as ALREADY_LOADED.
+    """
+    cursor = None
     try:
         # Open a cursor
         cursor = conn.cursor()
 
-        # Iterate over DataFrame rows
-        for index, row in df.iterrows():
-            # Construct SQL query to insert row into 'sales' table
-            sql_query = "INSERT INTO sales (transaction_id, customer_id, product_id, quantity, sale_date) VALUES (%s, %s, %s, %s, %s)"
-            # Extract row values
-            values = (row['transaction_id'], row['customer_id'], row['product_id'], row['quantity'], row['sale_date'])
-            # Execute SQL query
-            cursor.execute(sql_query, values)
+        # Insert the rows, leaving out the transactions the table already holds
+        rows = list(df[['transaction_id', 'customer_id', 'product_id', 'quantity', 'sale_date']].itertuples(index=False, name=None))
+        inserted = execute_values(cursor, """
+            INSERT INTO sales (transaction_id, customer_id, product_id, quantity, sale_date) VALUES %s
+            ON CONFLICT DO NOTHING
+            RETURNING transaction_id
+        """, rows, page_size=page_size, fetch=True)
 
         # Commit the transaction
         conn.commit()
-        logging.info("Data loaded into database successfully!")
-        print("Data loaded into database successfully!")
+        logging.info(f"Data loaded into database successfully! {len(inserted)} rows inserted.")
+        print(f"Data loaded into database successfully! {len(inserted)} rows inserted.")
+
+        skipped = df[~df['transaction_id'].isin({row[0] for row in inserted})]
+        quarantine_rows(skipped.assign(reason_code='ALREADY_LOADED', reason_detail="Transaction ID already in the sales table"))
 
     except Exception as e:
         logging.error(f"Error loading data into database: {e}")
@@ -151,52 +177,120 @@ def handle_schema_changes(df, connection):
 
 # Main function
 def main():
+    global key, cipher_suite
+    parser = argparse.ArgumentParser(description="Load the sales CSV file into the database.")
+    parser.add_argument('--target', choices=['sales', 'vault', 'both'],
+                        help="Where the cleaned sales go: the sales table, the Data Vault of part2 or both "
+                             "(default: etl.target in config.yaml, else sales).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     try:
+        # Load configuration
+        config_file = "src/database/config.yaml"
+        config = load_config(config_file)
+        etl_config = (config or {}).get('etl') or {}
+        target = args.target or etl_config.get('target', 'sales')
+
+        # Profile the stages of the run; without --profile the stages run as they are
+        if args.profile:
+            start_profiling(profiling_settings(args.profile, (config or {}).get('profiling')))
+
+        # Encrypt with the persisted key, so the exported data can be decrypted
+        key = load_or_create_key(key_file_from_config(config))
+        cipher_suite = Fernet(key)
+
         # Read data from CSV file
-        file_path = "data/mock_sales_data.csv"
-        sales_data = read_csv_file(file_path)
+        file_path = etl_config.get('input_file', 'data/mock_sales_data.csv')
+        with stage('read_csv_file'):
+            sales_data = read_csv_file(file_path, etl_config.get('csv_engine', 'c'))
 
         if sales_data is not None:
+            report_memory = etl_config.get('memory_report', False)
+            if report_memory:
+                memory_report(sales_data, 'read')
+
+            # The vault keys customers by their clear ID, which the transform encrypts
+            customer_ids = sales_data['customer_id'].fillna('Unknown') if target != 'sales' else None
+
             # Transform sales data
-            df = transform_sales_data(sales_data)
+            with stage('transform_sales_data'):
+                df = transform_sales_data(sales_data)
 
             if df is not None:
-                # Display original data
-                logging.info("\nTransformed Data:")
-                logging.info(df)
-                print("\nTransformed Data:")
-                print(df)
+                if report_memory:
+                    memory_report(df, 'transform')
 
-                # Detect and handle outliers in the 'quantity' column
-                df = handle_outliers(df, 'quantity')
+                # Describe the data; the rows themselves are only formatted at DEBUG level
+                logging.info(f"Transformed data: {describe_frame(df)}")
+                logging.debug("Transformed data:\n%s", df)
+                print(f"\nTransformed data: {describe_frame(df)}")
 
-                # Display data after handling outliers
-                logging.info("\nData after handling outliers:")
-                logging.info(df)
-                print("\nData after handling outliers:")
-                print(df)
+                # Detect and handle outliers in the 'quantity' column
+                with stage('handle_outliers'):
+                    df = handle_outliers(df, 'quantity', (config or {}).get('outliers'))
+
+                # Describe the data after handling outliers
+                logging.info(f"Data after handling outliers: {describe_frame(df)}")
+                logging.debug("Data after handling outliers:\n%s", df)
+                print(f"\nData after handling outliers: {describe_frame(df)}")
+
+                # Quarantine the rows the sales table would refuse, so the rest still loads
+                with stage('validate_sales_data'):
+                    df, rejected_df = validate_sales_data(df)
+                    quarantine_rows(rejected_df)
+
+                # Hand the cleaned rows to the Data Vault loader in this process, with no file in between
+                if target != 'sales':
+                    with stage('hand_off_to_vault'):
+                        hand_off_to_vault(df, customer_ids, (config or {}).get('vault') or {})
+                    if target == 'vault':
+                        close_all_pools()
+                        return
+
+                # Drop the transactions loaded by earlier runs before they reach the database
+                dedup_config = (config or {}).get('dedup') or {}
+                dedup_filter = None
+                if dedup_config.get('enabled'):
+                    with pooled_connection(config) as connection:
+                        df, dedup_filter = drop_loaded_transactions(connection, df, dedup_config)
+
+                # Keep the frame in its compact form until a chunk is loaded
+                if etl_config.get('compact', False):
+                    df = compact_sales_data(df)
+                    if report_memory:
+                        memory_report(df, 'compact')
 
                 # Connect to the database
-                config_file = "src/database/config.yaml"
-                config = load_config(config_file)
                 if config:
-                    connection = connect_to_database(config)
-
-                    if connection:
+                    # Check a bulk-load tuned connection out of the pool
+                    with pooled_connection(config, 'bulk_load') as connection:
                         # Handle schema changes before loading data into the database
                         handle_schema_changes(df, connection)
 
+                        # A partitioned table gets the partitions of the incoming months first
+                        cursor = connection.cursor()
+                        if is_partitioned(cursor):
+                            ensure_partitions(cursor, sale_months(df['sale_date']))
+                        cursor.close()
+
                         # Load data into the database
-                        load_data(connection, df)
+                        with stage('load_data'):
+                            load_data(connection, expand_for_load(df))
+
+                    # Persist the filter with the transactions just loaded
+                    if dedup_filter is not None:
+                        dedup_filter.save(dedup_config['filter_file'])
 
-                        # Close the database connection
-                        close_connection(connection)
-                        #logging.info("Connection to the database closed.")
-                        #print("Connection to the database closed.")
+                    # Close the pooled database connections
+                    close_all_pools()
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         print(f"An error occurred: {e}")
 
+    finally:
+        stop_profiling()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import logging
+import math
+import os
+import struct
+import time
+
+try:
+    from database.database_utils import load_config, connect_to_database, close_connection
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+# Table and column of the loaded transaction keys
+KEY_TABLE = 'sales'
+KEY_COLUMN = 'transaction_id'
+
+# File header: magic, number of bits, number of hashes, capacity, error rate, keys added
+HEADER = struct.Struct('<4sQIQdQ')
+MAGIC = b'BLM1'
+
+class BloomFilter:
+    """Set membership with a bounded false-positive rate and no false negatives.
+
+    Sized for capacity keys at error_rate; each key sets num_hashes bits derived
+    from one BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, capacity, error_rate, num_bits=None, num_hashes=None, bits=None, count=0):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = num_bits or math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = num_hashes or max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def positions(self, key):
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def is_saturated(self):
+        """Whether more keys were added than the filter was sized for."""
+        return self.count > self.capacity
+
+    def save(self, path):
+        """Write the filter to path, replacing the previous file in one step."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, self.num_bits, self.num_hashes, self.capacity, self.error_rate, self.count))
+            file.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a filter saved with save, or return None if the file is missing or invalid."""
+        try:
+            with open(path, 'rb') as file:
+                magic, num_bits, num_hashes, capacity, error_rate, count = HEADER.unpack(file.read(HEADER.size))
+                bits = bytearray(file.read())
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or len(bits) != (num_bits + 7) // 8:
+            return None
+        return cls(capacity, error_rate, num_bits, num_hashes, bits, count)
+
+def rebuild_filter(conn, capacity, error_rate, table=KEY_TABLE, column=KEY_COLUMN):
+    """Build a filter from every key in the table, streamed through a server-side cursor."""
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT count(*) FROM {table}")
+    row_count = cursor.fetchone()[0]
+    cursor.close()
+
+    # Leave room for the loads to come
+    bloom = BloomFilter(max(capacity, 2 * row_count), error_rate)
+    cursor = conn.cursor(name='bloom_filter_rebuild')
+    cursor.itersize = 50000
+    cursor.execute(f"SELECT {column} FROM {table}")
+    for (key,) in cursor:
+        bloom.add(key)
+    cursor.close()
+    conn.commit()
+
+    logging.info(f"Rebuilt the {table}.{column} filter from {bloom.count} keys in {time.perf_counter() - start:.2f}s.")
+    print(f"Rebuilt the {table}.{column} filter from {bloom.count} keys in {time.perf_counter() - start:.2f}s.")
+    return bloom
+
+def load_or_rebuild_filter(conn, dedup_config, table=KEY_TABLE, column=KEY_COLUMN):
+    """Load the persisted filter, rebuilding it when it is missing, sized differently or saturated."""
+    path = dedup_config['filter_file']
+    capacity = dedup_config.get('capacity', 1000000)
+    error_rate = dedup_config.get('error_rate', 0.001)
+
+    bloom = BloomFilter.load(path)
+    if bloom is None or bloom.error_rate != error_rate or bloom.is_saturated():
+        bloom = rebuild_filter(conn, capacity, error_rate, table, column)
+        bloom.save(path)
+    return bloom
+
+def find_new_keys(bloom, cursor, keys, table=KEY_TABLE, column=KEY_COLUMN):
+    """Return one flag per key telling whether it still has to be loaded.
+
+    Keys repeated within keys, and keys already in the table, are flagged False.
+    Only the keys the filter reports as present are checked against the table,
+    in one query; the filter has no false negatives, so the others are new.
+    """
+    seen = set()
+    maybe_loaded = set()
+    for key in keys:
+        if key not in seen:
+            seen.add(key)
+            if key in bloom:
+                maybe_loaded.add(key)
+
+    loaded = set()
+    if maybe_loaded:
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {column} = ANY(%s)", (list(maybe_loaded),))
+        loaded = {row[0] for row in cursor.fetchall()}
+        logging.info(f"Filter positives: {len(maybe_loaded)}, confirmed already loaded: {len(loaded)}.")
+
+    flags = []
+    seen = set()
+    for key in keys:
+        flags.append(key not in seen and key not in loaded)
+        seen.add(key)
+    return flags
+
+def drop_loaded_transactions(conn, df, dedup_config):
+    """Drop the rows of transactions already in the sales table, before the load.
+
+    Returns (df, bloom). The remaining transactions are added to the filter right
+    away; save it once they are loaded. Should the load fail, the filter holds
+    keys that are not in the table, which only costs an extra lookup later.
+    """
+    bloom = load_or_rebuild_filter(conn, dedup_config)
+    cursor = conn.cursor()
+    keys = df['transaction_id'].tolist()
+    flags = find_new_keys(bloom, cursor, keys)
+    cursor.close()
+
+    for key, is_new in zip(keys, flags):
+        if is_new:
+            bloom.add(key)
+
+    duplicates = len(flags) - sum(flags)
+    if duplicates:
+        logging.info(f"Dropped {duplicates} transactions already loaded into sales.")
+        print(f"Dropped {duplicates} transactions already loaded into sales.")
+    return df[flags], bloom
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the filter of loaded transaction keys from the database.")
+    parser.add_argument('action', choices=['rebuild'])
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        if not config:
+            return
+        dedup_config = config['dedup']
+        connection = connect_to_database(config)
+        if connection:
+            bloom = rebuild_filter(connection, dedup_config.get('capacity', 1000000), dedup_config.get('error_rate', 0.001))
+            bloom.save(dedup_config['filter_file'])
+            close_connection(connection)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import logging
+import uuid
+import pandas as pd
+
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
+# pyarrow is optional: without it the ID columns keep their original representation
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Configure logging
+configure_logging('etl.log')
+
+def memory_report(df, stage):
+    """Log the memory held by a DataFrame, in total and per row."""
+    total_bytes = int(df.memory_usage(deep=True).sum())
+    per_row = total_bytes / len(df) if len(df) else 0
+    logging.info(f"Memory after {stage}: {total_bytes / 1e6:.2f} MB for {len(df)} rows ({per_row:.0f} bytes/row).")
+    print(f"Memory after {stage}: {total_bytes / 1e6:.2f} MB for {len(df)} rows ({per_row:.0f} bytes/row).")
+    return total_bytes
+
+def pack_uuids(values):
+    """Return the 16-byte form of canonical UUID strings, or None if any value is not one."""
+    packed = []
+    for value in values:
+        try:
+            parsed = uuid.UUID(value)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        # Only canonical strings survive the round trip unchanged
+        if str(parsed) != value:
+            return None
+        packed.append(parsed.bytes)
+    return packed
+
+def compact_sales_data(df):
+    """Convert transformed sales data to a compact representation.
+
+    - transaction_id: 16-byte UUIDs in one fixed-width Arrow buffer
+    - customer_id: the Fernet ciphertexts in one contiguous Arrow buffer
+    - product_id: categorical, as few distinct combinations repeat
+    - quantity: the smallest integer type holding the values
+
+    Use expand_for_load to get the values the sales table expects back.
+    """
+    df = df.copy()
+
+    if pa is not None:
+        packed = pack_uuids(df['transaction_id'].tolist())
+        if packed is not None:
+            df['transaction_id'] = pd.Series(pa.array(packed, type=pa.binary(16)), index=df.index,
+                                             dtype=pd.ArrowDtype(pa.binary(16)))
+        else:
+            logging.info("transaction_id holds values that are not UUIDs, keeping it as strings.")
+
+        df['customer_id'] = pd.Series(pa.array(df['customer_id'].tolist(), type=pa.binary()), index=df.index,
+                                      dtype=pd.ArrowDtype(pa.binary()))
+
+    df['product_id'] = df['product_id'].astype('category')
+
+    # Outlier handling may leave a fractional median; such a column is only narrowed to float32
+    quantity = df['quantity']
+    if quantity.notna().all() and (quantity == quantity.round()).all():
+        df['quantity'] = pd.to_numeric(quantity, downcast='integer')
+    else:
+        df['quantity'] = pd.to_numeric(quantity, downcast='float')
+
+    return df
+
+def expand_for_load(df):
+    """Turn compacted columns back into the Python values the database driver expects.
+
+    Meant for one chunk at a time, right before it is loaded.
+    """
+    df = df.copy()
+    if pa is not None and df['transaction_id'].dtype == pd.ArrowDtype(pa.binary(16)):
+        df['transaction_id'] = [str(uuid.UUID(bytes=value)) for value in df['transaction_id'].tolist()]
+
+    # psycopg2 cannot adapt numpy's small integer and float32 scalars, so hand over Python numbers
+    if df['quantity'].dtype != 'float64':
+        df['quantity'] = df['quantity'].astype(object)
+    return df
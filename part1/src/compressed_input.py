@@ -0,0 +1,121 @@
+import gzip
+import io
+import os
+import queue
+import threading
+
+# zstandard is optional: it is needed to read .zst files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression of an input file by its suffix; other files are read as they are
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+# Decompressed bytes per block handed from the decompression thread to the reader,
+# and blocks decompressed ahead of the reader
+BLOCK_BYTES = 1024 * 1024
+BLOCKS_AHEAD = 8
+
+def compression_of(path):
+    """'gzip', 'zstd' or None, by the suffix of path."""
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+def open_decompressor(path, compression):
+    """A binary file object of the decompressed content of path."""
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if zstandard is None:
+        raise RuntimeError(f"Reading {path} needs zstandard (pip install zstandard).")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+class BackgroundDecompressor(io.RawIOBase):
+    """Stream of the decompressed content of a file, decompressed on a background thread.
+
+    The thread keeps up to blocks_ahead blocks decompressed ahead of the
+    reader, so decompression overlaps the parsing of the blocks before; zlib
+    and zstd release the GIL while they work. An error of the thread is
+    raised to the reader.
+    """
+
+    def __init__(self, path, compression, block_bytes=BLOCK_BYTES, blocks_ahead=BLOCKS_AHEAD):
+        super().__init__()
+        self.blocks = queue.Queue(maxsize=blocks_ahead)
+        self.block = memoryview(b'')
+        self.position = 0
+        self.finished = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.decompress, args=(path, compression, block_bytes), daemon=True)
+        self.thread.start()
+
+    def decompress(self, path, compression, block_bytes):
+        try:
+            with open_decompressor(path, compression) as source:
+                while not self.stopping.is_set():
+                    block = source.read(block_bytes)
+                    self.put(block)
+                    if not block:
+                        return
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        # Give up when the reader closed the stream instead of waiting for room forever
+        while not self.stopping.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.position >= len(self.block):
+            if self.finished:
+                return 0
+            item = self.blocks.get()
+            if isinstance(item, Exception):
+                self.finished = True
+                raise item
+            if not item:
+                self.finished = True
+                return 0
+            self.block, self.position = memoryview(item), 0
+        size = min(len(buffer), len(self.block) - self.position)
+        buffer[:size] = self.block[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            self.thread.join()
+        super().close()
+
+def open_input(path, offset=0):
+    """Open an input file for binary reading at a byte offset of its content.
+
+    .gz and .zst files are decompressed on a background thread (see
+    BackgroundDecompressor) and the offset counts decompressed bytes; as a
+    compressed stream cannot seek, the bytes before it are decompressed and
+    skipped.
+    """
+    compression = compression_of(path)
+    if compression is None:
+        file = open(path, 'rb')
+        file.seek(offset)
+        return file
+    file = io.BufferedReader(BackgroundDecompressor(path, compression), buffer_size=BLOCK_BYTES)
+    while offset > 0:
+        skipped = len(file.read(min(offset, BLOCK_BYTES)))
+        if not skipped:
+            break
+        offset -= skipped
+    return file
@@ -0,0 +1,175 @@
+import io
+import logging
+import os
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    from database.logging_utils import configure_logging
+    from compressed_input import compression_of, open_input
+except ImportError:
+    from src.database.logging_utils import configure_logging
+    from src.compressed_input import compression_of, open_input
+
+# pyarrow is optional: it provides the multithreaded parser and Arrow-backed string columns
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Configure logging
+configure_logging('etl.log')
+
+# Columns of the sales CSV file and their types; other columns are not read
+SALES_SCHEMA = {
+    'transaction_id': 'string',
+    'customer_id': 'string',
+    'product_id': 'string',
+    'quantity': 'float64',  # float, as the column has missing values
+    'timestamp': 'timestamp',
+}
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The CSV timestamp becomes the sale_date column of the sales table
+RENAMED_COLUMNS = {'timestamp': 'sale_date'}
+
+# Decompressed bytes of the blocks a compressed file is split into for the byte range pipeline
+BLOCK_BYTES = 8 * 1024 * 1024
+
+@contextmanager
+def csv_source(file_path):
+    """The path of a plain CSV file, or a stream of a .gz or .zst file decompressed on a background thread."""
+    if compression_of(file_path) is None:
+        yield file_path
+    else:
+        with open_input(file_path) as stream:
+            yield stream
+
+def read_with_pyarrow(source):
+    """Parse a file path or CSV bytes with the multithreaded Arrow CSV reader; plain files are memory-mapped.
+
+    String columns stay in Arrow memory (ArrowDtype) instead of becoming Python objects.
+    """
+    arrow_types = {'string': pa.string(), 'float64': pa.float64(), 'timestamp': pa.timestamp('s')}
+    convert_options = pa_csv.ConvertOptions(
+        column_types={column: arrow_types[kind] for column, kind in SALES_SCHEMA.items()},
+        include_columns=list(SALES_SCHEMA),
+        timestamp_parsers=[TIMESTAMP_FORMAT, pa_csv.ISO8601],
+        strings_can_be_null=True,
+    )
+    if isinstance(source, str):
+        with csv_source(source) as path_or_stream:
+            with (pa.memory_map(source, 'r') if isinstance(path_or_stream, str) else pa.PythonFile(path_or_stream, mode='r')) as stream:
+                table = pa_csv.read_csv(stream, read_options=pa_csv.ReadOptions(use_threads=True),
+                                        convert_options=convert_options)
+    else:
+        with pa.BufferReader(source) as stream:
+            table = pa_csv.read_csv(stream, read_options=pa_csv.ReadOptions(use_threads=True),
+                                    convert_options=convert_options)
+    return table.to_pandas(types_mapper=lambda arrow_type: pd.ArrowDtype(arrow_type) if pa.types.is_string(arrow_type) else None)
+
+def read_with_pandas(source):
+    """Parse a file path or CSV bytes with the pandas C engine; plain files are memory-mapped."""
+    dtypes = {column: str for column, kind in SALES_SCHEMA.items() if kind == 'string'}
+    dtypes.update({column: kind for column, kind in SALES_SCHEMA.items() if kind == 'float64'})
+    if isinstance(source, str):
+        with csv_source(source) as path_or_stream:
+            df = pd.read_csv(path_or_stream, usecols=list(SALES_SCHEMA), dtype=dtypes, memory_map=isinstance(path_or_stream, str))
+    else:
+        df = pd.read_csv(io.BytesIO(source), usecols=list(SALES_SCHEMA), dtype=dtypes)
+
+    # Parse the timestamps in one pass with a known format; unparseable values become NaT
+    for column in [column for column, kind in SALES_SCHEMA.items() if kind == 'timestamp']:
+        df[column] = pd.to_datetime(df[column], format=TIMESTAMP_FORMAT, errors='coerce')
+    return df
+
+def sales_columns():
+    """Columns of the DataFrames returned by read_sales_csv."""
+    return [RENAMED_COLUMNS.get(column, column) for column in SALES_SCHEMA]
+
+def parse_sales_csv(source, engine):
+    """Parse a file path or CSV bytes with the given engine; returns (df, engine used)."""
+    if engine == 'pyarrow' and pa is None:
+        logging.warning("pyarrow is not installed, reading the CSV file with the C engine.")
+        engine = 'c'
+
+    if engine == 'pyarrow':
+        try:
+            return read_with_pyarrow(source), engine
+        except pa.ArrowInvalid as e:
+            logging.warning(f"pyarrow could not parse the CSV data ({e}), reading it with the C engine.")
+    return read_with_pandas(source), 'c'
+
+def read_sales_csv(file_path, engine='c'):
+    """Read the sales CSV file with an explicit schema.
+
+    engine is 'c' (pandas) or 'pyarrow'. The pyarrow engine falls back to the C
+    engine when pyarrow is not installed or a value does not fit the schema.
+    .gz and .zst files are decompressed on a background thread while they are parsed.
+    Returns the DataFrame with the timestamp column renamed to sale_date.
+    """
+    start = time.perf_counter()
+    df, engine = parse_sales_csv(file_path, engine)
+    df = df.rename(columns=RENAMED_COLUMNS)
+
+    # Report the parsing throughput
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(file_path) / 1e6
+    logging.info(f"Read {len(df)} rows ({size_mb:.1f} MB) from {file_path} with the {engine} engine "
+                 f"in {elapsed:.2f}s ({size_mb / max(elapsed, 1e-9):.1f} MB/s).")
+    return df
+
+def split_byte_ranges(file_path, num_ranges):
+    """Split the rows of a CSV file into about num_ranges (start, end) byte ranges.
+
+    The ranges start behind the header and end on line boundaries. A quoted
+    field spanning lines could be cut; the sales file has none.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        header_end = len(file.readline())
+        bounds = [header_end]
+        for index in range(1, num_ranges):
+            file.seek(header_end + (size - header_end) * index // num_ranges)
+            file.readline()  # move on to the start of the next line
+            bounds.append(max(file.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def read_sales_blocks(file_path, block_bytes=BLOCK_BYTES):
+    """Yield blocks of about block_bytes of the rows of a compressed CSV file, each ending on a line boundary.
+
+    The counterpart of split_byte_ranges for files that cannot be read at an
+    offset: the file is decompressed once, as a stream, and every block is
+    CSV data of its own, with the header line in front.
+    """
+    with open_input(file_path) as file:
+        header = file.readline()
+        pending = b''
+        while True:
+            data = file.read(block_bytes)
+            if not data:
+                if pending:
+                    yield header + pending
+                return
+            pending += data
+            end = pending.rfind(b'\n') + 1
+            if end:
+                yield header + pending[:end]
+                pending = pending[end:]
+
+def read_sales_csv_block(data, engine='c'):
+    """Read the rows of a block of read_sales_blocks, see read_sales_csv."""
+    df, _ = parse_sales_csv(data, engine)
+    return df.rename(columns=RENAMED_COLUMNS)
+
+def read_sales_csv_range(file_path, start, end, engine='c'):
+    """Read the rows within a byte range of the sales CSV file, see split_byte_ranges and read_sales_csv."""
+    with open(file_path, 'rb') as file:
+        header = file.readline()
+        file.seek(start)
+        data = file.read(end - start)
+    df, _ = parse_sales_csv(header + data, engine)
+    return df.rename(columns=RENAMED_COLUMNS)
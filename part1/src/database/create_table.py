@@ -1,12 +1,17 @@
 import logging
 import database_utils as db_utils
+from logging_utils import configure_logging
+from partitions import create_partitioned_table
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
-def create_table(conn):
-    """Create the 'sales' table in the PostgreSQL database."""
+def create_table(conn, partitioned=False):
+    """Create the 'sales' table in the PostgreSQL database.
+
+    With partitioned, the table is range-partitioned by month of sale_date
+    and the loaders create the monthly partitions, see partitions.py.
+    """
     try:
         # Create a cursor
         cursor = conn.cursor()
@@ -18,6 +23,12 @@ def create_table(conn):
         if table_exists:
             logging.info("Table 'sales' already exists.")
             print("Table 'sales' already exists.")
+        elif partitioned:
+            create_partitioned_table(cursor)
+            conn.commit()
+
+            logging.info("Table 'sales' created successfully, partitioned by month of sale_date!")
+            print("Table 'sales' created successfully, partitioned by month of sale_date!")
         else:
             # Define the create table query
             create_table_query = '''
@@ -58,7 +69,7 @@ def main():
             connection = db_utils.connect_to_database(config)
             if connection:
                 # Create the 'sales' table
-                create_table(connection)
+                create_table(connection, (config.get('partitioning') or {}).get('enabled', False))
 
                 # Close the database connection
                 db_utils.close_connection(connection)
@@ -1,10 +1,17 @@
+import os
 import yaml
 import psycopg2
 import logging
+from contextlib import contextmanager
+from psycopg2 import pool
+
+try:
+    from logging_utils import configure_logging
+except ImportError:
+    from .logging_utils import configure_logging
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
 def load_config(file_path):
     """Load configuration from a YAML file."""
@@ -45,6 +52,117 @@ def connect_to_database(config):
         print(f"Error connecting to the database: {e}")
         return None
 
+# Session settings applied to a pooled connection for each kind of workload.
+# Entries under 'session_profiles' in config.yaml override these per setting.
+SESSION_PROFILES = {
+    'bulk_load': {
+        'synchronous_commit': 'off',
+        'work_mem': '64MB',
+        'maintenance_work_mem': '512MB',
+        'statement_timeout': '30min',
+        'lock_timeout': '1min',
+    },
+    'reporting': {
+        'work_mem': '128MB',
+        'statement_timeout': '5min',
+        'default_transaction_read_only': 'on',
+    },
+}
+
+# Connection pools of this process, keyed by connection settings
+_pools = {}
+_pools_pid = None
+
+def get_connection_pool(config):
+    """Return the process-local connection pool for the configured database.
+
+    Pools are never shared across processes: a forked worker starts with an
+    empty set of pools instead of reusing the parent's sockets.
+    """
+    global _pools, _pools_pid
+    if _pools_pid != os.getpid():
+        _pools = {}
+        _pools_pid = os.getpid()
+
+    db_config = config['database']
+    key = (db_config['host'], db_config['port'], db_config['dbname'], db_config['user'])
+    if key not in _pools:
+        pool_config = config.get('pool') or {}
+        _pools[key] = pool.ThreadedConnectionPool(
+            pool_config.get('minconn', 1),
+            pool_config.get('maxconn', 10),
+            host=db_config['host'],
+            port=db_config['port'],
+            dbname=db_config['dbname'],
+            user=db_config['user'],
+            password=db_config['password']
+        )
+    return _pools[key]
+
+def apply_session_profile(conn, config, profile):
+    """Apply a named session profile to a connection."""
+    if not profile:
+        return
+    if profile not in SESSION_PROFILES:
+        raise ValueError(f"Unknown session profile: {profile}")
+
+    settings = dict(SESSION_PROFILES[profile])
+    settings.update((config.get('session_profiles') or {}).get(profile) or {})
+
+    cursor = conn.cursor()
+    for name, value in settings.items():
+        cursor.execute("SELECT set_config(%s, %s, false)", (name, str(value)))
+    cursor.close()
+
+    # SET is transactional: commit so a rollback by the caller cannot undo the profile
+    conn.commit()
+
+@contextmanager
+def pooled_connection(config, profile=None):
+    """Check a connection out of the pool for the duration of a with block.
+
+    The transaction is committed when the block succeeds and rolled back when it
+    raises. Either way the session settings are reset and the connection goes
+    back to the pool (or is discarded if it broke).
+    """
+    connection_pool = get_connection_pool(config)
+    conn = connection_pool.getconn()
+    try:
+        apply_session_profile(conn, config, profile)
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if not conn.closed:
+            try:
+                conn.autocommit = False
+                cursor = conn.cursor()
+                cursor.execute("RESET ALL;")
+                cursor.close()
+                conn.commit()
+            except psycopg2.Error as e:
+                logging.error(f"Error resetting pooled connection: {e}")
+        connection_pool.putconn(conn, close=bool(conn.closed))
+
+@contextmanager
+def pooled_cursor(config, profile=None):
+    """Yield a cursor on a pooled connection; see pooled_connection."""
+    with pooled_connection(config, profile) as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+def close_all_pools():
+    """Close every connection of this process's pools."""
+    for connection_pool in _pools.values():
+        connection_pool.closeall()
+    _pools.clear()
+
 def close_connection(conn, cursor=None):
     try:
         if cursor:
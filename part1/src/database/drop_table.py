@@ -1,9 +1,9 @@
 import database_utils as db_utils
+from logging_utils import configure_logging
 import logging
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
 def delete_table(conn):
     """Delete the 'sales' table from the PostgreSQL database."""
@@ -0,0 +1,103 @@
+import atexit
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class BackgroundLogHandler(QueueHandler):
+    """Hand log records to a writer thread, so the caller never waits on the log file.
+
+    A forked worker process has no writer thread of its own and writes its
+    records directly.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+
+    def emit(self, record):
+        if os.getpid() != self.pid:
+            self.target.handle(record)
+        else:
+            super().emit(record)
+
+    def close(self):
+        # Write out the queued records before the file is closed
+        if os.getpid() == self.pid and self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+def configure_logging(filename, level=None):
+    """Log to filename through a background writer thread.
+
+    Replaces logging.basicConfig and, like it, does nothing once the root
+    logger has a handler. The level is level, the LOG_LEVEL environment
+    variable or INFO.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    level = level or os.environ.get('LOG_LEVEL', 'INFO').upper()
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = BackgroundLogHandler(file_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+    atexit.register(handler.close)
+
+class RateLimitedLog:
+    """Log and print a repeated message at most limit times per interval seconds.
+
+    Messages are grouped by a key; the ones over the limit are only counted
+    and summary() logs how many were left out, with the totals of the counts
+    they carried. Meant for messages logged per row or per batch, which would
+    otherwise dominate the runtime of a large load.
+    """
+
+    def __init__(self, limit=5, interval=30.0, echo=True):
+        self.limit = limit
+        self.interval = interval
+        self.echo = echo
+        self.windows = {}
+        self.suppressed = {}
+        self.suppressed_counts = {}
+
+    def log(self, key, message, level=logging.INFO, counts=None):
+        """Log message under key; counts, e.g. {reason: rows}, are added up for summary() when it is left out."""
+        now = time.monotonic()
+        window_start, logged = self.windows.get(key, (now, 0))
+        if now - window_start >= self.interval:
+            window_start, logged = now, 0
+        if logged >= self.limit:
+            self.windows[key] = (window_start, logged)
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            totals = self.suppressed_counts.setdefault(key, {})
+            for name, count in (counts or {}).items():
+                totals[name] = totals.get(name, 0) + count
+            return
+        self.windows[key] = (window_start, logged + 1)
+        logging.log(level, message)
+        if self.echo:
+            print(message)
+
+    def summary(self):
+        """Log the number of messages left out per key since the last summary, with the totals of their counts."""
+        for key, count in self.suppressed.items():
+            totals = self.suppressed_counts.get(key)
+            message = f"{count} more '{key}' messages were not logged" + (f", totalling {totals}." if totals else ".")
+            logging.info(message)
+            if self.echo:
+                print(message)
+        self.windows.clear()
+        self.suppressed.clear()
+        self.suppressed_counts.clear()
+
+def describe_frame(df):
+    """Short description of a DataFrame for the log, which costs the same for any number of rows."""
+    return f"{len(df)} rows, columns: {', '.join(str(column) for column in df.columns)}"
@@ -0,0 +1,160 @@
+import argparse
+import logging
+import re
+from datetime import date
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection
+    from logging_utils import configure_logging
+except ImportError:
+    from .database_utils import load_config, connect_to_database, close_connection
+    from .logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+# Bounds of a partition as PostgreSQL prints them, e.g. FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')
+PARTITION_BOUNDS = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+def create_partitioned_table(cursor):
+    """Create 'sales' range-partitioned by sale_date, without partitions.
+
+    The primary key of a partitioned table must hold the partition key, so a
+    transaction ID is only unique per sale_date: the same ID with another date
+    loads as a second row, which ON CONFLICT DO NOTHING does not catch. Rows
+    without a date never reach the table, validation quarantines them. See
+    find_duplicate_transactions.
+    """
+    cursor.execute('''
+        CREATE TABLE sales (
+            transaction_id VARCHAR(50),
+            customer_id VARCHAR(500),
+            product_id VARCHAR(50),
+            quantity INTEGER,
+            sale_date DATE NOT NULL,
+            PRIMARY KEY (transaction_id, sale_date)
+        ) PARTITION BY RANGE (sale_date);
+    ''')
+
+def is_partitioned(cursor):
+    """Whether the 'sales' table is partitioned."""
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('sales'));")
+    return cursor.fetchone()[0]
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month):
+    """Name of the partition of the month starting on month, e.g. sales_y2024m03."""
+    return f"sales_y{month.year}m{month.month:02d}"
+
+def sale_months(sale_dates):
+    """First days of the months of a Series of sale dates."""
+    return sorted(date(period.year, period.month, 1) for period in sale_dates.dt.to_period('M').unique())
+
+def split_by_partition(df):
+    """Return [(partition name, rows)] of a DataFrame of sales, one entry per month of sale_date."""
+    months = df['sale_date'].dt.to_period('M')
+    return [(partition_name(date(period.year, period.month, 1)), rows) for period, rows in df.groupby(months, sort=True)]
+
+def list_partitions(cursor):
+    """Return [(name, first_day, day_after)] of the monthly partitions of 'sales', oldest first."""
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('sales')
+    """)
+    partitions = []
+    for name, bounds in cursor.fetchall():
+        match = PARTITION_BOUNDS.search(bounds or '')
+        if match:
+            partitions.append((name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def ensure_partitions(cursor, months):
+    """Create the partitions missing for months; returns the names of the partitions created.
+
+    Loaders running at the same time may need the same month, so the
+    partitions are created under an advisory lock. The caller commits.
+    """
+    missing = set(months) - {first_day for _, first_day, _ in list_partitions(cursor)}
+    if not missing:
+        return []
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('sales_partitions'));")
+    existing = {first_day for _, first_day, _ in list_partitions(cursor)}
+    created = []
+    for month in sorted(missing - existing):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF sales FOR VALUES FROM (%s) TO (%s);",
+                       (month, next_month(month)))
+        created.append(partition_name(month))
+    if created:
+        logging.info(f"Created the sales partitions {', '.join(created)}.")
+        print(f"Created the sales partitions {', '.join(created)}.")
+    return created
+
+def drop_partitions_before(cursor, month):
+    """Drop the partitions holding only sales before month; returns their names.
+
+    Dropping a partition removes a month of sales at once, without deleting rows
+    or leaving dead tuples to vacuum. The caller commits.
+    """
+    dropped = []
+    for name, _, day_after in list_partitions(cursor):
+        if day_after <= month:
+            cursor.execute(f"DROP TABLE {name};")
+            dropped.append(name)
+    return dropped
+
+def find_duplicate_transactions(cursor, limit=100):
+    """Return [(transaction_id, sale_dates)] of up to limit transaction IDs loaded with more than one sale_date."""
+    cursor.execute("""
+        SELECT transaction_id, array_agg(sale_date ORDER BY sale_date)
+        FROM sales
+        GROUP BY transaction_id
+        HAVING COUNT(*) > 1
+        ORDER BY transaction_id
+        LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="List the monthly partitions of the sales table, drop old ones, "
+                                                 "or list the transaction IDs loaded with several sale dates.")
+    parser.add_argument('action', choices=['list', 'drop', 'duplicates'])
+    parser.add_argument('--before', help='With drop, the first month to keep, as YYYY-MM.')
+    args = parser.parse_args()
+    if args.action == 'drop' and not args.before:
+        parser.error("drop needs --before")
+
+    try:
+        config = load_config("src/database/config.yaml")
+        if not config:
+            return
+        connection = connect_to_database(config)
+        if not connection:
+            return
+        cursor = connection.cursor()
+        if not is_partitioned(cursor):
+            print("Table 'sales' is not partitioned.")
+        elif args.action == 'list':
+            for name, first_day, day_after in list_partitions(cursor):
+                print(f"{name}: {first_day} to {day_after}")
+        elif args.action == 'duplicates':
+            duplicates = find_duplicate_transactions(cursor)
+            for transaction_id, sale_dates in duplicates:
+                print(f"{transaction_id}: {', '.join(str(sale_date) for sale_date in sale_dates)}")
+            print(f"{len(duplicates)} transaction IDs loaded with more than one sale date (at most 100 listed).")
+        else:
+            dropped = drop_partitions_before(cursor, date.fromisoformat(f"{args.before}-01"))
+            connection.commit()
+            logging.info(f"Dropped {len(dropped)} sales partitions before {args.before}: {', '.join(dropped) or '-'}")
+            print(f"Dropped {len(dropped)} sales partitions before {args.before}: {', '.join(dropped) or '-'}")
+        close_connection(connection, cursor)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
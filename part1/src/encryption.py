@@ -0,0 +1,51 @@
+import logging
+import os
+from cryptography.fernet import Fernet
+
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+# Default location of the key, see encryption.key_file in config.yaml
+DEFAULT_KEY_FILE = "data/encryption.key"
+
+def load_or_create_key(key_file=DEFAULT_KEY_FILE):
+    """Return the Fernet key stored in key_file, creating the file on first use.
+
+    The key has to outlive the run that encrypted the data, or the exported
+    customer IDs cannot be decrypted. The file is readable by its owner only.
+    """
+    if os.path.exists(key_file):
+        with open(key_file, 'rb') as file:
+            return file.read().strip()
+
+    key = Fernet.generate_key()
+    directory = os.path.dirname(key_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_descriptor = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(file_descriptor, 'wb') as file:
+        file.write(key)
+    logging.info(f"New encryption key written to {key_file}.")
+    print(f"New encryption key written to {key_file}.")
+    return key
+
+def key_file_from_config(config):
+    """Path of the key file configured under encryption.key_file."""
+    return ((config or {}).get('encryption') or {}).get('key_file', DEFAULT_KEY_FILE)
+
+def ciphertext_bytes(value):
+    """Return the Fernet token of a customer_id as stored in the sales table.
+
+    Loads pass the token as bytes, which the VARCHAR column keeps in the
+    '\\x<hex>' text form.
+    """
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value)
+    if value.startswith('\\x'):
+        return bytes.fromhex(value[2:])
+    return value.encode()
@@ -0,0 +1,183 @@
+import argparse
+import csv
+import logging
+import os
+import time
+from collections import deque
+from datetime import date
+from multiprocessing import Pool, cpu_count
+from cryptography.fernet import Fernet, InvalidToken
+
+try:
+    from database.database_utils import load_config, pooled_connection, close_all_pools
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.database_utils import load_config, pooled_connection, close_all_pools
+    from src.database.logging_utils import configure_logging
+try:
+    from encryption import load_or_create_key, key_file_from_config, ciphertext_bytes
+except ImportError:
+    from src.encryption import load_or_create_key, key_file_from_config, ciphertext_bytes
+
+# pyarrow is optional: it is needed for Parquet output only
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Configure logging
+configure_logging('etl.log')
+
+EXPORT_COLUMNS = ['transaction_id', 'customer_id', 'product_id', 'quantity', 'sale_date']
+
+def stream_sales(conn, start_date=None, end_date=None, batch_size=10000):
+    """Yield the sales rows in batches of batch_size through a server-side cursor.
+
+    Only one batch is held client-side at a time. The date range
+    [start_date, end_date) is filtered by the database.
+    """
+    conditions, params = [], []
+    if start_date:
+        conditions.append("sale_date >= %s")
+        params.append(start_date)
+    if end_date:
+        conditions.append("sale_date < %s")
+        params.append(end_date)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor = conn.cursor(name='sales_export')
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM sales{where} ORDER BY sale_date, transaction_id", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+# Cipher of a decryption worker, set by init_decryption_worker
+worker_cipher = None
+
+def init_decryption_worker(encryption_key):
+    """Pool initializer: hand the encryption key to a worker process."""
+    global worker_cipher
+    worker_cipher = Fernet(encryption_key)
+
+def decrypt_batch(rows):
+    """Decrypt the customer_id of a batch of rows; returns (rows, undecryptable count).
+
+    A customer_id that does not decrypt with the key, e.g. one loaded before the
+    key was persisted, is exported empty.
+    """
+    decrypted, failures = [], 0
+    for transaction_id, customer_id, product_id, quantity, sale_date in rows:
+        try:
+            customer_id = worker_cipher.decrypt(ciphertext_bytes(customer_id)).decode()
+        except (InvalidToken, ValueError, AttributeError):
+            customer_id = None
+            failures += 1
+        decrypted.append((transaction_id, customer_id, product_id, quantity, sale_date))
+    return decrypted, failures
+
+class CsvSink:
+    """Append batches of rows to a CSV file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetSink:
+    """Append batches of rows to a Parquet file, one row group per batch."""
+
+    def __init__(self, path):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+        self.schema = pa.schema([('transaction_id', pa.string()), ('customer_id', pa.string()),
+                                 ('product_id', pa.string()), ('quantity', pa.int32()), ('sale_date', pa.date32())])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                      for column, field in zip(columns, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def export_sales(config, output_path, output_format='csv', start_date=None, end_date=None, batch_size=10000, workers=None):
+    """Export the sales table with decrypted customer IDs to CSV or Parquet.
+
+    Batches stream from the database, are decrypted on a process pool and
+    written in order as they come back. At most two batches per worker are in
+    flight, so memory stays flat however large the table is.
+    """
+    start = time.perf_counter()
+    key_file = key_file_from_config(config)
+    if not os.path.exists(key_file):
+        raise FileNotFoundError(f"Encryption key {key_file} not found; the data cannot be decrypted without it.")
+    key = load_or_create_key(key_file)
+    workers = workers or cpu_count()
+    sink = ParquetSink(output_path) if output_format == 'parquet' else CsvSink(output_path)
+    exported, failures = 0, 0
+
+    try:
+        with Pool(processes=workers, initializer=init_decryption_worker, initargs=(key,)) as pool, \
+                pooled_connection(config, 'reporting') as connection:
+            pending = deque()
+            for rows in stream_sales(connection, start_date, end_date, batch_size):
+                pending.append(pool.apply_async(decrypt_batch, (rows,)))
+
+                # Write the oldest batch once enough are in flight, keeping the table order
+                if len(pending) >= 2 * workers:
+                    decrypted, batch_failures = pending.popleft().get()
+                    sink.write(decrypted)
+                    exported += len(decrypted)
+                    failures += batch_failures
+
+            while pending:
+                decrypted, batch_failures = pending.popleft().get()
+                sink.write(decrypted)
+                exported += len(decrypted)
+                failures += batch_failures
+    finally:
+        sink.close()
+
+    if failures:
+        logging.warning(f"{failures} customer IDs could not be decrypted with the configured key.")
+        print(f"{failures} customer IDs could not be decrypted with the configured key.")
+    logging.info(f"Exported {exported} rows to {output_path} in {time.perf_counter() - start:.2f}s.")
+    print(f"Exported {exported} rows to {output_path} in {time.perf_counter() - start:.2f}s.")
+    return exported
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the sales table with decrypted customer IDs.")
+    parser.add_argument('output', help='Output file; .parquet exports Parquet, anything else CSV.')
+    parser.add_argument('--start-date', type=date.fromisoformat, help='First sale date to export (inclusive).')
+    parser.add_argument('--end-date', type=date.fromisoformat, help='Sale date to stop at (exclusive).')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Rows per fetched and decrypted batch.')
+    parser.add_argument('--workers', type=int, help='Decryption processes (default: one per core).')
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        if config:
+            output_format = 'parquet' if args.output.endswith('.parquet') else 'csv'
+            export_sales(config, args.output, output_format, args.start_date, args.end_date, args.batch_size, args.workers)
+            close_all_pools()
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
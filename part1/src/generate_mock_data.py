@@ -4,12 +4,16 @@ import random
 import datetime
 import logging
 
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
 # Initialize Faker generator
 fake = Faker()
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
 # Define a list of product categories, brands, and types
 product_categories = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys', 'Sports & Outdoors']
@@ -88,15 +92,19 @@ def write_to_csv(data, filename):
         logging.error(f"Error writing data to CSV file: {e}")
         print(f"Error writing data to CSV file: {e}")
 
-try:
-    # Generate mock data
-    num_records = 1000
-    sales_data = generate_sales_data(num_records)
+def main():
+    try:
+        # Generate mock data
+        num_records = 1000
+        sales_data = generate_sales_data(num_records)
+
+        # Write mock data to CSV file
+        csv_filename = 'data/mock_sales_data.csv'
+        write_to_csv(sales_data, csv_filename)
 
-    # Write mock data to CSV file
-    csv_filename = 'data/mock_sales_data.csv'
-    write_to_csv(sales_data, csv_filename)
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
 
-except Exception as e:
-    logging.error(f"An error occurred: {e}")
-    print(f"An error occurred: {e}")
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
+import argparse
 import pandas as pd
 import logging
-from functools import partial
-from database.database_utils import connect_to_database, load_config, close_connection, get_table_schema, update_table_schema
+import os
+import threading
+import time
+from database.database_utils import pooled_connection, load_config, close_all_pools, get_table_schema, update_table_schema
+from database.logging_utils import configure_logging, describe_frame
+from database.partitions import is_partitioned, ensure_partitions, sale_months, split_by_partition
 from cryptography.fernet import Fernet
-from multiprocessing import Pool, cpu_count
+from encryption import load_or_create_key, key_file_from_config
+from bloom_filter import drop_loaded_transactions
+from compact import compact_sales_data, expand_for_load, memory_report
+from outliers import handle_group_outliers, group_keys, resolve_bounds, apply_bounds
+from csv_reader import (read_sales_csv, read_sales_csv_range, read_sales_csv_block, read_sales_blocks, sales_columns,
+                        split_byte_ranges, csv_source)
+from compressed_input import compression_of
+from validation import validate_sales_data, quarantine_rows
+from multiprocessing import Pool
+from scheduler import ChunkSizeTuner, connection_budget, worker_count, schedule_chunks, iter_bounded
+from profiling import add_profile_argument, profiling_settings, start_profiling, stop_profiling, start_worker_profiling, stage
 
 # Configure logging
-logging.basicConfig(filename='etl.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('etl.log')
 
-# Generate a key for encryption
-key = Fernet.generate_key()
-cipher_suite = Fernet(key)
+# Encryption key, loaded by main() from the key file configured in config.yaml
+key = None
+cipher_suite = None
 
 # Function to encrypt customer_id
 def encrypt_customer_id(customer_id):
@@ -22,9 +36,9 @@ def decrypt_customer_id(encrypted_customer_id):
     return cipher_suite.decrypt(encrypted_customer_id).decode()
 
 # Function to read data from CSV file
-def read_csv_file(file_path):
+def read_csv_file(file_path, engine='c'):
     try:
-        df = pd.read_csv(file_path)
+        df = read_sales_csv(file_path, engine)
         logging.info("CSV file read successfully.")
         return df
     except Exception as e:
@@ -55,11 +69,11 @@ def transform_sales_data(sales_data):
 
         # Handle missing or inconsistent product IDs
         missing_values = [None, 'N/A', '', 'NA']
-        df['product_id'] = df['product_id'].apply(lambda x: 'Unknown' if x in missing_values else x)
+        df['product_id'] = df['product_id'].where(~df['product_id'].isin(missing_values) & df['product_id'].notna(), 'Unknown')
 
-        # Handle missing timestamps
+        # Missing or unparseable timestamps stay empty (NaT); validate_sales_data quarantines
+        # these rows instead of loading them with the current time
         df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce')
-        df['sale_date'] = df['sale_date'].fillna(pd.Timestamp.now())  # Fill missing timestamps with current time
 
         return df
     except Exception as e:
@@ -67,16 +81,20 @@ def transform_sales_data(sales_data):
         print(f"Error transforming sales data: {e}")
         return None
 
-# Function to detect outliers
-def detect_outliers(df, column):
-    """Detect outliers in a DataFrame column."""
-    Q1 = df[column].quantile(0.25)  # 1st quartile
-    Q3 = df[column].quantile(0.75)  # 3rd quartile
+# Function to compute outlier boundaries
+def outlier_bounds(series):
+    """Return the (lower_bound, upper_bound, median) of a numeric Series."""
+    Q1 = series.quantile(0.25)  # 1st quartile
+    Q3 = series.quantile(0.75)  # 3rd quartile
     IQR = Q3 - Q1  # Interquartile range
 
     # Define outlier boundaries
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR, series.median()
+
+# Function to detect outliers
+def detect_outliers(df, column, bounds=None):
+    """Detect outliers in a DataFrame column, using bounds from outlier_bounds if given."""
+    lower_bound, upper_bound, _ = bounds or outlier_bounds(df[column])
 
     # Identify outliers
     outliers = df[(df[column] < lower_bound) | (df[column] > upper_bound)]
@@ -84,17 +102,27 @@ def detect_outliers(df, column):
     return outliers
 
 # Function to handle outliers
-def handle_outliers(df, column):
-    """Handle outliers in a DataFrame column."""
+def handle_outliers(df, column, bounds=None, outliers_config=None):
+    """Handle outliers in a DataFrame column.
+
+    bounds come from outlier_bounds, or are a per-group bounds table when
+    outliers.group_by is configured (see outliers.py); by default they are
+    computed on df itself.
+    """
     try:
-        # Detect outliers using detect_outliers function
-        outliers = detect_outliers(df, column)
+        group_by = (outliers_config or {}).get('group_by')
+        if group_by and bounds is not None:
+            return apply_bounds(df, column, group_keys(df, group_by), bounds)
+        if group_by:
+            return handle_group_outliers(df, column, outliers_config)
+
+        bounds = bounds or outlier_bounds(df[column])
 
-        # Calculate median value of the column
-        median_value = df[column].median()
+        # Detect outliers using detect_outliers function
+        outliers = detect_outliers(df, column, bounds)
 
         # Replace outliers with median value
-        df.loc[outliers.index, column] = median_value
+        df.loc[outliers.index, column] = bounds[2]
 
         return df
 
@@ -103,42 +131,213 @@ def handle_outliers(df, column):
         print(f"Error handling outliers: {e}")
         return None
 
+# Function to compute the outlier boundaries of the whole file
+def quantity_outlier_bounds(file_path, outliers_config=None):
+    """Cheap pre-pass reading only the quantity column, cleaned as transform_sales_data does.
+
+    Every worker of the byte range pipeline applies these bounds, so the outliers
+    are the same as when the whole file is processed at once. With
+    outliers.group_by, the column of the groups is read too and a per-group
+    bounds table is returned.
+    """
+    group_by = (outliers_config or {}).get('group_by')
+    group_column = {'product_category': 'product_id', 'product_id': 'product_id', 'sale_date': 'timestamp'}.get(group_by)
+    with csv_source(file_path) as source:
+        df = pd.read_csv(source, usecols=['quantity'] + ([group_column] if group_column else []),
+                         memory_map=isinstance(source, str))
+    quantity = pd.to_numeric(df['quantity'], errors='coerce').fillna(0)
+    if not group_by:
+        return outlier_bounds(quantity)
+
+    # Clean the group column like transform_sales_data does
+    df = df.rename(columns={'timestamp': 'sale_date'})
+    if group_column == 'product_id':
+        df['product_id'] = df['product_id'].fillna('Unknown')
+    else:
+        df['sale_date'] = pd.to_datetime(df['sale_date'], errors='coerce')
+    return resolve_bounds(quantity, group_keys(df, group_by), outliers_config)
+
 # Function to load data chunk into database
-def load_data_chunk(chunk, chunk_size):
+def load_data_chunk(chunk, skip_existing=False, partitioned=False):
+    """Load one chunk; returns (rows, seconds, loaded) for the scheduler.
+
+    With skip_existing, transactions already in the table are skipped instead
+    of failing the chunk. With partitioned, the rows of each month go straight
+    into the partition of the month.
+    """
+    start = time.perf_counter()
     try:
         # Connect to the database
         config_file = "src/database/config.yaml"
         config = load_config(config_file)
         if config:
-            connection = connect_to_database(config)
-
-            if connection:
+            # Each worker process keeps its own pool, so later chunks reuse the connection
+            with pooled_connection(config, 'bulk_load') as connection:
                 # Open a cursor
                 cursor = connection.cursor()
 
+                # Expand the compacted columns of this chunk only
+                chunk = expand_for_load(chunk)
+
                 # Load chunk into the database
-                for index, row in chunk.iterrows():
-                    # Construct SQL query to insert row into 'sales' table
-                    sql_query = "INSERT INTO sales (transaction_id, customer_id, product_id, quantity, sale_date) VALUES (%s, %s, %s, %s, %s)"
-                    # Extract row values
-                    values = (row['transaction_id'], row['customer_id'], row['product_id'], row['quantity'], row['sale_date'])
-                    # Execute SQL query
-                    cursor.execute(sql_query, values)
+                for table, rows in split_by_partition(chunk) if partitioned else [('sales', chunk)]:
+                    for index, row in rows.iterrows():
+                        # Construct SQL query to insert row into the table
+                        sql_query = f"INSERT INTO {table} (transaction_id, customer_id, product_id, quantity, sale_date) VALUES (%s, %s, %s, %s, %s)"
+                        if skip_existing:
+                            sql_query += " ON CONFLICT DO NOTHING"
+                        # Extract row values
+                        values = (row['transaction_id'], row['customer_id'], row['product_id'], row['quantity'], row['sale_date'])
+                        # Execute SQL query
+                        cursor.execute(sql_query, values)
 
                 # Commit the transaction
                 connection.commit()
-                logging.info(f"Chunk loaded into database successfully!")
-                print(f"Chunk loaded into database successfully!")
+                logging.debug(f"Chunk of {len(chunk)} rows loaded into database successfully!")
 
-                # Close the cursor and the connection
+                # Close the cursor
                 cursor.close()
-                close_connection(connection)
-                #logging.info("Connection to the database closed.")
-                #print("Connection to the database closed.")
+                return len(chunk), time.perf_counter() - start, True
 
     except Exception as e:
         logging.error(f"Error loading data chunk into database: {e}")
         print(f"Error loading data chunk into database: {e}")
+    return len(chunk), time.perf_counter() - start, False
+
+# Function to load the rows of one month into its partition
+def load_partition(task):
+    """Load the rows of one partition, committed chunk_size rows at a time; returns (rows, seconds, loaded).
+
+    task is (partition name, rows, chunk_size). Each worker loads one
+    partition at a time, so the workers do not insert into the same index.
+    """
+    name, rows, chunk_size = task
+    results = [load_data_chunk(rows.iloc[start:start + chunk_size], partitioned=True)
+               for start in range(0, len(rows), chunk_size)]
+    return sum(result[0] for result in results), sum(result[1] for result in results), all(result[2] for result in results)
+
+# Function to create the partitions a DataFrame needs
+def create_missing_partitions(config, df):
+    """Create the monthly partitions of 'sales' missing for the sale dates of df."""
+    with pooled_connection(config) as connection:
+        cursor = connection.cursor()
+        ensure_partitions(cursor, sale_months(df['sale_date']))
+        cursor.close()
+
+# State of a byte range pipeline worker, set by init_worker
+worker_state = {}
+
+# Function to set up a byte range pipeline worker
+def init_worker(encryption_key, file_path, engine, bounds, outliers_config, partitioned=False, profiling=None):
+    """Pool initializer: hand the encryption key and the shared settings to a worker process.
+
+    The key is passed explicitly, so every worker encrypts with the parent's key
+    also when worker processes are spawned rather than forked. With the
+    profiling settings of a profiled run, the worker is profiled as a whole.
+    """
+    global cipher_suite
+    cipher_suite = Fernet(encryption_key)
+    worker_state.update(file_path=file_path, engine=engine, bounds=bounds, outliers_config=outliers_config,
+                        partitioned=partitioned)
+    start_worker_profiling(profiling)
+
+# Function to run the whole pipeline on a byte range of the CSV file
+def process_byte_range(byte_range):
+    """Parse, transform, encrypt, clean, validate and load one byte range of the CSV file.
+
+    byte_range is a (start, end) range, or the CSV data of a block of a
+    compressed file (see read_sales_blocks). Returns (rows, seconds, loaded,
+    rejected_df); the rejected rows are quarantined by the parent.
+    """
+    start = time.perf_counter()
+    try:
+        if isinstance(byte_range, bytes):
+            sales_data = read_sales_csv_block(byte_range, worker_state['engine'])
+        else:
+            sales_data = read_sales_csv_range(worker_state['file_path'], byte_range[0], byte_range[1], worker_state['engine'])
+        df = transform_sales_data(sales_data)
+        df = handle_outliers(df, 'quantity', worker_state['bounds'], worker_state['outliers_config'])
+        df, rejected_df = validate_sales_data(df)
+
+        # The range holds rows of any month; partitions are created as they are needed
+        if worker_state['partitioned']:
+            create_missing_partitions(load_config("src/database/config.yaml"), df)
+
+        # Other ranges and earlier runs may hold the same transactions; the table's key decides
+        rows, _, loaded = load_data_chunk(df, skip_existing=True, partitioned=worker_state['partitioned'])
+        return rows, time.perf_counter() - start, loaded, rejected_df
+
+    except Exception as e:
+        if isinstance(byte_range, bytes):
+            byte_range = f"block of {len(byte_range)} bytes"
+        logging.error(f"Error processing byte range {byte_range}: {e}")
+        print(f"Error processing byte range {byte_range}: {e}")
+        return 0, time.perf_counter() - start, False, None
+
+# Function to run the pipeline in the workers
+def run_byte_range_pipeline(config, file_path, etl_config, profiling=None):
+    """Let every worker run parse -> transform -> encrypt -> load on byte ranges of the CSV file.
+
+    The parent only splits the file, computes the outlier bounds in a pre-pass
+    and quarantines the rejected rows the workers send back. profiling holds
+    the settings of a profiled run, handed on to the workers.
+    """
+    scheduler_config = config.get('scheduler') or {}
+    with pooled_connection(config) as connection:
+        # Handle schema changes before loading data into the database
+        handle_schema_changes(pd.DataFrame(columns=sales_columns()), connection)
+
+        # Each worker holds a connection, so stay within what the database can still accept
+        budget = connection_budget(connection, scheduler_config)
+
+        cursor = connection.cursor()
+        partitioned = is_partitioned(cursor)
+        cursor.close()
+
+    # Release the parent's connections before the workers open their own
+    close_all_pools()
+
+    outliers_config = config.get('outliers') or {}
+    with stage('quantity_outlier_bounds'):
+        bounds = quantity_outlier_bounds(file_path, outliers_config)
+    num_processors = worker_count(budget, scheduler_config)
+    slots = None
+    if compression_of(file_path):
+        # A compressed file cannot be read at an offset: it is decompressed here, once, and its blocks go to the
+        # workers, at most two per worker ahead of them
+        slots = threading.Semaphore(2 * num_processors)
+        byte_ranges = iter_bounded(read_sales_blocks(file_path), slots)
+        ranges_label = "blocks of the decompressed file"
+    else:
+        byte_ranges = split_byte_ranges(file_path, num_processors * etl_config.get('ranges_per_worker', 4))
+        ranges_label = len(byte_ranges)
+    print(f"Number of workers: {num_processors} (connection budget: {budget}), byte ranges: {ranges_label}")
+    logging.info(f"Number of workers: {num_processors} (connection budget: {budget}), byte ranges: {ranges_label}")
+
+    # Idle workers take the next byte range as they finish
+    initargs = (key, file_path, etl_config.get('csv_engine', 'c'), bounds, outliers_config, partitioned, profiling)
+    results = []
+    with Pool(processes=num_processors, initializer=init_worker, initargs=initargs) as pool:
+        for result in pool.imap_unordered(process_byte_range, byte_ranges):
+            if slots is not None:
+                slots.release()
+            results.append(result)
+        # Let the workers exit rather than terminate them, so profiled workers write their files
+        pool.close()
+        pool.join()
+
+    failed = [result for result in results if not result[2]]
+    print(f"Byte ranges processed: {len(results)}, failed: {len(failed)}, rows: {sum(result[0] for result in results)}")
+    logging.info(f"Byte ranges processed: {len(results)}, failed: {len(failed)}, rows: {sum(result[0] for result in results)}")
+
+    rejected = [result[3] for result in results if result[3] is not None and len(result[3])]
+    if rejected:
+        quarantine_rows(pd.concat(rejected))
+
+    # The workers loaded keys the filter of loaded transactions has not seen; the next run rebuilds it
+    dedup_config = config.get('dedup') or {}
+    if dedup_config.get('enabled') and os.path.exists(dedup_config['filter_file']):
+        os.remove(dedup_config['filter_file'])
 
 # Function to dynamically detect and handle schema changes
 def handle_schema_changes(df, connection):
@@ -160,61 +359,144 @@ def handle_schema_changes(df, connection):
 
 # Main function
 def main():
+    global key, cipher_suite
+    parser = argparse.ArgumentParser(description="Load the sales CSV file into the database with multiprocessing.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     try:
+        # Load configuration
+        config_file = "src/database/config.yaml"
+        config = load_config(config_file)
+        etl_config = (config or {}).get('etl') or {}
+
+        # Profile the stages of the run, in the workers too; without --profile the stages run as they are
+        profiling = None
+        if args.profile:
+            profiling = profiling_settings(args.profile, (config or {}).get('profiling'))
+            start_profiling(profiling)
+
+        # Encrypt with the persisted key, so the exported data can be decrypted
+        key = load_or_create_key(key_file_from_config(config))
+        cipher_suite = Fernet(key)
+
+        file_path = etl_config.get('input_file', 'data/mock_sales_data.csv')
+
+        # Run the whole pipeline in the workers instead
+        if config and etl_config.get('parallel_mode') == 'byte_ranges':
+            run_byte_range_pipeline(config, file_path, etl_config, profiling)
+            return
+
         # Read data from CSV file
-        file_path = "data/mock_sales_data.csv"
-        sales_data = read_csv_file(file_path)
+        with stage('read_csv_file'):
+            sales_data = read_csv_file(file_path, etl_config.get('csv_engine', 'c'))
 
         if sales_data is not None:
+            report_memory = etl_config.get('memory_report', False)
+            if report_memory:
+                memory_report(sales_data, 'read')
+
             # Transform sales data
-            df = transform_sales_data(sales_data)
+            with stage('transform_sales_data'):
+                df = transform_sales_data(sales_data)
 
             if df is not None:
-                # Display original data
-                logging.info("\nTransformed Data:")
-                logging.info(df)
-                print("\nTransformed Data:")
-                print(df)
+                if report_memory:
+                    memory_report(df, 'transform')
 
-                # Detect and handle outliers in the 'quantity' column
-                df = handle_outliers(df, 'quantity')
+                # Describe the data; the rows themselves are only formatted at DEBUG level
+                logging.info(f"Transformed data: {describe_frame(df)}")
+                logging.debug("Transformed data:\n%s", df)
+                print(f"\nTransformed data: {describe_frame(df)}")
 
-                # Display data after handling outliers
-                logging.info("\nData after handling outliers:")
-                logging.info(df)
-                print("\nData after handling outliers:")
-                print(df)
+                # Detect and handle outliers in the 'quantity' column
+                with stage('handle_outliers'):
+                    df = handle_outliers(df, 'quantity', outliers_config=config.get('outliers') if config else None)
+
+                # Describe the data after handling outliers
+                logging.info(f"Data after handling outliers: {describe_frame(df)}")
+                logging.debug("Data after handling outliers:\n%s", df)
+                print(f"\nData after handling outliers: {describe_frame(df)}")
+
+                # Quarantine the rows the sales table would refuse, so the rest still loads
+                with stage('validate_sales_data'):
+                    df, rejected_df = validate_sales_data(df)
+                    quarantine_rows(rejected_df)
+
+                # Drop the transactions loaded by earlier runs before they reach the database
+                dedup_config = (config or {}).get('dedup') or {}
+                dedup_filter = None
+                if dedup_config.get('enabled'):
+                    with pooled_connection(config) as connection:
+                        df, dedup_filter = drop_loaded_transactions(connection, df, dedup_config)
+
+                # Keep the frame in its compact form until a chunk is loaded
+                if etl_config.get('compact', False):
+                    df = compact_sales_data(df)
+                    if report_memory:
+                        memory_report(df, 'compact')
 
                 # Connect to the database
-                config_file = "src/database/config.yaml"
-                config = load_config(config_file)
                 if config:
-                    connection = connect_to_database(config)
-
-                    if connection:
+                    scheduler_config = config.get('scheduler') or {}
+                    with pooled_connection(config) as connection:
                         # Handle schema changes before loading data into the database
                         handle_schema_changes(df, connection)
 
-                        # Parallel processing
-                        num_processors = cpu_count()
-                        print(f"Number of processors: {num_processors}")
-                        logging.info(f"Number of processors: {num_processors}")
-                        chunk_size = len(df) // num_processors
-                        print(f"Chunk size: {chunk_size}")
-                        logging.info(f"Chunk size: {chunk_size}")
-                        chunks = [df[i:i+chunk_size] for i in range(0, len(df), chunk_size)]
-                        num_chunks = len(chunks)
-                        print(f"Number of chunks: {num_chunks}")
-                        logging.info(f"Number of chunks: {num_chunks}")
-                        
-                        # Create a pool of worker processes
-                        with Pool(processes=num_processors) as pool:
-                            # Load data into the database in parallel
-                            pool.map(partial(load_data_chunk, chunk_size=chunk_size), chunks)
+                        # Each worker holds a connection, so stay within what the database can still accept
+                        budget = connection_budget(connection, scheduler_config)
+
+                        # A partitioned table gets the partitions of the incoming months first
+                        cursor = connection.cursor()
+                        partitioned = is_partitioned(cursor)
+                        if partitioned:
+                            ensure_partitions(cursor, sale_months(df['sale_date']))
+                        cursor.close()
+
+                    # Release the parent's connections before the workers open their own
+                    close_all_pools()
+
+                    # Parallel processing
+                    num_processors = worker_count(budget, scheduler_config)
+                    print(f"Number of workers: {num_processors} (connection budget: {budget})")
+                    logging.info(f"Number of workers: {num_processors} (connection budget: {budget})")
+
+                    # Create a pool of worker processes
+                    tuner = ChunkSizeTuner.from_config(scheduler_config)
+                    # The workers of a profiled run are profiled as a whole; otherwise they start as they are
+                    pool_args = {'initializer': start_worker_profiling, 'initargs': (profiling,)} if profiling else {}
+                    with stage('load_data'), Pool(processes=num_processors, **pool_args) as pool:
+                        if partitioned:
+                            # One month per task, the largest first: a worker only ever loads into one partition
+                            tasks = sorted(((name, rows, scheduler_config.get('max_chunk_size', 50000))
+                                            for name, rows in split_by_partition(df)), key=lambda task: -len(task[1]))
+                            results = list(pool.imap_unordered(load_partition, tasks))
+                        else:
+                            # Hand out many small chunks, each to the next idle worker, sized from the measured latency
+                            max_in_flight = num_processors * scheduler_config.get('chunks_in_flight_per_worker', 2)
+                            results = list(schedule_chunks(pool, load_data_chunk, df, tuner, max_in_flight))
+                        # Let the workers exit rather than terminate them, so profiled workers write their files
+                        pool.close()
+                        pool.join()
+
+                    failed = [result for result in results if not result[2]]
+                    if partitioned:
+                        print(f"Number of partitions loaded: {len(results)}, failed: {len(failed)}")
+                        logging.info(f"Number of partitions loaded: {len(results)}, failed: {len(failed)}")
+                    else:
+                        print(f"Number of chunks: {len(results)}, failed: {len(failed)}, final chunk size: {tuner.size}")
+                        logging.info(f"Number of chunks: {len(results)}, failed: {len(failed)}, final chunk size: {tuner.size}")
+
+                    # Persist the filter with the transactions just loaded
+                    if dedup_filter is not None:
+                        dedup_filter.save(dedup_config['filter_file'])
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         print(f"An error occurred: {e}")
 
+    finally:
+        stop_profiling()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import pandas as pd
+
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+# Bounds of groups too small for their own, computed over all rows
+GLOBAL_GROUP = '__all__'
+
+# Scale of the median absolute deviation to the standard deviation of normal data
+MAD_SCALE = 1.4826
+
+def group_keys(df, group_by):
+    """Return the group of every row as a string Series.
+
+    group_by is product_category (the first part of product_id, e.g.
+    'Electronics' of 'Electronics_Apple_Laptop'), product_id or sale_date (the day).
+    """
+    if group_by == 'product_category':
+        return df['product_id'].astype(str).str.split('_', n=1).str[0]
+    if group_by == 'product_id':
+        return df['product_id'].astype(str)
+    if group_by == 'sale_date':
+        return pd.to_datetime(df['sale_date']).dt.strftime('%Y-%m-%d').fillna('NaT')
+    raise ValueError(f"Unknown outlier group: {group_by}")
+
+def compute_bounds(values, keys, method='iqr', factor=None):
+    """Compute the (lower, upper, median, count) of every group with grouped aggregations.
+
+    iqr: quartiles -/+ factor (default 1.5) times the interquartile range.
+    mad: median -/+ factor (default 3) times the scaled median absolute deviation,
+    which a few extreme values cannot stretch.
+    """
+    grouped = values.groupby(keys)
+    median = grouped.median()
+    if method == 'mad':
+        factor = 3.0 if factor is None else factor
+        absolute_deviation = (values - grouped.transform('median')).abs()
+        spread = factor * MAD_SCALE * absolute_deviation.groupby(keys).median()
+        lower, upper = median - spread, median + spread
+    elif method == 'iqr':
+        factor = 1.5 if factor is None else factor
+        q1, q3 = grouped.quantile(0.25), grouped.quantile(0.75)
+        lower, upper = q1 - factor * (q3 - q1), q3 + factor * (q3 - q1)
+    else:
+        raise ValueError(f"Unknown outlier method: {method}")
+    return pd.DataFrame({'lower': lower, 'upper': upper, 'median': median, 'count': grouped.size()})
+
+def cache_settings(outliers_config):
+    """The settings the cached bounds depend on; bounds computed with other settings are not reused."""
+    return {
+        'method': outliers_config.get('method', 'iqr'),
+        'group_by': outliers_config.get('group_by'),
+        'factor': outliers_config.get('factor'),
+        'min_group_size': outliers_config.get('min_group_size', 20),
+    }
+
+def load_bounds_cache(path, settings):
+    """Load the cached group bounds, or an empty table when missing or computed with other settings."""
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(columns=['lower', 'upper', 'median', 'count'])
+    with open(path) as file:
+        cache = json.load(file)
+    if cache.get('settings') != settings:
+        logging.info(f"Outlier settings changed since {path} was written; recomputing the bounds.")
+        return pd.DataFrame(columns=['lower', 'upper', 'median', 'count'])
+    return pd.DataFrame.from_dict(cache['groups'], orient='index', columns=['lower', 'upper', 'median', 'count'])
+
+def save_bounds_cache(path, settings, bounds):
+    """Write the group bounds to the cache file, with the settings they were computed with."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'settings': settings,
+                   'groups': {str(group): [float(value) for value in row] for group, row in bounds.iterrows()}}, file, indent=1)
+
+def resolve_bounds(values, keys, outliers_config):
+    """Return the bounds of every group of keys, reusing cached bounds.
+
+    Groups already in the cache keep their bounds, so later incremental
+    batches are cleaned like the first; new groups get bounds from values and
+    are added to the cache. Groups with fewer than min_group_size rows use the
+    bounds over all rows, which are cached with the first batch as well. A
+    change of method, group_by, factor or min_group_size discards the cache.
+    """
+    method = outliers_config.get('method', 'iqr')
+    factor = outliers_config.get('factor')
+    min_group_size = outliers_config.get('min_group_size', 20)
+    cache_file = outliers_config.get('cache_file')
+    settings = cache_settings(outliers_config)
+
+    bounds = load_bounds_cache(cache_file, settings)
+    changed = False
+    if GLOBAL_GROUP not in bounds.index:
+        global_bounds = compute_bounds(values, pd.Series(GLOBAL_GROUP, index=values.index), method, factor)
+        bounds = pd.concat([bounds, global_bounds]) if len(bounds) else global_bounds
+        changed = True
+
+    new_groups = compute_bounds(values, keys, method, factor)
+    new_groups = new_groups[~new_groups.index.isin(bounds.index) & (new_groups['count'] >= min_group_size)]
+    if len(new_groups):
+        bounds = pd.concat([bounds, new_groups])
+        logging.info(f"Computed outlier bounds of {len(new_groups)} new groups.")
+        changed = True
+    if changed and cache_file:
+        save_bounds_cache(cache_file, settings, bounds)
+    return bounds
+
+def apply_bounds(df, column, keys, bounds):
+    """Replace the values outside their group's bounds with the group median."""
+    lookup = bounds.reindex(keys.where(keys.isin(bounds.index), GLOBAL_GROUP))
+    lower, upper, median = (lookup[name].to_numpy() for name in ('lower', 'upper', 'median'))
+    outliers = ((df[column] < lower) | (df[column] > upper)).to_numpy()
+    df.loc[outliers, column] = median[outliers]
+    logging.info(f"Replaced {int(outliers.sum())} outliers in {column} with their group median.")
+    return df
+
+def handle_group_outliers(df, column, outliers_config):
+    """Handle outliers with per-group bounds, see resolve_bounds and apply_bounds."""
+    keys = group_keys(df, outliers_config['group_by'])
+    bounds = resolve_bounds(df[column], keys, outliers_config)
+    return apply_bounds(df, column, keys, bounds)
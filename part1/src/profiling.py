@@ -0,0 +1,261 @@
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# Both parts profile with this module (part2 loads it from its path), so it
+# logs to the log file of the pipeline that imports it rather than its own.
+
+# Profilers a run can be profiled with: cProfile traces every call, sampling takes the stack every few milliseconds
+PROFILE_MODES = ['cprofile', 'sampling']
+
+# Profiler of this process, set by start_profiling; None while profiling is off
+profiler = None
+
+# What stage() hands out while profiling is off: entering and leaving it does nothing
+NOT_PROFILED = contextlib.nullcontext()
+
+def add_profile_argument(parser):
+    """Add --profile [cprofile|sampling] to the argument parser of a pipeline script."""
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILE_MODES,
+                        help="Profile every stage of the run (cprofile when no mode is given) and trace its memory; "
+                             "the results are written under profiling.directory in config.yaml.")
+
+def profiling_settings(mode, profiling_config=None):
+    """Settings of a profiled run from its mode and the profiling section of config.yaml.
+
+    Every run writes to a directory of its own, named after its start time;
+    worker processes are handed the same settings and write next to the parent.
+    """
+    profiling_config = profiling_config or {}
+    return {
+        'mode': mode,
+        'directory': os.path.join(profiling_config.get('directory', 'profiles'), datetime.now().strftime('%Y%m%d-%H%M%S')),
+        'sampling_interval': profiling_config.get('sampling_interval', 0.005),
+        'top_allocations': profiling_config.get('top_allocations', 25),
+        'traceback_frames': profiling_config.get('traceback_frames', 1),
+    }
+
+def start_profiling(settings, suffix=''):
+    """Turn profiling on in this process; stage() profiles from now on. Returns the profiler."""
+    global profiler
+    profiler = StageProfiler(settings, suffix)
+    return profiler
+
+def stop_profiling():
+    """Turn profiling off in this process and write the files of its stages."""
+    global profiler
+    if profiler is not None:
+        profiler.close()
+        profiler = None
+
+def start_worker_profiling(settings):
+    """Pool initializer: profile a worker process as a whole, as the stage worker-<pid>.
+
+    The tasks of a worker are not stages of their own: a tracemalloc snapshot
+    per task would add to the task times the chunk size tuner learns from. The
+    files are written when the worker exits, so the pool has to be closed and
+    joined rather than terminated.
+    """
+    if settings:
+        from multiprocessing.util import Finalize
+        start_profiling(settings, f"-{os.getpid()}").hold('worker')
+        Finalize(None, stop_profiling, exitpriority=10)
+
+def stage(name):
+    """Context manager around a stage of the run, profiled when profiling is on.
+
+    While profiling is off this is a lookup of a global and a no-op context
+    manager; the profilers and tracemalloc are not even imported.
+    """
+    if profiler is None:
+        return NOT_PROFILED
+    return profiler.stage(name)
+
+def frame_label(file_name, line_number, function_name):
+    """Name of a function in a collapsed stack, e.g. transform_sales_data (main.py:41)."""
+    if file_name == '~':
+        # Built-in functions have no file, e.g. <method 'execute' of 'psycopg2.extensions.cursor' objects>
+        return function_name.replace(';', ',')
+    return f"{function_name} ({os.path.basename(file_name)}:{line_number})".replace(';', ',')
+
+def collapsed_from_stats(stats, min_share=0.0001):
+    """Collapsed stacks, {'caller;callee': microseconds}, rebuilt from the call graph of pstats.Stats.stats.
+
+    cProfile keeps the time of every caller -> callee edge, not whole stacks,
+    so the time of a function is split over the stacks it is reached from in
+    proportion to the time of each of its callers' calls; the stacks are
+    estimated, unlike those of the sampling mode. Recursive calls are folded
+    into the first call and stacks under min_share of the total are dropped.
+    """
+    callees = defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][function] = edge[3]
+    # Functions called right from the stage have no callers; the call that stopped the profiler is left out
+    roots = [function for function, entry in stats.items()
+             if not entry[4] and function[2] != "<method 'disable' of '_lsprof.Profiler' objects>"]
+    min_seconds = sum(stats[function][3] for function in roots) * min_share
+
+    stacks = Counter()
+    pending = [(function, (function,), 1.0) for function in roots]
+    while pending:
+        function, path, share = pending.pop()
+        own_seconds = stats[function][2]
+        stacks[';'.join(frame_label(*frame) for frame in path)] += own_seconds * share * 1e6
+        for callee, edge_seconds in callees[function].items():
+            callee_total = stats[callee][3]
+            if callee in path or callee_total <= 0 or edge_seconds * share < min_seconds:
+                continue
+            pending.append((callee, path + (callee,), share * edge_seconds / callee_total))
+    return stacks
+
+def sample_stacks(thread_id, interval, stacks, stopping):
+    """Count the stack of a thread every interval seconds until stopping is set; runs on a thread of its own."""
+    while not stopping.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        path = []
+        while frame is not None:
+            path.append(frame_label(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+            frame = frame.f_back
+        if path:
+            stacks[';'.join(reversed(path))] += 1
+
+class StageProfiler:
+    """Profile the named stages of a run and write what was found per stage.
+
+    - <stage>.pstats: cProfile statistics (cprofile mode), for pstats or snakeviz.
+    - <stage>.collapsed: collapsed stacks for flamegraph.pl or speedscope, in
+      microseconds (cprofile mode) or samples (sampling mode).
+    - <stage>.allocations.txt: peak traced memory and the lines that
+      allocated the most memory during the stage, from tracemalloc.
+
+    A stage run several times, e.g. once per file, adds up over its runs; the
+    files are written once, by close(). A stage inside another one is left
+    out of the other's cProfile statistics.
+    """
+
+    def __init__(self, settings, suffix=''):
+        import tracemalloc
+        self.settings = settings
+        self.mode = settings['mode']
+        self.directory = settings['directory']
+        self.suffix = suffix
+        self.runs = Counter()
+        self.seconds = Counter()
+        self.peaks = {}
+        self.allocations = defaultdict(Counter)
+        self.profiles = {}
+        self.samples = defaultdict(Counter)
+        self.active = []
+        self.held = contextlib.ExitStack()
+        os.makedirs(self.directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.get('traceback_frames', 1))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        import tracemalloc
+        before = self.take_snapshot()
+        tracemalloc.reset_peak()
+        sampler = self.start_sampler(name) if self.mode == 'sampling' else None
+        profile = self.start_profile(name) if self.mode == 'cprofile' else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                self.stop_profile(profile)
+            if sampler is not None:
+                self.stop_sampler(sampler)
+            self.record_allocations(name, before)
+            self.runs[name] += 1
+            self.seconds[name] += seconds
+            logging.info(f"Profiled {name}{self.suffix}: {seconds:.3f}s, peak traced memory "
+                         f"{self.peaks[name] / 2 ** 20:.1f} MiB (run {self.runs[name]}).")
+
+    def hold(self, name):
+        """Enter the stage name until close(), e.g. for the whole life of a worker process."""
+        self.held.enter_context(self.stage(name))
+
+    def start_profile(self, name):
+        import cProfile
+        # Only one cProfile profiler runs at a time: the enclosing stage pauses until this one ends
+        if self.active:
+            self.active[-1].disable()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        self.active.append(profile)
+        profile.enable()
+        return profile
+
+    def stop_profile(self, profile):
+        profile.disable()
+        self.active.pop()
+        if self.active:
+            self.active[-1].enable()
+
+    def start_sampler(self, name):
+        stopping = threading.Event()
+        thread = threading.Thread(target=sample_stacks, daemon=True,
+                                  args=(threading.get_ident(), self.settings.get('sampling_interval', 0.005),
+                                        self.samples[name], stopping))
+        thread.start()
+        return thread, stopping
+
+    def stop_sampler(self, sampler):
+        thread, stopping = sampler
+        stopping.set()
+        thread.join()
+
+    def take_snapshot(self):
+        import tracemalloc
+        # Leave out the memory of tracemalloc and of the profiler itself
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def record_allocations(self, name, before):
+        import tracemalloc
+        self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+        after = self.take_snapshot()
+        for difference in after.compare_to(before, 'lineno'):
+            if difference.size_diff > 0:
+                self.allocations[name][str(difference.traceback)] += difference.size_diff
+
+    def path(self, name, extension):
+        return os.path.join(self.directory, f"{name}{self.suffix}.{extension}")
+
+    def write_stage(self, name):
+        import pstats
+        if name in self.profiles:
+            stats = pstats.Stats(self.profiles[name])
+            stats.dump_stats(self.path(name, 'pstats'))
+            stacks = collapsed_from_stats(stats.stats)
+        else:
+            stacks = self.samples[name]
+        with open(self.path(name, 'collapsed'), 'w') as file:
+            for stack, weight in sorted(stacks.items()):
+                if round(weight) > 0:
+                    file.write(f"{stack} {round(weight)}\n")
+
+        with open(self.path(name, 'allocations.txt'), 'w') as file:
+            file.write(f"{name}{self.suffix}: {self.runs[name]} runs, {self.seconds[name]:.3f}s, "
+                       f"peak traced memory {self.peaks[name] / 2 ** 20:.1f} MiB\n")
+            file.write("Memory allocated and still held at the end of a run, by line:\n")
+            for line, size in self.allocations[name].most_common(self.settings.get('top_allocations', 25)):
+                file.write(f"{size / 1024:12.1f} KiB  {line}\n")
+
+    def close(self):
+        import tracemalloc
+        self.held.close()
+        for name in self.runs:
+            self.write_stage(name)
+        tracemalloc.stop()
+        logging.info(f"Profiles written to {self.directory}.")
+        print(f"Profiles written to {self.directory}")
@@ -0,0 +1,103 @@
+import threading
+from multiprocessing import cpu_count
+
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+class ChunkSizeTuner:
+    """Pick the next chunk size from the measured load rate of the chunks done so far.
+
+    Chunks are sized to take about target_seconds each: long enough to amortise
+    the per-chunk overhead, short enough that a slow chunk does not hold back the
+    end of the run while the other workers sit idle.
+    """
+
+    def __init__(self, initial_size=1000, target_seconds=0.5, min_size=100, max_size=50000, smoothing=0.3):
+        self.size = initial_size
+        self.target_seconds = target_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+        self.rows_per_second = None
+
+    @classmethod
+    def from_config(cls, scheduler_config):
+        return cls(initial_size=scheduler_config.get('initial_chunk_size', 1000),
+                   target_seconds=scheduler_config.get('target_chunk_seconds', 0.5),
+                   min_size=scheduler_config.get('min_chunk_size', 100),
+                   max_size=scheduler_config.get('max_chunk_size', 50000))
+
+    def record(self, rows, seconds):
+        """Fold the latency of a finished chunk into the rate estimate and resize."""
+        if rows <= 0 or seconds <= 0:
+            return
+        rate = rows / seconds
+        if self.rows_per_second is None:
+            self.rows_per_second = rate
+        else:
+            self.rows_per_second += self.smoothing * (rate - self.rows_per_second)
+        self.size = int(min(self.max_size, max(self.min_size, self.rows_per_second * self.target_seconds)))
+
+def connection_budget(conn, scheduler_config):
+    """Return how many more connections the loaders may open.
+
+    That is max_connections minus the reserved slots, the sessions already
+    connected and a headroom for other clients, or scheduler.max_connections
+    when configured.
+    """
+    if scheduler_config.get('max_connections'):
+        return scheduler_config['max_connections']
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT current_setting('max_connections')::int
+             - current_setting('superuser_reserved_connections')::int
+             - (SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend')
+    """)
+    available = cursor.fetchone()[0]
+    cursor.close()
+    return max(1, available - scheduler_config.get('connection_headroom', 5))
+
+def worker_count(budget, scheduler_config):
+    """Use one worker per core, or scheduler.max_workers, within the connection budget.
+
+    Each worker holds one connection.
+    """
+    workers = min(scheduler_config.get('max_workers') or cpu_count(), budget)
+    return max(1, workers)
+
+def iter_chunks(df, tuner, slots):
+    """Cut the DataFrame into chunks sized by the tuner at the moment each is handed out.
+
+    The pool's task feeder drains its input eagerly, so each chunk first takes a
+    slot, freed when a result comes back; the sizes then follow the latest
+    measurements instead of being fixed up front.
+    """
+    start = 0
+    while start < len(df):
+        slots.acquire()
+        size = tuner.size
+        yield df.iloc[start:start + size]
+        start += size
+
+def iter_bounded(tasks, slots):
+    """Take a slot before handing out each task, like iter_chunks, so the task feeder cannot run ahead."""
+    for task in tasks:
+        slots.acquire()
+        yield task
+
+def schedule_chunks(pool, func, df, tuner, max_in_flight):
+    """Run func over chunks of df on the pool; idle workers take the next chunk as they finish.
+
+    func returns (rows, seconds, ...) for a chunk. Yields the results in
+    completion order.
+    """
+    slots = threading.Semaphore(max_in_flight)
+    for result in pool.imap_unordered(func, iter_chunks(df, tuner, slots)):
+        slots.release()
+        tuner.record(result[0], result[1])
+        yield result
@@ -0,0 +1,74 @@
+import logging
+import os
+import pandas as pd
+
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('etl.log')
+
+# Column limits of the sales table
+MAX_ID_LENGTH = 50
+MAX_QUANTITY = 2**31 - 1
+
+# Default location of the quarantined rows
+DEAD_LETTER_FILE = "data/dead_letter/sales_rejected.csv"
+
+def validate_sales_data(df):
+    """Split transformed sales data into rows the sales table accepts and rejected rows.
+
+    The checks are vectorized over the whole DataFrame. A row failing several
+    checks is rejected with the first reason. Returns (valid_df, rejected_df);
+    rejected_df carries reason_code and reason_detail columns.
+    """
+    transaction_id = df['transaction_id'].astype('string')
+    product_id = df['product_id'].astype('string')
+    quantity = pd.to_numeric(df['quantity'], errors='coerce')
+
+    # Checks in priority order: (reason_code, reason_detail, mask of failing rows)
+    checks = [
+        ('MISSING_KEY', "Empty transaction ID", transaction_id.isna() | (transaction_id.str.strip() == '')),
+        ('VALUE_TOO_LONG', f"Transaction ID longer than {MAX_ID_LENGTH} characters", transaction_id.str.len() > MAX_ID_LENGTH),
+        ('VALUE_TOO_LONG', f"Product ID longer than {MAX_ID_LENGTH} characters", product_id.str.len() > MAX_ID_LENGTH),
+        ('DUPLICATE_KEY', "Transaction ID repeated in the file", transaction_id.duplicated(keep='first')),
+        ('INVALID_QUANTITY', "Quantity not a number in the INTEGER range",
+         quantity.isna() | (quantity < 0) | (quantity > MAX_QUANTITY)),
+        ('INVALID_DATE', "Missing or unparseable sale date", pd.to_datetime(df['sale_date'], errors='coerce').isna()),
+    ]
+
+    reason_code = pd.Series(pd.NA, index=df.index, dtype='string')
+    reason_detail = pd.Series(pd.NA, index=df.index, dtype='string')
+    for code, detail, mask in checks:
+        mask = mask.fillna(False).astype(bool) & reason_code.isna()
+        reason_code[mask] = code
+        reason_detail[mask] = detail
+
+    rejected = reason_code.notna()
+    rejected_df = df[rejected].assign(reason_code=reason_code[rejected], reason_detail=reason_detail[rejected])
+    valid_df = df[~rejected]
+
+    if len(rejected_df):
+        counts = rejected_df['reason_code'].value_counts().to_dict()
+        logging.warning(f"Rejected {len(rejected_df)} of {len(df)} sales rows: {counts}")
+        print(f"Rejected {len(rejected_df)} of {len(df)} sales rows: {counts}")
+    return valid_df, rejected_df
+
+def quarantine_rows(rejected_df, path=DEAD_LETTER_FILE):
+    """Append rejected rows to the dead-letter CSV file, with the time they were quarantined.
+
+    customer_id is already encrypted at this point, so the file holds no plain IDs.
+    """
+    if rejected_df is None or rejected_df.empty:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rejected_df = rejected_df.assign(quarantined_at=pd.Timestamp.now())
+        rejected_df.to_csv(path, mode='a', index=False, header=not os.path.exists(path))
+        logging.info(f"Quarantined {len(rejected_df)} rows to {path}.")
+        print(f"Quarantined {len(rejected_df)} rows to {path}.")
+    except Exception as e:
+        logging.error(f"Error quarantining rejected rows: {e}")
+        print(f"Error quarantining rejected rows: {e}")
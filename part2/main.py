@@ -1,158 +1,409 @@
 import logging
-import csv
-from src.database.database_utils import load_config, connect_to_database, close_connection
-import hashlib
-from datetime import datetime
-from faker import Faker
-
-# Initialize Faker generator
-fake = Faker()
+from src.database.database_utils import load_config, pooled_connection, close_all_pools
+from src.database.logging_utils import configure_logging, RateLimitedLog
+from src.database.marts import apply_sales_delta, product_mart_categories, move_product_sales
+from src.database.concurrency import lock_key_ranges, run_with_retry
+from src.database.indexes import build_indexes
+from src.database.load_journal import file_fingerprint, get_checkpoint, save_checkpoint
+from src.database.dead_letter import (quarantine_rows, quarantine_log, fetch_quarantined, mark_reprocessed, LATE_ARRIVING_REASONS,
+                                      MALFORMED_ROW, MISSING_KEY, INVALID_DATE, INVALID_AMOUNT, VALUE_TOO_LONG,
+                                      UNKNOWN_CUSTOMER, UNKNOWN_PRODUCT)
+from src.csv_reader import read_batches, read_batches_parallel
+from src.hash_keys import generate_hash_key, generate_concat_hash
+from src.bloom_filter import load_or_rebuild_filter, find_new_keys
+from src.snapshot_diff import prepare_delta, promote_snapshot, discard_snapshot, snapshot_paths, read_deleted_keys
+from src.profiling import add_profile_argument, profiling_settings, start_profiling, stop_profiling, stage
+import argparse
+import os
+from decimal import Decimal, InvalidOperation
+from operator import itemgetter
+from psycopg2.extras import execute_batch, execute_values
+from datetime import date, datetime
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
+
+# Messages logged per batch; a large file logs the first few and a count of the rest
+batch_log = RateLimitedLog()
+
+# Source file of every table, unless loader.input_files in config.yaml names another one
+INPUT_FILES = {
+    'products_hub': 'data/product_data.csv',
+    'customers_hub': 'data/customer_data.csv',
+    'sales_link': 'data/sales_data.csv',
+}
+
+# Server-side prepared statements of the row path. Parameter types are inferred from the target columns.
+PREPARED_STATEMENTS = {
+    'insert_products_hub': """
+        INSERT INTO products_hub (product_hash_key, product_id) VALUES ($1, $2)
+        ON CONFLICT (product_hash_key) DO NOTHING
+    """,
+    'end_date_products_satellite': """
+        UPDATE products_satellite SET end_date = $1
+        WHERE product_hash_key = $2 AND end_date IS NULL
+    """,
+    'insert_products_satellite': """
+        INSERT INTO products_satellite
+        (product_hash_key, product_name, product_category, product_brand, start_date, end_date, source, hash_diff, load_date)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    """,
+    'insert_customers_hub': """
+        INSERT INTO customers_hub (customer_hash_key, customer_id) VALUES ($1, $2)
+        ON CONFLICT (customer_hash_key) DO NOTHING
+    """,
+    'end_date_customers_satellite': """
+        UPDATE customers_satellite SET end_date = $1
+        WHERE customer_hash_key = $2 AND end_date IS NULL
+    """,
+    'insert_customers_satellite': """
+        INSERT INTO customers_satellite
+        (customer_hash_key, customer_name, customer_email, customer_address, start_date, end_date, source, hash_diff, load_date)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    """,
+    'insert_sales_transactions_satellite': """
+        INSERT INTO sales_transactions_satellite
+        (transaction_hash_key, start_date, end_date, load_date, source, hash_diff)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """,
+}
+
+def prepare_statements(cursor):
+    """Prepare the row path statements once per session."""
+    cursor.execute("SELECT name FROM pg_prepared_statements")
+    prepared = {row[0] for row in cursor.fetchall()}
+    for name, statement in PREPARED_STATEMENTS.items():
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {statement}")
+
+def execute_prepared(cursor, name, params_list, page_size):
+    """Run a prepared statement for every parameter tuple, page_size statements per round trip."""
+    if params_list:
+        placeholders = ', '.join(['%s'] * len(params_list[0]))
+        execute_batch(cursor, f"EXECUTE {name} ({placeholders})", params_list, page_size=page_size)
 
-def generate_hash_key(id):
-    """Generate a hash key using MD5."""
-    return hashlib.md5(str(id).encode()).hexdigest()
+def latest_per_key(rows, key_index=0):
+    """Keep only the last row per business key, preserving file order.
 
-def generate_concat_hash(*fields):
-    """Concatenate fields and generate hash difference."""
-    concatenated_fields = ''.join(str(field) for field in fields)
-    return hashlib.md5(concatenated_fields.encode()).hexdigest()
+    A key repeated within a batch would otherwise get two current satellite rows,
+    because the whole batch is end-dated before any new row is inserted.
+    """
+    latest = {}
+    for row in rows:
+        latest.pop(row[key_index], None)
+        latest[row[key_index]] = row
+    return list(latest.values())
 
-def insert_data_from_csv(csv_file, table_name, conn):
+# Column limits of the vault tables, checked before a row is sent
+MAX_KEY_LENGTH = 255
+MAX_SOURCE_LENGTH = 50
+MAX_AMOUNT = Decimal('1e8')  # NUMERIC(10, 2)
+
+def validate_hub_rows(rows, first_row_number):
+    """Split hub rows into valid rows and rejected (row_number, row, reason_code, reason_detail) tuples."""
+    valid, rejected = [], []
+    for row_number, row in enumerate(rows, first_row_number):
+        if len(row) < 4:
+            rejected.append((row_number, row, MALFORMED_ROW, f"Expected at least 4 fields, got {len(row)}"))
+        elif not row[0].strip():
+            rejected.append((row_number, row, MISSING_KEY, "Empty business key"))
+        elif len(row[0]) > MAX_KEY_LENGTH:
+            rejected.append((row_number, row, VALUE_TOO_LONG, f"Business key longer than {MAX_KEY_LENGTH} characters"))
+        else:
+            valid.append(row)
+    return valid, rejected
+
+def check_sales_row(row):
+    """Return (reason_code, reason_detail) when a sales row cannot be loaded, None otherwise."""
+    if len(row) < 6:
+        return MALFORMED_ROW, f"Expected at least 6 fields, got {len(row)}"
+    transaction_id, customer_id, product_id, transaction_date, transaction_amount, source = row[:6]
+    if not transaction_id.strip() or not customer_id.strip() or not product_id.strip():
+        return MISSING_KEY, "Empty transaction, customer or product ID"
+    if max(len(transaction_id), len(customer_id), len(product_id)) > MAX_KEY_LENGTH:
+        return VALUE_TOO_LONG, f"ID longer than {MAX_KEY_LENGTH} characters"
+    try:
+        date.fromisoformat(transaction_date)
+    except ValueError:
+        return INVALID_DATE, f"Invalid transaction date {transaction_date!r}"
     try:
+        amount = Decimal(transaction_amount)
+    except InvalidOperation:
+        return INVALID_AMOUNT, f"Invalid transaction amount {transaction_amount!r}"
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT:
+        return INVALID_AMOUNT, f"Transaction amount {transaction_amount!r} out of range"
+    if len(source) > MAX_SOURCE_LENGTH:
+        return VALUE_TOO_LONG, f"Source longer than {MAX_SOURCE_LENGTH} characters"
+    return None
+
+def load_products_batch(cursor, rows, page_size, first_row_number=1, hashes=None, lock_prefix_length=None):
+    """Load a batch of product rows into products_hub and products_satellite.
+
+    hashes are the BatchHashes of the rows when a reader process computed them.
+    With lock_prefix_length, the advisory locks of the batch's hash key ranges
+    are taken first, see lock_key_ranges. Returns the rejected rows, see validate_hub_rows.
+    """
+    rows, rejected = validate_hub_rows(rows, first_row_number)
+    hash_key, concat_hash = (hashes.key, hashes.diff) if hashes else (generate_hash_key, generate_concat_hash)
+
+    # Start date is the current date/time (time of load), end date NULL marks the current version
+    start_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    source = "CSV"  # Assuming source is CSV
+    # Each batch stamps its versions itself: the column default is the transaction start, shared by every batch
+    # of a checkpoint, so a key repeated in a later batch would collide with its earlier version
+    load_date = datetime.now()
+
+    hub_params, end_date_params, satellite_params = [], [], []
+    for row in latest_per_key(rows):
+        product_id, product_name, product_category, product_brand = row[0], row[1], row[2], row[3]
+        product_hash_key = hash_key(product_id)
+        hash_diff = concat_hash(product_name, product_category, product_brand)
+
+        hub_params.append((product_hash_key, product_id))
+        end_date_params.append((start_date, product_hash_key))
+        satellite_params.append((product_hash_key, product_name, product_category, product_brand, start_date, None, source, hash_diff,
+                                 load_date))
+
+    # Write in hash key order, the order every loader takes its row locks in
+    hub_params.sort(key=itemgetter(0))
+    end_date_params.sort(key=itemgetter(1))
+    satellite_params.sort(key=itemgetter(0))
+    if lock_prefix_length:
+        lock_key_ranges(cursor, 'products_hub', [params[0] for params in hub_params], lock_prefix_length)
+
+    # The category mart counts the sales of a product under its latest category: hub stubs, e.g. of sales handed
+    # over by the part1 ETL, have none yet, and a changed category moves the product's sales
+    previous_categories = product_mart_categories(cursor, [params[0] for params in hub_params])
+
+    execute_prepared(cursor, 'insert_products_hub', hub_params, page_size)
+    execute_prepared(cursor, 'end_date_products_satellite', end_date_params, page_size)
+    execute_prepared(cursor, 'insert_products_satellite', satellite_params, page_size)
+    move_product_sales(cursor, previous_categories, {params[0]: params[2] for params in satellite_params})
+    return rejected
+
+def load_customers_batch(cursor, rows, page_size, first_row_number=1, hashes=None, lock_prefix_length=None):
+    """Load a batch of customer rows into customers_hub and customers_satellite.
+
+    hashes are the BatchHashes of the rows when a reader process computed them.
+    With lock_prefix_length, the advisory locks of the batch's hash key ranges
+    are taken first, see lock_key_ranges. Returns the rejected rows, see validate_hub_rows.
+    """
+    rows, rejected = validate_hub_rows(rows, first_row_number)
+    hash_key, concat_hash = (hashes.key, hashes.diff) if hashes else (generate_hash_key, generate_concat_hash)
+
+    # Start date is the current date/time (time of load), end date NULL marks the current version
+    start_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    source = "CSV"  # Assuming source is CSV
+    # Each batch stamps its versions itself, see load_products_batch
+    load_date = datetime.now()
+
+    hub_params, end_date_params, satellite_params = [], [], []
+    for row in latest_per_key(rows):
+        customer_id, customer_name, customer_email, customer_address = row[0], row[1], row[2], row[3]
+        customer_hash_key = hash_key(customer_id)
+        hash_diff = concat_hash(customer_name, customer_email, customer_address)
+
+        hub_params.append((customer_hash_key, customer_id))
+        end_date_params.append((start_date, customer_hash_key))
+        satellite_params.append((customer_hash_key, customer_name, customer_email, customer_address, start_date, None, source, hash_diff,
+                                  load_date))
+
+    # Write in hash key order, the order every loader takes its row locks in
+    hub_params.sort(key=itemgetter(0))
+    end_date_params.sort(key=itemgetter(1))
+    satellite_params.sort(key=itemgetter(0))
+    if lock_prefix_length:
+        lock_key_ranges(cursor, 'customers_hub', [params[0] for params in hub_params], lock_prefix_length)
+
+    execute_prepared(cursor, 'insert_customers_hub', hub_params, page_size)
+    execute_prepared(cursor, 'end_date_customers_satellite', end_date_params, page_size)
+    execute_prepared(cursor, 'insert_customers_satellite', satellite_params, page_size)
+    return rejected
+
+def lookup_hash_keys(cursor, hub_table, id_column, hash_key_column, business_keys):
+    """Fetch the hash keys of a set of business keys from a hub in one round trip."""
+    cursor.execute(f"SELECT {id_column}, {hash_key_column} FROM {hub_table} WHERE {id_column} = ANY(%s)",
+                   (list(set(business_keys)),))
+    return dict(cursor.fetchall())
+
+def load_sales_batch(cursor, rows, page_size, first_row_number=1, dedup_filter=None, hashes=None):
+    """Load a batch of sales rows into sales_link and sales_transactions_satellite.
+
+    Rows that fail validation or reference an unknown customer or product are
+    rejected instead of failing the batch. With a dedup_filter of the loaded
+    transaction keys, transactions repeated in the batch or already loaded are
+    dropped before the hub lookups. Returns (new_transaction_keys, rejected):
+    the hash keys of the transactions actually inserted, and the rejected
+    (row_number, row, reason_code, reason_detail) tuples. hashes are the
+    BatchHashes of the rows when a reader process computed them.
+    """
+    hash_key, concat_hash = (hashes.key, hashes.diff) if hashes else (generate_hash_key, generate_concat_hash)
+    load_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    rejected = []
+    numbered_rows = []
+    for row_number, row in enumerate(rows, first_row_number):
+        reason = check_sales_row(row)
+        if reason:
+            rejected.append((row_number, row) + reason)
+        else:
+            numbered_rows.append((row_number, row))
+
+    # Drop duplicates before any further I/O; only filter positives cost a lookup
+    if dedup_filter is not None and numbered_rows:
+        flags = find_new_keys(dedup_filter, cursor, [hash_key(row[0]) for _, row in numbered_rows])
+        duplicates = len(flags) - sum(flags)
+        numbered_rows = [numbered_row for numbered_row, is_new in zip(numbered_rows, flags) if is_new]
+        if duplicates:
+            batch_log.log('duplicates dropped', f"Dropped {duplicates} transactions repeated in the batch or already in sales_link.",
+                          counts={'transactions': duplicates})
+
+    # Resolve the referenced hubs for the whole batch at once
+    customer_keys = lookup_hash_keys(cursor, 'customers_hub', 'customer_id', 'customer_hash_key', [row[1] for _, row in numbered_rows])
+    product_keys = lookup_hash_keys(cursor, 'products_hub', 'product_id', 'product_hash_key', [row[2] for _, row in numbered_rows])
+
+    link_params = []
+    satellite_params = {}
+    for row_number, row in numbered_rows:
+        transaction_id, customer_id, product_id, transaction_date, transaction_amount, source = row[:6]
+
+        # The hub row may still arrive with a later load, so keep the row for reprocessing
+        if customer_id not in customer_keys:
+            rejected.append((row_number, row, UNKNOWN_CUSTOMER, f"Customer with ID {customer_id} does not exist in customers_hub table."))
+            continue
+        if product_id not in product_keys:
+            rejected.append((row_number, row, UNKNOWN_PRODUCT, f"Product with ID {product_id} does not exist in products_hub table."))
+            continue
+
+        # Generate hash keys
+        transaction_hash_key = hash_key(transaction_id)
+        link_params.append((transaction_hash_key, customer_keys[customer_id], product_keys[product_id],
+                            transaction_date, transaction_amount, load_date, source))
+        hash_diff = concat_hash(transaction_date, source)
+        satellite_params[transaction_hash_key] = (transaction_hash_key, load_date, None, load_date, source, hash_diff)
+
+    if not link_params:
+        return [], rejected
+    # Insert in hash key order, like the hub loads
+    link_params.sort(key=itemgetter(0))
+
+    # Multi-row insert; RETURNING tells which transactions were new and which already existed
+    inserted = execute_values(cursor, """
+        INSERT INTO sales_link
+        (transaction_hash_key, customer_hash_key, product_hash_key, transaction_date, transaction_amount, load_date, source)
+        VALUES %s
+        ON CONFLICT (transaction_hash_key) DO NOTHING
+        RETURNING transaction_hash_key
+    """, link_params, page_size=page_size, fetch=True)
+    new_transaction_keys = [row[0] for row in inserted]
+    if dedup_filter is not None:
+        for key in new_transaction_keys:
+            dedup_filter.add(key)
+
+    # Only new transactions get a satellite row; replayed ones already have theirs
+    execute_prepared(cursor, 'insert_sales_transactions_satellite',
+                     [satellite_params[key] for key in new_transaction_keys], page_size)
+
+    if len(new_transaction_keys) < len(link_params):
+        batch_log.log('transactions skipped', f"Skipped {len(link_params) - len(new_transaction_keys)} transactions already in sales_link.",
+                      counts={'transactions': len(link_params) - len(new_transaction_keys)})
+    return new_transaction_keys, rejected
+
+def apply_marts(cursor, new_transaction_keys):
+    """Fold a batch delta into the aggregate marts within the load's transaction."""
+    if new_transaction_keys:
+        touched_marts = apply_sales_delta(cursor, new_transaction_keys)
+        batch_log.log('marts', f"Batch of {len(new_transaction_keys)} new transactions touched marts: {touched_marts}",
+                      counts={'new transactions': len(new_transaction_keys)})
+
+def load_batch(cursor, table_name, csv_file, batch, page_size, first_row_number, dedup_filter=None, hashes=None,
+               lock_prefix_length=None):
+    """Load one batch of rows into table_name and quarantine the rows that cannot be loaded."""
+    if table_name == 'products_hub':
+        rejected = load_products_batch(cursor, batch, page_size, first_row_number, hashes, lock_prefix_length)
+
+    elif table_name == 'customers_hub':
+        rejected = load_customers_batch(cursor, batch, page_size, first_row_number, hashes, lock_prefix_length)
+
+    elif table_name == 'sales_link':
+        new_transaction_keys, rejected = load_sales_batch(cursor, batch, page_size, first_row_number, dedup_filter, hashes)
+        apply_marts(cursor, new_transaction_keys)
+
+    # Quarantined rows commit with the checkpoint, so a resumed load does not record them twice
+    quarantine_rows(cursor, table_name, csv_file, rejected, page_size)
+
+def insert_data_from_csv(csv_file, table_name, conn, batch_size=1000, page_size=100, checkpoint_rows=10000,
+                         dedup_filter=None, read_workers=0, concurrency=None):
+    """Load a CSV file batch by batch through prepared statements.
+
+    Each batch of per-row hub, satellite and link statements is sent in pages
+    of page_size statements, so a batch costs a handful of round trips.
+    Every checkpoint_rows rows the work is committed together with its position
+    in load_journal; a restarted load resumes from the last checkpoint, and a
+    file already loaded completely is skipped. Rows that cannot be loaded are
+    quarantined in load_dead_letter and the rest of the batch goes on.
+    Sales rows are checked against dedup_filter, see load_sales_batch.
+    With read_workers, the file is parsed and hashed by that many reader
+    processes while this one loads, see read_batches_parallel.
+    With the concurrency config enabled, for loaders running at the same
+    time, every batch is a checkpointed transaction of its own: hub batches
+    take the advisory locks of their hash key ranges, and a batch that hits a
+    deadlock or serialization failure is rolled back and run again.
+    """
+    concurrency = concurrency or {}
+    lock_prefix_length = concurrency.get('lock_prefix_length', 2) if concurrency.get('enabled') else None
+    max_retries = concurrency.get('max_retries', 5)
+    try:
+        if table_name not in ('products_hub', 'customers_hub', 'sales_link'):
+            logging.error("Unknown table name.")
+            print("Unknown table name.")
+            return
+
         cursor = conn.cursor()
-        with open(csv_file, 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if table_name == 'products_hub':
-                    product_id = row[0]
-                    product_hash_key = generate_hash_key(product_id)
-                    insert_query = f"INSERT INTO {table_name} (product_hash_key, product_id) VALUES (%s, %s) ON CONFLICT (product_hash_key) DO NOTHING"
-                    cursor.execute(insert_query, (product_hash_key, product_id))
-                    
-                    # Insert into products_satellite table
-                    product_name = row[1]
-                    product_category = row[2]
-                    product_brand = row[3]
-                    # Start date is the current date/time (time of load)
-                    start_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    # End date is NULL to indicate current validity
-                    end_date = None
-                    source = "CSV"  # Assuming source is CSV
-                    # Calculate hash difference
-                    hash_diff = generate_concat_hash(product_name, product_category, product_brand)
-                    
-                    # Update end date of existing record if product ID already exists
-                    update_query = f"""
-                        UPDATE products_satellite 
-                        SET end_date = %s
-                        WHERE product_hash_key = %s AND end_date IS NULL
-                    """
-                    cursor.execute(update_query, (start_date, product_hash_key))
-                    
-                    # Insert new record into products_satellite
-                    insert_query_satellite = f"""
-                        INSERT INTO products_satellite 
-                        (product_hash_key, product_name, product_category, product_brand, start_date, end_date, source, hash_diff) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(insert_query_satellite, (product_hash_key, product_name, product_category, product_brand, start_date, end_date, source, hash_diff))
-
-                elif table_name == 'customers_hub':
-                    customer_id = row[0]
-                    customer_hash_key = generate_hash_key(customer_id)
-                    
-
-                    # Insert into customers_hub table
-                    insert_query_hub = f"INSERT INTO {table_name} (customer_hash_key, customer_id) VALUES (%s, %s) ON CONFLICT (customer_hash_key) DO NOTHING"
-                    cursor.execute(insert_query_hub, (customer_hash_key, customer_id))
-                    
-                    # Insert into customers_satellite table
-                    customer_name = row[1]
-                    customer_email = row[2]
-                    customer_address = row[3]
-                    # Start date is the current date/time (time of load)
-                    start_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    # End date is NULL to indicate current validity
-                    end_date = None
-                    source = "CSV"  # Assuming source is CSV
-                    hash_diff = generate_concat_hash(customer_name, customer_email, customer_address)
-                    
-                    # Update end date of existing record if customer ID already exists
-                    update_query = f"""
-                        UPDATE customers_satellite 
-                        SET end_date = %s
-                        WHERE customer_hash_key = %s AND end_date IS NULL
-                    """
-                    cursor.execute(update_query, (start_date, customer_hash_key))
-
-                    # Insert new record into customers_satellite
-                    insert_query_satellite = f"""
-                        INSERT INTO customers_satellite 
-                        (customer_hash_key, customer_name, customer_email, customer_address, start_date, end_date, source, hash_diff) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(insert_query_satellite, (customer_hash_key, customer_name, customer_email, customer_address, start_date, end_date, source, hash_diff))
-
-                elif table_name == 'sales_link':
-                    transaction_id = row[0]
-                    customer_id = row[1]
-                    product_id = row[2]
-                    transaction_date = row[3]
-                    transaction_amount = row[4]
-                    source = row[5]
-                    load_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-                    # Generate hash keys
-                    transaction_hash_key = generate_hash_key(transaction_id)
-                    
-                    # Fetch existing customer_hash_key from customers_hub
-                    cursor.execute(f"SELECT customer_hash_key FROM customers_hub WHERE customer_id = %s", (customer_id,))
-                    customer_result = cursor.fetchone()
-                    if customer_result:
-                        customer_hash_key = customer_result[0]
-                    else:
-                        logging.error(f"Customer with ID {customer_id} does not exist in customers_hub table.")
-                        print(f"Customer with ID {customer_id} does not exist in customers_hub table.")
-                        return
-
-                    # Fetch existing product_hash_key from products_hub
-                    cursor.execute(f"SELECT product_hash_key FROM products_hub WHERE product_id = %s", (product_id,))
-                    product_result = cursor.fetchone()
-                    if product_result:
-                        product_hash_key = product_result[0]
-                    else:
-                        logging.error(f"Product with ID {product_id} does not exist in products_hub table.")
-                        print(f"Product with ID {product_id} does not exist in products_hub table.")
-                        return
-
-                    # Insert into sales_link table
-                    insert_query_link = """
-                        INSERT INTO sales_link 
-                        (transaction_hash_key, customer_hash_key, product_hash_key, transaction_date, transaction_amount, load_date, source) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (transaction_hash_key) DO NOTHING
-                    """
-                    
-                    cursor.execute(insert_query_link, (transaction_hash_key, customer_hash_key, product_hash_key, transaction_date, transaction_amount, load_date, source))
-
-                    # Insert into sales_transactions_satellite table
-                    start_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    end_date = None
-                    hash_diff = generate_concat_hash(transaction_date, source)
-                    insert_query_satellite = """
-                        INSERT INTO sales_transactions_satellite 
-                        (transaction_hash_key, start_date, end_date, load_date, source, hash_diff) 
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """
-                    cursor.execute(insert_query_satellite, (transaction_hash_key, start_date, end_date, load_date, source, hash_diff))
-
-                else:
-                    logging.error("Unknown table name.")
-                    print("Unknown table name.")
-                    
+        prepare_statements(cursor)
+
+        # Resume from the last checkpoint of this version of the file
+        fingerprint = file_fingerprint(csv_file)
+        byte_offset, row_number, completed = get_checkpoint(cursor, table_name, csv_file, fingerprint)
+        if completed:
+            logging.info(f"Data from {csv_file} already loaded into {table_name}, skipping.")
+            print(f"Data from {csv_file} already loaded into {table_name}, skipping.")
+            conn.rollback()
+            cursor.close()
+            return
+        if byte_offset:
+            logging.info(f"Resuming {csv_file} into {table_name} at row {row_number} (byte {byte_offset}).")
+            print(f"Resuming {csv_file} into {table_name} at row {row_number} (byte {byte_offset}).")
+
+        rows_since_checkpoint = 0
+        end_offset = byte_offset
+        if read_workers:
+            batches = read_batches_parallel(csv_file, table_name, batch_size, byte_offset, read_workers)
+        else:
+            batches = ((batch, offset, None) for batch, offset in read_batches(csv_file, batch_size, byte_offset))
+        for batch, end_offset, hashes in batches:
+            if concurrency.get('enabled'):
+                # Short transactions hold the range locks briefly; a retry replays only this batch
+                def load_and_checkpoint():
+                    load_batch(cursor, table_name, csv_file, batch, page_size, row_number + 1, dedup_filter, hashes,
+                               lock_prefix_length)
+                    save_checkpoint(cursor, table_name, csv_file, fingerprint, end_offset, row_number + len(batch))
+                run_with_retry(conn, load_and_checkpoint, max_retries)
+                row_number += len(batch)
+                continue
+
+            load_batch(cursor, table_name, csv_file, batch, page_size, row_number + 1, dedup_filter, hashes)
+            row_number += len(batch)
+            rows_since_checkpoint += len(batch)
+
+            # Commit the rows together with the position they reach
+            if rows_since_checkpoint >= checkpoint_rows:
+                save_checkpoint(cursor, table_name, csv_file, fingerprint, end_offset, row_number)
+                conn.commit()
+                rows_since_checkpoint = 0
+                logging.info(f"Checkpoint: {row_number} rows of {csv_file} loaded into {table_name}.")
+
+        save_checkpoint(cursor, table_name, csv_file, fingerprint, end_offset, row_number, completed=True)
         conn.commit()
         cursor.close()
         logging.info(f"Data from {csv_file} inserted into {table_name} successfully!")
@@ -160,24 +411,225 @@ def insert_data_from_csv(csv_file, table_name, conn):
     except Exception as e:
         logging.error(f"Error inserting data into {table_name}: {e}")
         print(f"Error inserting data into {table_name}: {e}")
+        conn.rollback()
+    finally:
+        # Count the per-batch messages left out of the log
+        batch_log.summary()
+        quarantine_log.summary()
+
+def end_date_deleted_keys(cursor, table_name, deleted_file, page_size=100):
+    """End-date the current satellite rows of the business keys deleted from a hub's source.
+
+    The hub rows stay: a Data Vault keeps every key it has seen.
+    """
+    end_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    statement = f"end_date_{table_name.replace('_hub', '_satellite')}"
+    deleted = 0
+    for keys in read_deleted_keys(deleted_file):
+        execute_prepared(cursor, statement, sorted(((end_date, generate_hash_key(key)) for key in keys), key=itemgetter(1)),
+                         page_size)
+        deleted += len(keys)
+    if deleted:
+        logging.info(f"End-dated the current satellite rows of {deleted} keys deleted from {table_name}.")
+        print(f"End-dated the current satellite rows of {deleted} keys deleted from {table_name}.")
+
+def previous_snapshot_recorded(conn, table_name, previous_file):
+    """Whether load_journal records previous_file, in its current version, as the last snapshot loaded into table_name."""
+    if not os.path.exists(previous_file):
+        return True
+    cursor = conn.cursor()
+    _, _, completed = get_checkpoint(cursor, table_name, previous_file, file_fingerprint(previous_file))
+    conn.commit()
+    cursor.close()
+    if not completed:
+        logging.warning(f"The vault has no record of loading {previous_file}; loading the full snapshot instead.")
+        print(f"The vault has no record of loading {previous_file}; loading the full snapshot instead.")
+    return completed
+
+def load_snapshot(csv_file, table_name, conn, batch_size=1000, page_size=100, checkpoint_rows=10000, snapshot_config=None,
+                  read_workers=0, concurrency=None):
+    """Load a full snapshot of a hub's source file.
+
+    With snapshots enabled, the file is diffed against the previous snapshot
+    loaded and only the inserted and changed rows are loaded; the satellites
+    of deleted keys are end-dated. The snapshot becomes the previous one once
+    its delta is completely loaded; it is recorded in load_journal, and a
+    previous snapshot the vault has no record of, e.g. after a reset or a
+    restore, is discarded for a full load.
+    """
+    snapshot_config = snapshot_config or {}
+    if not snapshot_config.get('enabled'):
+        insert_data_from_csv(csv_file, table_name, conn, batch_size, page_size, checkpoint_rows, read_workers=read_workers,
+                             concurrency=concurrency)
+        return
+
+    snapshot_dir = snapshot_config.get('directory', 'data/snapshots')
+    if not previous_snapshot_recorded(conn, table_name, snapshot_paths(csv_file, snapshot_dir)['previous']):
+        discard_snapshot(csv_file, snapshot_dir)
+    delta_file, deleted_file = prepare_delta(csv_file, snapshot_dir, snapshot_config.get('partitions', 16))
+    insert_data_from_csv(delta_file, table_name, conn, batch_size, page_size, checkpoint_rows, read_workers=read_workers,
+                         concurrency=concurrency)
+
+    try:
+        cursor = conn.cursor()
+        _, _, completed = get_checkpoint(cursor, table_name, delta_file, file_fingerprint(delta_file))
+        if not completed:
+            conn.rollback()
+            return
+        if deleted_file:
+            prepare_statements(cursor)
+            end_date_deleted_keys(cursor, table_name, deleted_file, page_size)
+        conn.commit()
+
+        # Record the promoted snapshot, so the next diff only trusts it while the vault holds its load
+        previous_file = promote_snapshot(csv_file, snapshot_dir)
+        save_checkpoint(cursor, table_name, previous_file, file_fingerprint(previous_file), 0, 0, completed=True)
+        conn.commit()
+        cursor.close()
+    except Exception as e:
+        logging.error(f"Error applying the snapshot delta of {csv_file}: {e}")
+        print(f"Error applying the snapshot delta of {csv_file}: {e}")
+        conn.rollback()
+
+def create_hub_stubs(cursor, rows, page_size=100):
+    """Insert hub rows holding only the business key for the customers and products the rows reference.
+
+    A later hub load adds their satellites, as ON CONFLICT keeps the stubs.
+    """
+    for hub_table, hash_key_column, id_column, index in (('customers_hub', 'customer_hash_key', 'customer_id', 1),
+                                                         ('products_hub', 'product_hash_key', 'product_id', 2)):
+        hub_rows = sorted((generate_hash_key(key), key) for key in {row[index] for row in rows})
+        execute_values(cursor, f"""
+            INSERT INTO {hub_table} ({hash_key_column}, {id_column}) VALUES %s
+            ON CONFLICT ({hash_key_column}) DO NOTHING
+        """, hub_rows, page_size=page_size)
 
-try:
-    # Load configuration and connect to the database
-    config = load_config("src/database/config.yaml")
-    connection = connect_to_database(config)
+def reprocess_quarantined(conn, batch_size=1000, page_size=100, hub_stubs=False):
+    """Retry the quarantined sales rows whose customer or product was unknown.
+
+    Rows whose hub row has arrived since are loaded and marked reprocessed; the
+    others stay pending. With hub_stubs, the missing hub rows are created first.
+    """
+    try:
+        cursor = conn.cursor()
+        prepare_statements(cursor)
+        entries = fetch_quarantined(cursor, 'sales_link', LATE_ARRIVING_REASONS)
 
-    # Insert data into products_hub
-    insert_data_from_csv('data/product_data.csv', 'products_hub', connection)
+        reprocessed = 0
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            rows = [list(raw_row) for _, _, raw_row in batch]
+            if hub_stubs:
+                create_hub_stubs(cursor, rows, page_size)
 
-    # Insert data into customers_hub
-    insert_data_from_csv('data/customer_data.csv', 'customers_hub', connection)
+            # Number the rows by their position in the batch to match the rejects back to their entries
+            new_transaction_keys, rejected = load_sales_batch(cursor, rows, page_size, 0)
+            apply_marts(cursor, new_transaction_keys)
+            still_rejected = {position for position, _, _, _ in rejected}
+            accepted_ids = [entry[0] for position, entry in enumerate(batch) if position not in still_rejected]
+            mark_reprocessed(cursor, accepted_ids)
+            conn.commit()
+            reprocessed += len(accepted_ids)
 
-    # Insert data into sales_link
-    insert_data_from_csv('data/sales_data.csv', 'sales_link', connection)
+        cursor.close()
+        logging.info(f"Reprocessed {reprocessed} of {len(entries)} quarantined sales rows.")
+        print(f"Reprocessed {reprocessed} of {len(entries)} quarantined sales rows.")
+        batch_log.summary()
+    except Exception as e:
+        logging.error(f"Error reprocessing quarantined rows: {e}")
+        print(f"Error reprocessing quarantined rows: {e}")
+        conn.rollback()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the CSV files into the Data Vault.")
+    parser.add_argument('--reprocess-quarantine', action='store_true',
+                        help='Only retry the quarantined sales rows whose customer or product was unknown.')
+    parser.add_argument('--create-hub-stubs', action='store_true',
+                        help='With --reprocess-quarantine, create the missing hub rows first.')
+    parser.add_argument('--file', help='Only load this CSV file, e.g. as one of several loaders run at the same time.')
+    parser.add_argument('--table', choices=['products_hub', 'customers_hub', 'sales_link'],
+                        help='With --file, the table the file is loaded into.')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Use the write mode for concurrent loaders, as with concurrency.enabled in config.yaml.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    if args.file and not args.table:
+        parser.error("--file needs --table")
+
+    try:
+        # Load configuration and check a bulk-load tuned connection out of the pool
+        config = load_config("src/database/config.yaml")
+        loader_config = config.get('loader') or {}
+        batch_size = loader_config.get('batch_size', 1000)
+        page_size = loader_config.get('page_size', 100)
+        checkpoint_rows = loader_config.get('checkpoint_rows', 10000)
+        read_workers = loader_config.get('read_workers', 0)
+        input_files = {**INPUT_FILES, **(loader_config.get('input_files') or {})}
+        concurrency = dict(config.get('concurrency') or {})
+        if args.concurrent:
+            concurrency['enabled'] = True
+
+        # Profile the stages of the load; without --profile the stages run as they are
+        if args.profile:
+            start_profiling(profiling_settings(args.profile, config.get('profiling')))
+        with pooled_connection(config, 'bulk_load') as connection:
+
+            if args.reprocess_quarantine:
+                # Only retry the quarantined rows
+                with stage('reprocess_quarantined'):
+                    reprocess_quarantined(connection, batch_size, page_size, args.create_hub_stubs)
+            elif args.file:
+                # Only load the given file; the indexes and the export are left to a full load
+                with stage(f"insert_data_from_csv.{args.table}"):
+                    insert_data_from_csv(args.file, args.table, connection, batch_size, page_size, checkpoint_rows,
+                                         read_workers=read_workers, concurrency=concurrency)
+            else:
+                # Insert data into products_hub, only what changed since the previous snapshot
+                snapshot_config = config.get('snapshots') or {}
+                with stage('load_snapshot.products_hub'):
+                    load_snapshot(input_files['products_hub'], 'products_hub', connection, batch_size, page_size,
+                                  checkpoint_rows, snapshot_config, read_workers, concurrency)
+
+                # Insert data into customers_hub, only what changed since the previous snapshot
+                with stage('load_snapshot.customers_hub'):
+                    load_snapshot(input_files['customers_hub'], 'customers_hub', connection, batch_size, page_size,
+                                  checkpoint_rows, snapshot_config, read_workers, concurrency)
+
+                # Build the hub indexes before the sales load probes the hubs by business key
+                with stage('build_indexes.hubs'):
+                    build_indexes(connection, tables=['customers_hub', 'products_hub'])
+
+                # Load the filter of the transactions already loaded, to drop duplicates before they reach the database
+                dedup_config = config.get('dedup') or {}
+                dedup_filter = load_or_rebuild_filter(connection, dedup_config) if dedup_config.get('enabled') else None
+
+                # Insert data into sales_link
+                with stage('insert_data_from_csv.sales_link'):
+                    insert_data_from_csv(input_files['sales_link'], 'sales_link', connection, batch_size, page_size,
+                                         checkpoint_rows, dedup_filter, read_workers, concurrency)
+                if dedup_filter is not None:
+                    dedup_filter.save(dedup_config['filter_file'])
+
+                # Build the remaining indexes now that the bulk load is done
+                with stage('build_indexes'):
+                    build_indexes(connection)
+
+        # Refresh the columnar export the reports can be run on without this database
+        analytics_config = config.get('analytics') or {}
+        if analytics_config.get('export_after_load') and not args.file:
+            from src.analytics import export_vault
+            with stage('export_vault'), pooled_connection(config, 'reporting') as connection:
+                export_vault(connection, analytics_config.get('directory', 'data/analytics'),
+                             analytics_config.get('batch_size', 10000))
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
 
-    # Close the database connection
-    close_connection(connection)
+    finally:
+        # Close the pooled database connections, also after a failed step
+        close_all_pools()
+        stop_profiling()
 
-except Exception as e:
-    logging.error(f"An error occurred: {e}")
-    print(f"An error occurred: {e}")
+if __name__ == "__main__":
+    main()
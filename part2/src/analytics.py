@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+try:
+    from database.database_utils import load_config, pooled_connection, close_all_pools
+    from database.logging_utils import configure_logging
+    from database.workload import parse_queries
+except ImportError:
+    from src.database.database_utils import load_config, pooled_connection, close_all_pools
+    from src.database.logging_utils import configure_logging
+    from src.database.workload import parse_queries
+
+# pyarrow is optional: it is needed to write the Parquet export
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# DuckDB is optional: it is needed for the embedded query mode
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# Tables of the export and the rows exported of each; satellites keep their current rows only
+EXPORT_TABLES = {
+    'customers_hub': "SELECT * FROM customers_hub",
+    'products_hub': "SELECT * FROM products_hub",
+    'customers_satellite': "SELECT * FROM customers_satellite WHERE end_date IS NULL",
+    'products_satellite': "SELECT * FROM products_satellite WHERE end_date IS NULL",
+    'sales_transactions_satellite': "SELECT * FROM sales_transactions_satellite WHERE end_date IS NULL",
+    'mart_sales_by_source': "SELECT * FROM mart_sales_by_source",
+    'mart_sales_by_category': "SELECT * FROM mart_sales_by_category",
+    'mart_sales_by_customer': "SELECT * FROM mart_sales_by_customer",
+    'mart_sales_by_month': "SELECT * FROM mart_sales_by_month",
+}
+
+# sales_link is exported per month of transaction_date, into <directory>/sales_link/period=YYYY-MM
+LINK_TABLE = 'sales_link'
+NO_PERIOD = 'none'
+
+# Arrow types of the PostgreSQL column types, by type OID
+ARROW_TYPES = {
+    16: lambda: pa.bool_(),
+    20: lambda: pa.int64(),
+    21: lambda: pa.int16(),
+    23: lambda: pa.int32(),
+    25: lambda: pa.string(),
+    700: lambda: pa.float32(),
+    701: lambda: pa.float64(),
+    1043: lambda: pa.string(),
+    1082: lambda: pa.date32(),
+    1114: lambda: pa.timestamp('us'),
+    1184: lambda: pa.timestamp('us', tz='UTC'),
+}
+NUMERIC_OID = 1700
+
+def arrow_schema(description):
+    """Arrow schema of a cursor description; NUMERIC(p, s) keeps its precision as decimal128."""
+    fields = []
+    for column in description:
+        if column.type_code == NUMERIC_OID:
+            if column.precision and column.scale is not None:
+                arrow_type = pa.decimal128(column.precision, column.scale)
+            else:
+                arrow_type = pa.float64()
+        else:
+            arrow_type = ARROW_TYPES.get(column.type_code, lambda: pa.string())()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def export_query(conn, sql, params, path, batch_size=10000, cursor_name='analytics_export'):
+    """Stream the rows of a query to a Parquet file, one row group per batch.
+
+    Rows come through a named server-side cursor, so one batch is held
+    client-side at a time. The file is written next to path and renamed into
+    place, so readers never see half a file. Returns the number of rows.
+    """
+    rows_written = 0
+    temp_path = f"{path}.tmp"
+    cursor = conn.cursor(name=cursor_name)
+    cursor.itersize = batch_size
+    writer = None
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if writer is None:
+                # The description of a named cursor is known after the first fetch
+                schema = arrow_schema(cursor.description)
+                writer = pq.ParquetWriter(temp_path, schema, compression='zstd')
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                     for column, field in zip(columns, schema)], schema=schema))
+            rows_written += len(rows)
+    finally:
+        cursor.close()
+        if writer is not None:
+            writer.close()
+    os.replace(temp_path, path)
+    return rows_written
+
+def period_bounds(period):
+    """First day of the month of a YYYY-MM period and of the month after it."""
+    first = date.fromisoformat(f"{period}-01")
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first, following
+
+def changed_periods(cursor, snapshot_xmin=None):
+    """Months of transaction_date with sales_link rows a previous export may not have seen (all months when None).
+
+    snapshot_xmin is the oldest transaction still running when the previous
+    export took its snapshot. Every row that export could not see was written
+    by that transaction or a later one, so the rows whose xmin is not older are
+    exported again; load_date is no such watermark, as a load stamps its rows
+    when it starts and may commit after an export that saw later stamps.
+    """
+    where = "WHERE age(xmin) <= age(%s::text::xid)" if snapshot_xmin is not None else ""
+    cursor.execute(f"""
+        SELECT DISTINCT COALESCE(to_char(transaction_date, 'YYYY-MM'), %s)
+        FROM sales_link
+        {where}
+    """, [NO_PERIOD] + ([snapshot_xmin] if snapshot_xmin is not None else []))
+    return sorted(row[0] for row in cursor.fetchall())
+
+def export_link_period(conn, directory, period, batch_size):
+    """Rewrite the Parquet partition of one month of sales_link; returns the number of rows."""
+    partition_dir = os.path.join(directory, LINK_TABLE, f"period={period}")
+    os.makedirs(partition_dir, exist_ok=True)
+    if period == NO_PERIOD:
+        sql, params = "SELECT * FROM sales_link WHERE transaction_date IS NULL", []
+    else:
+        sql, params = "SELECT * FROM sales_link WHERE transaction_date >= %s AND transaction_date < %s", list(period_bounds(period))
+    return export_query(conn, sql, params, os.path.join(partition_dir, 'part-0.parquet'), batch_size)
+
+def load_manifest(directory):
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, 'manifest.json')
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def export_vault(conn, directory='data/analytics', batch_size=10000, full=False):
+    """Export the vault to Parquet files under directory for the embedded query mode.
+
+    Hubs, marts and the current satellite rows are rewritten on every export.
+    sales_link is partitioned by month of transaction_date and only the months
+    that received rows the previous export did not see are rewritten; the
+    oldest transaction running at its snapshot is kept in manifest.json, see
+    changed_periods. full rewrites every month, as does an export after the
+    vault was emptied or one without a recorded snapshot.
+    """
+    if pa is None:
+        raise RuntimeError("The analytics export needs pyarrow (pip install pyarrow).")
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    counts = {}
+
+    # Read every table from the same snapshot of the database
+    cursor = conn.cursor()
+    if conn.info.transaction_status == TRANSACTION_STATUS_IDLE:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    cursor.execute("SELECT MAX(load_date) FROM sales_link")
+    loaded_until = cursor.fetchone()[0]
+    # xid8 of the oldest transaction still running, as the 32-bit xid the xmin column holds
+    cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint % 4294967296")
+    snapshot_xmin = cursor.fetchone()[0]
+    previous = manifest.get('sales_link_loaded_until')
+    previous = datetime.fromisoformat(previous) if previous else None
+    previous_xmin = manifest.get('sales_link_snapshot_xmin')
+
+    # Start over when asked, on the first export or when the vault was emptied since the previous one
+    if full or previous is None or previous_xmin is None or loaded_until is None or loaded_until < previous:
+        shutil.rmtree(os.path.join(directory, LINK_TABLE), ignore_errors=True)
+        periods = changed_periods(cursor)
+    else:
+        periods = changed_periods(cursor, previous_xmin)
+    cursor.close()
+
+    for table_name, sql in EXPORT_TABLES.items():
+        counts[table_name] = export_query(conn, sql, [], os.path.join(directory, f"{table_name}.parquet"), batch_size)
+
+    counts[LINK_TABLE] = 0
+    for period in periods:
+        counts[LINK_TABLE] += export_link_period(conn, directory, period, batch_size)
+    conn.commit()
+
+    manifest['sales_link_loaded_until'] = loaded_until.isoformat() if loaded_until else None
+    manifest['sales_link_snapshot_xmin'] = snapshot_xmin
+    manifest['exported_at'] = datetime.now().isoformat()
+    save_manifest(directory, manifest)
+
+    logging.info(f"Exported the vault to {directory} in {time.perf_counter() - start:.2f}s "
+                 f"({len(periods)} sales_link months rewritten): {counts}")
+    print(f"Exported the vault to {directory} in {time.perf_counter() - start:.2f}s "
+          f"({len(periods)} sales_link months rewritten): {counts}")
+    return counts
+
+def open_analytics(directory='data/analytics'):
+    """Open an in-process DuckDB database with a view over the Parquet files of every exported table.
+
+    The views carry the names of the vault tables, so the queries of
+    sample_queries.sql run unchanged.
+    """
+    if duckdb is None:
+        raise RuntimeError("The embedded query mode needs DuckDB (pip install duckdb).")
+    database = duckdb.connect()
+    for table_name in list(EXPORT_TABLES) + [LINK_TABLE]:
+        if table_name == LINK_TABLE:
+            pattern = os.path.join(directory, LINK_TABLE, '*', '*.parquet')
+        else:
+            pattern = os.path.join(directory, f"{table_name}.parquet")
+        if database.execute("SELECT COUNT(*) FROM glob(?)", [pattern]).fetchone()[0]:
+            database.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = false)")
+    return database
+
+def run_reports(directory='data/analytics', query_file='src/sample_queries.sql', show_rows=10):
+    """Run the queries of query_file over the exported files; returns [(name, rows, milliseconds)].
+
+    Queries on PostgreSQL catalogs or on tables missing from the export are skipped.
+    """
+    database = open_analytics(directory)
+    results = []
+    for name, sql in parse_queries(query_file):
+        start = time.perf_counter()
+        try:
+            rows = database.execute(sql).fetchall()
+        except duckdb.Error as e:
+            logging.info(f"Skipped query '{name}': {e}")
+            print(f"-- {name}: skipped ({str(e).splitlines()[0]})")
+            continue
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        results.append((name, len(rows), elapsed_ms))
+        print(f"-- {name}: {len(rows)} rows in {elapsed_ms:.1f} ms")
+        for row in rows[:show_rows]:
+            print(row)
+    database.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar export of the vault and embedded report queries over it.")
+    parser.add_argument('action', choices=['export', 'query'],
+                        help='export: write the vault to Parquet; query: run the reports over the Parquet files.')
+    parser.add_argument('--full', action='store_true', help='With export, rewrite every month of sales_link.')
+    parser.add_argument('--queries', default='src/sample_queries.sql', help='With query, the SQL file to run.')
+    parser.add_argument('--show-rows', type=int, default=10, help='With query, result rows printed per query.')
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        analytics_config = config.get('analytics') or {}
+        directory = analytics_config.get('directory', 'data/analytics')
+        if args.action == 'export':
+            with pooled_connection(config, 'reporting') as connection:
+                export_vault(connection, directory, analytics_config.get('batch_size', 10000), args.full)
+            close_all_pools()
+        else:
+            run_reports(directory, args.queries, args.show_rows)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import csv
+import io
+import mmap
+import os
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+try:
+    from hash_keys import hash_rows, BatchHashes, HASHED_COLUMNS
+    from compressed_input import compression_of, open_input
+except ImportError:
+    from src.hash_keys import hash_rows, BatchHashes, HASHED_COLUMNS
+    from src.compressed_input import compression_of, open_input
+
+class OffsetTrackingLines:
+    """Iterate the decoded lines of a file while tracking the byte offset consumed.
+
+    csv.reader pulls lines one at a time until a record is complete, so after
+    it yields a row, offset is the byte position right behind that row, also
+    for quoted fields spanning several lines.
+    """
+
+    def __init__(self, file, offset=0, encoding='utf-8'):
+        self.file = file
+        self.offset = offset
+        self.encoding = encoding
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+def read_batches(csv_file, batch_size, start_offset=0):
+    """Read a CSV file in batches of rows, starting at a byte offset.
+
+    Yields (rows, end_offset) tuples, where end_offset is the byte position
+    right behind the last row of the batch, i.e. where a resumed read starts.
+    .gz and .zst files are decompressed on a background thread, and their
+    offsets count decompressed bytes, see open_input.
+    """
+    with open_input(csv_file, start_offset) as file:
+        lines = OffsetTrackingLines(file, start_offset)
+        batch = []
+        for row in csv.reader(lines):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch, lines.offset
+                batch = []
+        if batch:
+            yield batch, lines.offset
+
+# Bytes of the ranges the parallel reader splits a file into
+RANGE_BYTES = 4 * 1024 * 1024
+
+# Bytes counted at a time when tracking the quote state up to a split point
+QUOTE_SCAN_BYTES = 64 * 1024 * 1024
+
+def record_boundaries(data, start, end, num_ranges, quotechar=b'"'):
+    """Split data[start:end] into about num_ranges byte ranges that start at a record.
+
+    A newline ends a record only outside a quoted field, so the quoted
+    multi-line addresses of customer_data.csv stay in one range. The quote
+    state at a split point follows from the parity of the quotes before it;
+    they are counted with bytes.count, at memory speed. Assumes start is the
+    start of a record and fields are quoted the way csv.writer quotes them.
+    """
+    bounds = [start]
+    position, in_quotes = start, False
+    for index in range(1, num_ranges):
+        target = start + (end - start) * index // num_ranges
+        if target <= bounds[-1]:
+            continue
+
+        # Quote state at the target
+        for chunk_start in range(position, target, QUOTE_SCAN_BYTES):
+            if data[chunk_start:min(chunk_start + QUOTE_SCAN_BYTES, target)].count(quotechar) % 2:
+                in_quotes = not in_quotes
+
+        # Move on to the first newline outside a quoted field
+        scan = target
+        while True:
+            newline = data.find(b'\n', scan, end)
+            quote = data.find(quotechar, scan, newline if newline != -1 else end)
+            if quote != -1:
+                in_quotes = not in_quotes
+                scan = quote + 1
+            elif newline == -1:
+                scan = end
+                break
+            elif in_quotes:
+                scan = newline + 1
+            else:
+                scan = newline + 1
+                break
+        if scan >= end:
+            break
+        bounds.append(scan)
+        position, in_quotes = scan, False
+    bounds.append(end)
+    return [(range_start, range_end) for range_start, range_end in zip(bounds, bounds[1:]) if range_end > range_start]
+
+def last_record_end(data, quotechar=b'"'):
+    """Byte position right behind the last complete record of data, 0 when no record ends in it.
+
+    Assumes data starts at a record; a newline ends a record when the quotes
+    before it are even in number, as in record_boundaries.
+    """
+    quotes = data.count(quotechar)
+    quotes_after, newline = 0, len(data)
+    while True:
+        previous = newline
+        newline = data.rfind(b'\n', 0, previous)
+        if newline == -1:
+            return 0
+        quotes_after += data.count(quotechar, newline, previous)
+        if (quotes - quotes_after) % 2 == 0:
+            return newline + 1
+
+def record_blocks(csv_file, start_offset=0, block_bytes=RANGE_BYTES, quotechar=b'"'):
+    """Yield (start, data) blocks of about block_bytes of a compressed CSV file that end at a record.
+
+    The counterpart of record_boundaries for files that cannot be memory-mapped:
+    the file is decompressed as a stream and start is the offset of the block
+    in the decompressed content.
+    """
+    with open_input(csv_file, start_offset) as file:
+        position, pending = start_offset, b''
+        while True:
+            data = file.read(block_bytes)
+            if not data:
+                if pending:
+                    yield position, pending
+                return
+            pending += data
+            end = last_record_end(pending, quotechar)
+            if end:
+                yield position, pending[:end]
+                position += end
+                pending = pending[end:]
+
+# Separator of the values of a packed column; a batch holding it is sent as rows
+SEPARATOR = '\x1f'
+
+def pack_batch(table_name, rows, end_offset):
+    """Pack a batch of rows and their hashes for the trip back to the loader.
+
+    Every column becomes one string of values joined by SEPARATOR, which
+    costs far less to pickle and unpickle than a list of rows. Batches with
+    rows of different lengths, or values holding SEPARATOR, stay rows.
+    """
+    hash_keys, hash_diffs = hash_rows(table_name, rows)
+    width = len(rows[0])
+    if width > max(HASHED_COLUMNS[table_name][1]) and all(len(row) == width for row in rows):
+        columns = [SEPARATOR.join(column) for column in zip(*rows)]
+        if all(column.count(SEPARATOR) == len(rows) - 1 for column in columns):
+            return columns, True, SEPARATOR.join(hash_keys), SEPARATOR.join(hash_diffs), end_offset
+    return rows, False, hash_keys, hash_diffs, end_offset
+
+def unpack_batch(table_name, batch):
+    """Return the (rows, end_offset, hashes) of a batch packed by pack_batch."""
+    data, packed, hash_keys, hash_diffs, end_offset = batch
+    if not packed:
+        return data, end_offset, BatchHashes.from_rows(table_name, data, hash_keys, hash_diffs)
+    columns = [column.split(SEPARATOR) for column in data]
+    hashes = BatchHashes.from_columns(table_name, columns, hash_keys.split(SEPARATOR), hash_diffs.split(SEPARATOR))
+    return list(zip(*columns)), end_offset, hashes
+
+def read_range_batches(task):
+    """Parse and hash the rows of one byte range of a CSV file, in a reader process.
+
+    task is (csv_file, table_name, start, end, batch_size, block), where block
+    holds the bytes of the range of a compressed file and is None for a file
+    the range is read from. Returns the batches of the range, packed by pack_batch.
+    """
+    csv_file, table_name, start, end, batch_size, block = task
+    if block is None:
+        with open(csv_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            block = data[start:end]
+    lines = OffsetTrackingLines(io.BytesIO(block), start)
+    batches, batch = [], []
+    for row in csv.reader(lines):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            batches.append(pack_batch(table_name, batch, lines.offset))
+            batch = []
+    if batch:
+        batches.append(pack_batch(table_name, batch, lines.offset))
+    return batches
+
+def read_batches_parallel(csv_file, table_name, batch_size, start_offset=0, workers=None, range_bytes=RANGE_BYTES):
+    """Read a CSV file in batches of parsed and hashed rows, with reader processes.
+
+    The memory-mapped file is split into byte ranges at record boundaries
+    of about range_bytes (see record_boundaries), which the processes parse
+    and hash in parallel. A .gz or .zst file is decompressed as a stream on
+    a background thread of this process instead, and its blocks of records
+    are sent to the processes (see record_blocks).
+    Yields (rows, end_offset, hashes) tuples in file order, like read_batches,
+    with the hashes of the batch as a BatchHashes. Rows come back as tuples. At most two ranges per
+    process are parsed ahead of the loader.
+    """
+    workers = workers or cpu_count()
+    if compression_of(csv_file):
+        tasks = ((csv_file, table_name, start, start + len(block), batch_size, block)
+                 for start, block in record_blocks(csv_file, start_offset, range_bytes))
+    else:
+        size = os.path.getsize(csv_file)
+        if size <= start_offset:
+            return
+        with open(csv_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ranges = record_boundaries(data, start_offset, size, max(workers, -(-(size - start_offset) // range_bytes)))
+        tasks = iter([(csv_file, table_name, start, end, batch_size, None) for start, end in ranges])
+
+    with Pool(processes=workers) as pool:
+        pending = deque(pool.apply_async(read_range_batches, (task,)) for task in islice(tasks, 2 * workers))
+        while pending:
+            batches = pending.popleft().get()
+            for task in islice(tasks, 1):
+                pending.append(pool.apply_async(read_range_batches, (task,)))
+            for batch in batches:
+                yield unpack_batch(table_name, batch)
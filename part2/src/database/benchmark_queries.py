@@ -0,0 +1,293 @@
+import argparse
+import json
+import logging
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection, pooled_connection, apply_session_profile
+    from logging_utils import configure_logging
+    from workload import parse_queries
+    from reset import restore_database, existing_tables, VAULT_TABLES
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection, pooled_connection, apply_session_profile
+    from src.database.logging_utils import configure_logging
+    from src.database.workload import parse_queries
+    from src.database.reset import restore_database, existing_tables, VAULT_TABLES
+
+# Configure logging
+configure_logging('data_vault.log')
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def plan_signature(plan):
+    """Reduce an EXPLAIN (FORMAT JSON) plan to its shape.
+
+    Costs, timings and row estimates change with every run; node types, join
+    types, relations and indexes only change when the planner picks a different plan.
+    """
+    label = plan['Node Type']
+    if plan.get('Join Type'):
+        label += f" {plan['Join Type']}"
+    if plan.get('Relation Name'):
+        label += f" on {plan['Relation Name']}"
+    if plan.get('Index Name'):
+        label += f" using {plan['Index Name']}"
+    children = [plan_signature(child) for child in plan.get('Plans', [])]
+    return f"{label}({', '.join(children)})" if children else label
+
+def plan_relations(plan):
+    """Return the sorted names of the relations an EXPLAIN (FORMAT JSON) plan reads."""
+    relations = {plan['Relation Name']} if plan.get('Relation Name') else set()
+    for child in plan.get('Plans', []):
+        relations.update(plan_relations(child))
+    return sorted(relations)
+
+def analyze_tables(config, tables=VAULT_TABLES):
+    """ANALYZE the benchmarked tables, so the plans do not depend on when autovacuum last sampled them."""
+    with pooled_connection(config) as connection:
+        cursor = connection.cursor()
+        tables = existing_tables(cursor, tables)
+        for table in tables:
+            cursor.execute(f"ANALYZE {table};")
+        connection.commit()
+        cursor.close()
+    return tables
+
+def relation_row_counts(config, relations):
+    """Return {relation: estimated rows} from pg_class, accurate right after analyze_tables."""
+    with pooled_connection(config) as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT relname, GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = ANY(%s)",
+                       (list(relations),))
+        counts = dict(cursor.fetchall())
+        connection.rollback()
+        cursor.close()
+    return counts
+
+def explain_analyze(cursor, sql):
+    """Run EXPLAIN (ANALYZE, BUFFERS) and return the JSON plan document."""
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    explain = cursor.fetchone()[0]
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    return explain[0]
+
+def timed_execution(cursor, sql):
+    """Execute a query, fetch all rows and return (latency in ms, row count)."""
+    start = time.perf_counter()
+    cursor.execute(sql)
+    rows = cursor.fetchall() if cursor.description else []
+    return (time.perf_counter() - start) * 1000, len(rows)
+
+def run_cold_command(cold_command):
+    """Run the configured cache-dropping command, e.g. a server restart plus drop_caches."""
+    if cold_command:
+        subprocess.run(cold_command, shell=True, check=True)
+
+def benchmark_query(config, sql, runs, cold_command=None):
+    """Measure one query in a warm and a cold variant.
+
+    Both variants run under the reporting session profile. Cold runs each use a
+    fresh connection, after the optional cold command has emptied the caches.
+    Without a cold command only the backend-local caches (catalog, plan) are
+    cold; shared buffers and the OS page cache stay warm.
+    """
+    result = {}
+
+    # Cold variant: a fresh connection (and cache drop) for every run
+    latencies = []
+    for _ in range(runs):
+        run_cold_command(cold_command)
+        connection = connect_to_database(config)
+        apply_session_profile(connection, config, 'reporting')
+        cursor = connection.cursor()
+        latency, rows = timed_execution(cursor, sql)
+        latencies.append(latency)
+        close_connection(connection, cursor)
+
+    # One extra cold run captures the plan with its cold buffer counts
+    run_cold_command(cold_command)
+    connection = connect_to_database(config)
+    apply_session_profile(connection, config, 'reporting')
+    cursor = connection.cursor()
+    cold_explain = explain_analyze(cursor, sql)
+    close_connection(connection, cursor)
+    result['cold'] = {'latencies_ms': latencies, 'rows': rows, 'explain': cold_explain}
+
+    # Warm variant: one warm-up execution, then the timed runs on the same pooled connection
+    with pooled_connection(config, 'reporting') as connection:
+        cursor = connection.cursor()
+        timed_execution(cursor, sql)
+        latencies = []
+        for _ in range(runs):
+            latency, rows = timed_execution(cursor, sql)
+            latencies.append(latency)
+        result['warm'] = {'latencies_ms': latencies, 'rows': rows, 'explain': explain_analyze(cursor, sql)}
+        cursor.close()
+
+    for variant in result.values():
+        variant['p50_ms'] = round(percentile(variant['latencies_ms'], 50), 3)
+        variant['p95_ms'] = round(percentile(variant['latencies_ms'], 95), 3)
+        variant['plan_signature'] = plan_signature(variant['explain']['Plan'])
+        variant['plan_relations'] = plan_relations(variant['explain']['Plan'])
+    return result
+
+def combine_rounds(rounds):
+    """Merge several benchmark_query results of one query into one.
+
+    median_ms is the median of the rounds' p50 latencies, the figure the
+    regression check compares; p50/p95 are taken over the latencies of all
+    rounds. The plan is the one most rounds ran with.
+    """
+    combined = {}
+    for variant_name in rounds[0]:
+        variants = [result[variant_name] for result in rounds]
+        latencies = [latency for variant in variants for latency in variant['latencies_ms']]
+        signatures = Counter(variant['plan_signature'] for variant in variants)
+        signature = signatures.most_common(1)[0][0]
+        planned = next(variant for variant in variants if variant['plan_signature'] == signature)
+        combined[variant_name] = {
+            'latencies_ms': latencies,
+            'rows': variants[-1]['rows'],
+            'explain': planned['explain'],
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'median_ms': round(statistics.median(variant['p50_ms'] for variant in variants), 3),
+            'plan_signature': signature,
+            'plan_signatures': dict(signatures),
+            'plan_relations': planned['plan_relations'],
+        }
+    return combined
+
+def compare_to_baseline(results, baseline, latency_tolerance, min_regression_ms, relation_rows=None, min_plan_rows=0):
+    """Return the list of regressions of the results against the baseline.
+
+    Latencies are compared by their median over the rounds (p50 for a baseline
+    without one). A plan change is ignored when every relation the plan reads
+    has fewer than min_plan_rows rows in relation_rows: on tables that small the
+    planner flips between equally cheap plans from one ANALYZE to the next.
+    """
+    relation_rows = relation_rows or {}
+    regressions = []
+    for name, variants in results.items():
+        for variant_name, current in variants.items():
+            previous = baseline.get(name, {}).get(variant_name)
+            if not previous:
+                continue
+
+            relations = set(current.get('plan_relations', [])) | set(previous.get('plan_relations', []))
+            small_plan = bool(relations) and all(relation_rows.get(relation, 0) < min_plan_rows for relation in relations)
+            if current['plan_signature'] != previous['plan_signature'] and not small_plan:
+                regressions.append(f"{name} [{variant_name}]: plan changed from "
+                                   f"{previous['plan_signature']} to {current['plan_signature']}")
+
+            current_ms = current.get('median_ms', current['p50_ms'])
+            previous_ms = previous.get('median_ms', previous['p50_ms'])
+            if current_ms > previous_ms * (1 + latency_tolerance) and current_ms - previous_ms > min_regression_ms:
+                regressions.append(f"{name} [{variant_name}]: median {current_ms} ms exceeds "
+                                   f"baseline {previous_ms} ms by more than {latency_tolerance:.0%}")
+    return regressions
+
+def summarize(results):
+    """Keep what a baseline needs: latency percentiles, rows and the plan shape."""
+    return {
+        name: {
+            variant_name: {key: variant[key] for key in ('median_ms', 'p50_ms', 'p95_ms', 'rows', 'plan_signature',
+                                                         'plan_relations')}
+            for variant_name, variant in variants.items()
+        }
+        for name, variants in results.items()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reporting queries against a baseline.")
+    parser.add_argument('--queries', default='src/sample_queries.sql', help='SQL file with the named queries.')
+    parser.add_argument('--runs', type=int, default=5, help='Timed executions per query, variant and round.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Rounds of runs per query; the regression check compares the median of the rounds.')
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Stored baseline to compare against.')
+    parser.add_argument('--update-baseline', action='store_true', help='Store this run as the new baseline.')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='Allowed slowdown of the median latency relative to the baseline (0.25 = 25%%).')
+    parser.add_argument('--min-regression-ms', type=float, default=5.0,
+                        help='Ignore slowdowns of the median latency smaller than this many milliseconds.')
+    parser.add_argument('--min-plan-rows', type=int, default=10000,
+                        help='Ignore plan changes of queries that only read tables with fewer rows than this.')
+    parser.add_argument('--cold-command', default=None,
+                        help='Shell command that empties the caches before every cold run.')
+    parser.add_argument('--restore-snapshot', default=None,
+                        help='Restore the database from this snapshot (see reset.py) before benchmarking.')
+    args = parser.parse_args()
+
+    config = load_config("src/database/config.yaml")
+    queries = parse_queries(args.queries)
+    if not config or not queries:
+        sys.exit(1)
+
+    # Start from a known dataset instead of whatever the last run left behind
+    if args.restore_snapshot and not restore_database(config, args.restore_snapshot):
+        sys.exit(1)
+
+    # Fresh statistics, so the plans do not depend on how long ago autovacuum analyzed the tables
+    analyzed = analyze_tables(config)
+    logging.info(f"Analyzed {len(analyzed)} tables before benchmarking: {', '.join(analyzed)}")
+
+    results = {}
+    for name, sql in queries:
+        try:
+            results[name] = combine_rounds([benchmark_query(config, sql, args.runs, args.cold_command)
+                                            for _ in range(max(1, args.rounds))])
+            warm, cold = results[name]['warm'], results[name]['cold']
+            print(f"{name}: warm median {warm['median_ms']} ms / p95 {warm['p95_ms']} ms, "
+                  f"cold median {cold['median_ms']} ms / p95 {cold['p95_ms']} ms, {warm['rows']} rows")
+        except Exception as e:
+            logging.error(f"Error benchmarking query '{name}': {e}")
+            print(f"Error benchmarking query '{name}': {e}")
+            sys.exit(1)
+
+    # Keep the full EXPLAIN output of every run next to the baseline
+    output_dir = os.path.dirname(args.baseline) or '.'
+    os.makedirs(output_dir, exist_ok=True)
+    results_file = os.path.join(output_dir, f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    logging.info(f"Benchmark results written to {results_file}")
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(summarize(results), f, indent=2)
+        logging.info(f"Benchmark baseline written to {args.baseline}")
+        print(f"Benchmark baseline written to {args.baseline}")
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    relations = {relation for variants in results.values() for variant in variants.values()
+                 for relation in variant['plan_relations']}
+    relations |= {relation for variants in baseline.values() for variant in variants.values()
+                  for relation in variant.get('plan_relations', [])}
+    regressions = compare_to_baseline(summarize(results), baseline, args.latency_tolerance, args.min_regression_ms,
+                                      relation_row_counts(config, relations), args.min_plan_rows)
+    if regressions:
+        for regression in regressions:
+            logging.error(f"Benchmark regression: {regression}")
+            print(f"REGRESSION {regression}")
+        sys.exit(1)
+
+    logging.info("Benchmark finished without regressions.")
+    print("Benchmark finished without regressions.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import logging
+import random
+import time
+
+import psycopg2
+
+try:
+    from logging_utils import configure_logging
+except ImportError:
+    from .logging_utils import configure_logging
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# SQLSTATEs of a transaction that lost to a concurrent one and only needs to run again
+RETRYABLE_ERRORS = {
+    '40001': 'serialization failure',
+    '40P01': 'deadlock',
+}
+
+# First key of the two-key advisory locks: one lock space per hub
+LOCK_SPACES = {
+    'products_hub': 1,
+    'customers_hub': 2,
+}
+
+def key_ranges(hash_keys, prefix_length=2):
+    """Sorted ranges of a set of hash keys; a range is the value of the first prefix_length hex digits."""
+    return sorted({int(hash_key[:prefix_length], 16) for hash_key in hash_keys})
+
+def lock_key_ranges(cursor, table_name, hash_keys, prefix_length=2):
+    """Take the advisory locks of the hash key ranges of a batch, held until the transaction ends.
+
+    Every loader takes its locks in range order, so two loaders never wait on
+    each other in a cycle. Holding the range of a key from the hub insert to
+    the commit keeps a concurrent loader from end-dating the same satellite
+    rows and inserting a second current row next to ours. Longer prefixes give
+    finer ranges and more locks per batch (16 ** prefix_length at most).
+    Returns the number of locks taken.
+    """
+    ranges = key_ranges(hash_keys, prefix_length)
+    if ranges:
+        # Locking from a sorted subquery takes the locks in that order
+        cursor.execute("""
+            SELECT pg_advisory_xact_lock(%s, key_range)
+            FROM (SELECT unnest(%s::int[]) AS key_range ORDER BY 1) AS ranges
+        """, (LOCK_SPACES[table_name], ranges))
+    return len(ranges)
+
+def run_with_retry(conn, work, max_retries=5, base_delay=0.05):
+    """Run work() and commit it as one transaction, again after a deadlock or serialization failure.
+
+    The transaction is rolled back and retried after a randomized, doubling
+    delay, up to max_retries times; other errors are raised at once, after
+    the rollback. Returns the result of work().
+    """
+    attempt = 0
+    while True:
+        try:
+            result = work()
+            conn.commit()
+            return result
+        except psycopg2.Error as e:
+            conn.rollback()
+            if e.pgcode not in RETRYABLE_ERRORS or attempt >= max_retries:
+                raise
+            attempt += 1
+            delay = base_delay * 2 ** (attempt - 1) * (0.5 + random.random())
+            logging.warning(f"Retrying a batch after a {RETRYABLE_ERRORS[e.pgcode]} (attempt {attempt} of {max_retries}).")
+            print(f"Retrying a batch after a {RETRYABLE_ERRORS[e.pgcode]} (attempt {attempt} of {max_retries}).")
+            time.sleep(delay)
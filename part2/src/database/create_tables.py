@@ -1,10 +1,13 @@
 from database_utils import load_config, connect_to_database, close_connection
+from logging_utils import configure_logging
+from marts import create_mart_tables
+from load_journal import create_journal_table
+from dead_letter import create_dead_letter_table
 import logging
 import hashlib
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
 
 def generate_hash_key(id):
     """Generate a hash key using MD5."""
@@ -15,6 +18,38 @@ def generate_concat_hash(*fields):
     concatenated_fields = ''.join(str(field) for field in fields)
     return hashlib.md5(concatenated_fields.encode()).hexdigest()
 
+# Satellites keyed by (hash key, load_date), one row per version, and the hash key column of each
+VERSIONED_SATELLITES = {
+    'customers_satellite': 'customer_hash_key',
+    'products_satellite': 'product_hash_key',
+}
+
+def migrate_satellite_keys(cursor):
+    """Re-key satellites created with the hash key alone as primary key, which rejects every second version.
+
+    Existing rows keep their load_date; a NULL one is set to the current time
+    first, as a primary key column cannot be NULL. Returns the migrated tables.
+    """
+    migrated = []
+    for table, hash_key_column in VERSIONED_SATELLITES.items():
+        cursor.execute("""
+            SELECT con.conname, array_agg(att.attname::text ORDER BY att.attnum)
+            FROM pg_constraint con
+            JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY(con.conkey)
+            WHERE con.conrelid = to_regclass(%s) AND con.contype = 'p'
+            GROUP BY con.conname
+        """, (table,))
+        result = cursor.fetchone()
+        if result is None or result[1] != [hash_key_column]:
+            continue
+        cursor.execute(f"UPDATE {table} SET load_date = CURRENT_TIMESTAMP WHERE load_date IS NULL;")
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {result[0]}, "
+                       f"ADD PRIMARY KEY ({hash_key_column}, load_date);")
+        migrated.append(table)
+        logging.info(f"Primary key of {table} changed to ({hash_key_column}, load_date).")
+        print(f"Primary key of {table} changed to ({hash_key_column}, load_date).")
+    return migrated
+
 def create_tables():
     """Create Data Vault tables."""
     try:
@@ -59,7 +94,7 @@ def create_tables():
                     load_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     source VARCHAR(50),
                     hash_diff VARCHAR(255),
-                    PRIMARY KEY (customer_hash_key)
+                    PRIMARY KEY (customer_hash_key, load_date)
                 );
             """)
             logging.info("customers_satellite table created successfully!")
@@ -77,12 +112,15 @@ def create_tables():
                     load_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     source VARCHAR(50),
                     hash_diff VARCHAR(255),
-                    PRIMARY KEY (product_hash_key)
+                    PRIMARY KEY (product_hash_key, load_date)
                 );
             """)
             logging.info("products_satellite table created successfully!")
             print("products_satellite table created successfully!")
 
+            # Tables created before satellites were versioned by load_date get the new primary key
+            migrate_satellite_keys(cursor)
+
             # Create sales_link table
             cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS sales_link (
@@ -112,10 +150,16 @@ def create_tables():
             logging.info("sales_transactions_satellite table created successfully!")
             print("sales_transactions_satellite table created successfully!")
 
-            # Create index on source field in sales_link table
-            cursor.execute("CREATE INDEX ON sales_link (source);")
-            logging.info("Index created on source field in sales_link table successfully!")
-            print("Index created on source field in sales_link table successfully!")
+            # Create aggregate mart tables
+            create_mart_tables(cursor)
+
+            # Create load progress journal
+            create_journal_table(cursor)
+
+            # Create dead-letter table for rejected rows
+            create_dead_letter_table(cursor)
+
+            # Secondary indexes are declared in indexes.py and built after the bulk loads
 
             # Commit changes
             connection.commit()
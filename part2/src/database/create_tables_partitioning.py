@@ -1,10 +1,13 @@
 from database_utils import load_config, connect_to_database, close_connection
+from logging_utils import configure_logging
+from marts import create_mart_tables
+from load_journal import create_journal_table
+from dead_letter import create_dead_letter_table
 import logging
 import hashlib
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
 
 def generate_hash_key(id):
     """Generate a hash key using MD5."""
@@ -153,6 +156,15 @@ def create_tables():
             logging.info("sales_transactions_satellite table created successfully!")
             print("sales_transactions_satellite table created successfully!")
 
+            # Create aggregate mart tables
+            create_mart_tables(cursor)
+
+            # Create load progress journal
+            create_journal_table(cursor)
+
+            # Create dead-letter table for rejected rows
+            create_dead_letter_table(cursor)
+
             # Create partitioning triggers
             create_partitioning_trigger(cursor, "customers_satellite")
             create_partitioning_trigger(cursor, "products_satellite")
@@ -0,0 +1,84 @@
+import logging
+from psycopg2.extras import execute_values
+
+try:
+    from logging_utils import configure_logging, RateLimitedLog
+except ImportError:
+    from .logging_utils import configure_logging, RateLimitedLog
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# Quarantine messages, one per load batch with rejected rows
+quarantine_log = RateLimitedLog()
+
+# Reason codes of quarantined rows
+MALFORMED_ROW = 'MALFORMED_ROW'
+MISSING_KEY = 'MISSING_KEY'
+INVALID_DATE = 'INVALID_DATE'
+INVALID_AMOUNT = 'INVALID_AMOUNT'
+VALUE_TOO_LONG = 'VALUE_TOO_LONG'
+UNKNOWN_CUSTOMER = 'UNKNOWN_CUSTOMER'
+UNKNOWN_PRODUCT = 'UNKNOWN_PRODUCT'
+
+# Reasons a later load can fix: the referenced hub row may arrive late
+LATE_ARRIVING_REASONS = [UNKNOWN_CUSTOMER, UNKNOWN_PRODUCT]
+
+def create_dead_letter_table(cursor):
+    """Create the dead-letter table for rows a load could not accept."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS load_dead_letter (
+            dead_letter_id BIGSERIAL PRIMARY KEY,
+            table_name VARCHAR(50),
+            csv_file VARCHAR(500),
+            row_number BIGINT,
+            raw_row TEXT[],
+            reason_code VARCHAR(50),
+            reason_detail TEXT,
+            quarantined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reprocessed_at TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS load_dead_letter_pending_idx
+        ON load_dead_letter (table_name, reason_code) WHERE reprocessed_at IS NULL;
+    """)
+    logging.info("load_dead_letter table created successfully!")
+    print("load_dead_letter table created successfully!")
+
+def quarantine_rows(cursor, table_name, csv_file, rejected, page_size=100):
+    """Write rejected rows to the dead-letter table.
+
+    rejected holds (row_number, row, reason_code, reason_detail) tuples. Run it in
+    the load's transaction so the quarantine commits with the batch checkpoint.
+    """
+    if not rejected:
+        return
+    execute_values(cursor, """
+        INSERT INTO load_dead_letter (table_name, csv_file, row_number, raw_row, reason_code, reason_detail)
+        VALUES %s
+    """, [(table_name, csv_file, row_number, list(row), reason_code, reason_detail)
+          for row_number, row, reason_code, reason_detail in rejected], page_size=page_size)
+
+    counts = {}
+    for _, _, reason_code, _ in rejected:
+        counts[reason_code] = counts.get(reason_code, 0) + 1
+    quarantine_log.log(f"quarantined rows of {table_name}",
+                       f"Quarantined {len(rejected)} rows of {csv_file} for {table_name}: {counts}", logging.WARNING,
+                       counts=counts)
+
+def fetch_quarantined(cursor, table_name, reason_codes):
+    """Return the pending (dead_letter_id, row_number, raw_row) entries with the given reasons."""
+    cursor.execute("""
+        SELECT dead_letter_id, row_number, raw_row
+        FROM load_dead_letter
+        WHERE table_name = %s AND reason_code = ANY(%s) AND reprocessed_at IS NULL
+        ORDER BY dead_letter_id
+    """, (table_name, list(reason_codes)))
+    return cursor.fetchall()
+
+def mark_reprocessed(cursor, dead_letter_ids):
+    """Mark dead-letter entries as successfully reprocessed."""
+    if dead_letter_ids:
+        cursor.execute("UPDATE load_dead_letter SET reprocessed_at = CURRENT_TIMESTAMP WHERE dead_letter_id = ANY(%s)",
+                       (list(dead_letter_ids),))
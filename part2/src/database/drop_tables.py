@@ -1,9 +1,9 @@
 from database_utils import load_config, connect_to_database, close_connection
+from logging_utils import configure_logging
 import logging
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
 
 def drop_tables():
     """Drop Data Vault tables."""
@@ -17,6 +17,18 @@ def drop_tables():
         if connection:
             cursor = connection.cursor()
 
+            # Drop aggregate mart tables
+            cursor.execute("DROP TABLE IF EXISTS mart_sales_by_source;")
+            cursor.execute("DROP TABLE IF EXISTS mart_sales_by_category;")
+            cursor.execute("DROP TABLE IF EXISTS mart_sales_by_customer;")
+            cursor.execute("DROP TABLE IF EXISTS mart_sales_by_month;")
+
+            # Drop load progress journal
+            cursor.execute("DROP TABLE IF EXISTS load_journal;")
+
+            # Drop dead-letter table
+            cursor.execute("DROP TABLE IF EXISTS load_dead_letter;")
+
             # Drop tables
             cursor.execute("DROP TABLE IF EXISTS sales_transactions_satellite;")
             cursor.execute("DROP TABLE IF EXISTS sales_link;")
@@ -1,9 +1,10 @@
 from database_utils import load_config, connect_to_database, close_connection
+from logging_utils import configure_logging
+from reset import reset_tables, snapshot_directory
 import logging
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
 
 def empty_tables():
     """Empty Data Vault tables."""
@@ -15,24 +16,12 @@ def empty_tables():
         connection = connect_to_database(config)
 
         if connection:
-            cursor = connection.cursor()
+            # Empty tables with TRUNCATE ... CASCADE instead of DELETE, which leaves dead tuples behind
+            if reset_tables(connection, snapshot_dir=snapshot_directory(config)):
+                logging.info("Tables emptied successfully!")
+                print("Tables emptied successfully!")
 
-            # Empty tables
-            cursor.execute("DELETE FROM sales_transactions_satellite;")
-            cursor.execute("DELETE FROM sales_link;")
-            cursor.execute("DELETE FROM products_satellite;")
-            cursor.execute("DELETE FROM customers_satellite;")
-            cursor.execute("DELETE FROM products_hub;")
-            cursor.execute("DELETE FROM customers_hub;")
-
-            logging.info("Tables emptied successfully!")
-            print("Tables emptied successfully!")
-
-            # Commit changes
-            connection.commit()
-
-            # Close cursor and connection
-            cursor.close()
+            # Close connection
             close_connection(connection)
 
     except Exception as e:
@@ -0,0 +1,236 @@
+import argparse
+import json
+import logging
+import re
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection
+    from logging_utils import configure_logging
+    from workload import parse_queries
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection
+    from src.database.logging_utils import configure_logging
+    from src.database.workload import parse_queries
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# The secondary index set of the vault schema. Primary keys are created with the tables;
+# everything here is built after bulk loads so the loads do not pay for index maintenance.
+INDEXES = [
+    # Range queries on source and transaction date (also serves source-only filters)
+    {'name': 'sales_link_source_date_idx', 'table': 'sales_link', 'columns': ['source', 'transaction_date']},
+    # Joins from the link to the customer and product satellites
+    {'name': 'sales_link_customer_hash_key_idx', 'table': 'sales_link', 'columns': ['customer_hash_key']},
+    {'name': 'sales_link_product_hash_key_idx', 'table': 'sales_link', 'columns': ['product_hash_key']},
+    # Hub lookups by business key
+    {'name': 'customers_hub_customer_id_idx', 'table': 'customers_hub', 'columns': ['customer_id']},
+    {'name': 'products_hub_product_id_idx', 'table': 'products_hub', 'columns': ['product_id']},
+]
+
+# Column references in plan filters, e.g. "((source)::text = 'Online'::text)"
+FILTER_COLUMN_PATTERN = re.compile(r'\(+(?:\w+\.)?(\w+)\)?(?:::\w+(?:\s\w+)*)?\)?\s*(?:=|<>|<=|>=|<|>|~~)')
+
+def declared_indexes(tables=None):
+    """Return the declared indexes, optionally restricted to some tables."""
+    return [index for index in INDEXES if tables is None or index['table'] in tables]
+
+def build_indexes(conn, tables=None):
+    """Build the declared indexes with CREATE INDEX CONCURRENTLY.
+
+    Meant to run after a bulk load. Concurrent builds cannot run inside a
+    transaction, so the connection must not have one open. Invalid leftovers
+    from an interrupted concurrent build are dropped and rebuilt.
+    """
+    previous_autocommit = conn.autocommit
+    cursor = None
+    built = []
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+
+        for index in declared_indexes(tables):
+            # An interrupted concurrent build leaves an invalid index behind
+            cursor.execute("""
+                SELECT NOT i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = %s
+            """, (index['name'],))
+            result = cursor.fetchone()
+            if result and result[0]:
+                logging.warning(f"Dropping invalid index {index['name']} before rebuilding it.")
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['name']};")
+            elif result:
+                continue
+
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index['name']} "
+                f"ON {index['table']} ({', '.join(index['columns'])});"
+            )
+            built.append(index['name'])
+            logging.info(f"Index {index['name']} built on {index['table']} ({', '.join(index['columns'])}).")
+
+        # Fresh statistics so the planner can use the new indexes straight away
+        for table in sorted({index['table'] for index in declared_indexes(tables)}):
+            cursor.execute(f"ANALYZE {table};")
+
+        if built:
+            print(f"Indexes built: {', '.join(built)}")
+        return built
+
+    except Exception as e:
+        logging.error(f"Error building indexes: {e}")
+        print(f"Error building indexes: {e}")
+        return built
+
+    finally:
+        if cursor:
+            cursor.close()
+        conn.autocommit = previous_autocommit
+
+def drop_indexes(conn, tables=None):
+    """Drop the declared indexes, e.g. before a large reload."""
+    previous_autocommit = conn.autocommit
+    cursor = None
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        for index in declared_indexes(tables):
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['name']};")
+        logging.info("Declared indexes dropped successfully!")
+        print("Declared indexes dropped successfully!")
+
+    except Exception as e:
+        logging.error(f"Error dropping indexes: {e}")
+        print(f"Error dropping indexes: {e}")
+
+    finally:
+        if cursor:
+            cursor.close()
+        conn.autocommit = previous_autocommit
+
+def covered_columns(table, filter_columns):
+    """Return the filter columns a declared index on the table can serve.
+
+    A column is covered when it sits in a declared index whose preceding columns
+    are all filtered on as well, i.e. it falls within a usable index prefix.
+    """
+    covered = set()
+    for index in declared_indexes([table]):
+        for column in index['columns']:
+            if column not in filter_columns:
+                break
+            covered.add(column)
+    return covered
+
+def walk_plan(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk_plan(child)
+
+def explain_query(cursor, sql):
+    """Return the root plan node of a query without executing it."""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+def validate_indexes(conn, queries):
+    """Check the declared index set against a query workload.
+
+    Returns a report with:
+      - not_built: declared indexes missing from the database,
+      - unused: declared indexes no workload plan uses and that have never been scanned,
+      - missing: sequential scans filtering on a column no declared index prefix covers.
+    """
+    report = {'used': {}, 'not_built': [], 'unused': [], 'missing': []}
+    cursor = conn.cursor()
+    try:
+        declared = {index['name']: index for index in INDEXES}
+
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(declared),))
+        existing = {row[0] for row in cursor.fetchall()}
+        report['not_built'] = [name for name in declared if name not in existing]
+
+        for name, sql in queries:
+            try:
+                plan = explain_query(cursor, sql)
+            except Exception as e:
+                conn.rollback()
+                logging.warning(f"Skipping query '{name}' that cannot be explained: {e}")
+                continue
+
+            for node in walk_plan(plan):
+                index_name = node.get('Index Name')
+                if index_name:
+                    report['used'].setdefault(index_name, []).append(name)
+
+                if node.get('Node Type') == 'Seq Scan' and node.get('Filter'):
+                    table = node.get('Relation Name')
+                    filter_columns = set(FILTER_COLUMN_PATTERN.findall(node['Filter']))
+                    for column in sorted(filter_columns - covered_columns(table, filter_columns)):
+                        missing = {'query': name, 'table': table, 'column': column}
+                        if missing not in report['missing']:
+                            report['missing'].append(missing)
+
+        # Declared indexes no plan picked are only unused if live traffic never scanned them either
+        cursor.execute("SELECT indexrelname, idx_scan FROM pg_stat_user_indexes WHERE indexrelname = ANY(%s)",
+                       (list(existing),))
+        scans = dict(cursor.fetchall())
+        report['unused'] = [name for name in existing
+                            if name not in report['used'] and not scans.get(name)]
+
+        conn.rollback()
+        return report
+
+    except Exception as e:
+        logging.error(f"Error validating indexes: {e}")
+        print(f"Error validating indexes: {e}")
+        conn.rollback()
+        return report
+
+    finally:
+        cursor.close()
+
+def print_report(report):
+    """Log and print an index validation report."""
+    for index_name, query_names in sorted(report['used'].items()):
+        print(f"USED      {index_name}: {len(query_names)} queries")
+    for index_name in report['not_built']:
+        print(f"NOT BUILT {index_name}")
+    for index_name in report['unused']:
+        print(f"UNUSED    {index_name}")
+    for missing in report['missing']:
+        print(f"MISSING   {missing['table']}({missing['column']}) for '{missing['query']}'")
+    logging.info(f"Index validation report: {report}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the vault's secondary indexes.")
+    parser.add_argument('action', choices=['build', 'drop', 'validate'])
+    parser.add_argument('--workload', default='src/sample_queries.sql',
+                        help='SQL file with the query workload to validate against.')
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        connection = connect_to_database(config)
+
+        if connection:
+            if args.action == 'build':
+                build_indexes(connection)
+            elif args.action == 'drop':
+                drop_indexes(connection)
+            else:
+                print_report(validate_indexes(connection, parse_queries(args.workload)))
+
+            close_connection(connection)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import logging
+import os
+
+try:
+    from logging_utils import configure_logging
+except ImportError:
+    from .logging_utils import configure_logging
+
+# Configure logging
+configure_logging('data_vault.log')
+
+def create_journal_table(cursor):
+    """Create the load progress journal."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS load_journal (
+            table_name VARCHAR(50),
+            csv_file VARCHAR(500),
+            file_fingerprint VARCHAR(100),
+            byte_offset BIGINT NOT NULL DEFAULT 0,
+            row_number BIGINT NOT NULL DEFAULT 0,
+            completed BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, csv_file)
+        );
+    """)
+    logging.info("load_journal table created successfully!")
+    print("load_journal table created successfully!")
+
+def file_fingerprint(csv_file):
+    """Identify a version of a file by its size and modification time."""
+    stat = os.stat(csv_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def get_checkpoint(cursor, table_name, csv_file, fingerprint):
+    """Return (byte_offset, row_number, completed) to resume a load from.
+
+    A checkpoint recorded for a different version of the file does not apply,
+    so the load starts over from the beginning.
+    """
+    cursor.execute("""
+        SELECT file_fingerprint, byte_offset, row_number, completed
+        FROM load_journal
+        WHERE table_name = %s AND csv_file = %s
+    """, (table_name, csv_file))
+    result = cursor.fetchone()
+    if result is None or result[0] != fingerprint:
+        return 0, 0, False
+    return result[1], result[2], result[3]
+
+def save_checkpoint(cursor, table_name, csv_file, fingerprint, byte_offset, row_number, completed=False):
+    """Record load progress; commit it in the same transaction as the rows it covers."""
+    cursor.execute("""
+        INSERT INTO load_journal (table_name, csv_file, file_fingerprint, byte_offset, row_number, completed, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (table_name, csv_file) DO UPDATE
+        SET file_fingerprint = EXCLUDED.file_fingerprint,
+            byte_offset = EXCLUDED.byte_offset,
+            row_number = EXCLUDED.row_number,
+            completed = EXCLUDED.completed,
+            updated_at = EXCLUDED.updated_at
+    """, (table_name, csv_file, fingerprint, byte_offset, row_number, completed))
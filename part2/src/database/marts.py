@@ -0,0 +1,217 @@
+import logging
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection
+    from logging_utils import configure_logging
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection
+    from src.database.logging_utils import configure_logging
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# Summary tables backing the reports in sample_queries.sql
+MART_TABLES = [
+    'mart_sales_by_source',
+    'mart_sales_by_category',
+    'mart_sales_by_customer',
+    'mart_sales_by_month',
+]
+
+# Upsert statements that fold a set of sales_link rows into each mart.
+# {where} selects the rows to fold in: the delta of a load batch, or everything on a rebuild.
+# Rows are upserted in key order, so concurrent loads lock the mart rows in the same order.
+MART_UPSERTS = {
+    'mart_sales_by_source': """
+        INSERT INTO mart_sales_by_source (source, transaction_count, total_sales_amount)
+        SELECT COALESCE(sl.source, 'Unknown'), COUNT(*), COALESCE(SUM(sl.transaction_amount), 0)
+        FROM sales_link sl
+        WHERE {where}
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (source) DO UPDATE
+        SET transaction_count = mart_sales_by_source.transaction_count + EXCLUDED.transaction_count,
+            total_sales_amount = mart_sales_by_source.total_sales_amount + EXCLUDED.total_sales_amount
+    """,
+    'mart_sales_by_category': """
+        INSERT INTO mart_sales_by_category (product_category, transaction_count, total_sales_amount)
+        SELECT ps.product_category, COUNT(*), COALESCE(SUM(sl.transaction_amount), 0)
+        FROM sales_link sl
+        JOIN products_satellite ps ON sl.product_hash_key = ps.product_hash_key AND ps.end_date IS NULL
+        WHERE {where} AND ps.product_category IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (product_category) DO UPDATE
+        SET transaction_count = mart_sales_by_category.transaction_count + EXCLUDED.transaction_count,
+            total_sales_amount = mart_sales_by_category.total_sales_amount + EXCLUDED.total_sales_amount
+    """,
+    'mart_sales_by_customer': """
+        INSERT INTO mart_sales_by_customer (customer_hash_key, transaction_count, total_transaction_amount)
+        SELECT sl.customer_hash_key, COUNT(*), COALESCE(SUM(sl.transaction_amount), 0)
+        FROM sales_link sl
+        WHERE {where} AND sl.customer_hash_key IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (customer_hash_key) DO UPDATE
+        SET transaction_count = mart_sales_by_customer.transaction_count + EXCLUDED.transaction_count,
+            total_transaction_amount = mart_sales_by_customer.total_transaction_amount + EXCLUDED.total_transaction_amount
+    """,
+    'mart_sales_by_month': """
+        INSERT INTO mart_sales_by_month (transaction_month, transaction_count, total_sales_amount)
+        SELECT date_trunc('month', sl.transaction_date)::date, COUNT(*), COALESCE(SUM(sl.transaction_amount), 0)
+        FROM sales_link sl
+        WHERE {where} AND sl.transaction_date IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (transaction_month) DO UPDATE
+        SET transaction_count = mart_sales_by_month.transaction_count + EXCLUDED.transaction_count,
+            total_sales_amount = mart_sales_by_month.total_sales_amount + EXCLUDED.total_sales_amount
+    """,
+}
+
+def create_mart_tables(cursor):
+    """Create the aggregate mart tables."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mart_sales_by_source (
+            source VARCHAR(50) PRIMARY KEY,
+            transaction_count BIGINT NOT NULL DEFAULT 0,
+            total_sales_amount NUMERIC(18, 2) NOT NULL DEFAULT 0
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mart_sales_by_category (
+            product_category VARCHAR(100) PRIMARY KEY,
+            transaction_count BIGINT NOT NULL DEFAULT 0,
+            total_sales_amount NUMERIC(18, 2) NOT NULL DEFAULT 0
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mart_sales_by_customer (
+            customer_hash_key VARCHAR(255) PRIMARY KEY,
+            transaction_count BIGINT NOT NULL DEFAULT 0,
+            total_transaction_amount NUMERIC(18, 2) NOT NULL DEFAULT 0
+        );
+    """)
+    # The top 10 customers report reads this table in amount order
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS mart_sales_by_customer_amount_idx
+        ON mart_sales_by_customer (total_transaction_amount DESC);
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mart_sales_by_month (
+            transaction_month DATE PRIMARY KEY,
+            transaction_count BIGINT NOT NULL DEFAULT 0,
+            total_sales_amount NUMERIC(18, 2) NOT NULL DEFAULT 0
+        );
+    """)
+    logging.info("Aggregate mart tables created successfully!")
+    print("Aggregate mart tables created successfully!")
+
+def apply_sales_delta(cursor, transaction_hash_keys):
+    """Fold newly inserted sales_link rows into the marts.
+
+    Must run in the same transaction as the inserts so the marts never drift from
+    sales_link. Returns the number of mart rows touched per mart; marts the batch
+    did not touch are left out.
+    """
+    touched = {}
+    if not transaction_hash_keys:
+        return touched
+
+    for mart_table, upsert_query in MART_UPSERTS.items():
+        cursor.execute(upsert_query.format(where="sl.transaction_hash_key = ANY(%s)"),
+                       (list(transaction_hash_keys),))
+        if cursor.rowcount > 0:
+            touched[mart_table] = cursor.rowcount
+    return touched
+
+def product_mart_categories(cursor, product_hash_keys):
+    """Return {product_hash_key: category} of the products among product_hash_keys that have a satellite.
+
+    The category is that of the latest version, the one mart_sales_by_category
+    counts the product's sales under; products without a satellite, e.g. hub
+    stubs, are left out, as their sales are not in the mart yet.
+    """
+    cursor.execute("""
+        SELECT DISTINCT ON (product_hash_key) product_hash_key, product_category
+        FROM products_satellite
+        WHERE product_hash_key = ANY(%s)
+        ORDER BY product_hash_key, load_date DESC
+    """, (list(product_hash_keys),))
+    return dict(cursor.fetchall())
+
+def move_product_sales(cursor, previous_categories, new_categories):
+    """Keep mart_sales_by_category in line with a batch of new product versions.
+
+    previous_categories is what product_mart_categories returned before the
+    versions were inserted, new_categories the {product_hash_key: category}
+    of the new versions. The sales of products getting their first satellite
+    are added, and those of products whose category changed move from the
+    old category to the new one. Run it in the transaction that inserts the
+    versions. Returns the number of products whose sales were recounted.
+    """
+    recounted = sorted(key for key, category in new_categories.items()
+                       if key not in previous_categories or previous_categories[key] != category)
+    moved = [(key, previous_categories[key]) for key in recounted if previous_categories.get(key) is not None]
+    if moved:
+        old_categories = sorted({category for _, category in moved})
+        cursor.execute("""
+            UPDATE mart_sales_by_category m
+            SET transaction_count = m.transaction_count - moved.transaction_count,
+                total_sales_amount = m.total_sales_amount - moved.total_sales_amount
+            FROM (
+                SELECT previous.product_category, COUNT(*) AS transaction_count,
+                       COALESCE(SUM(sl.transaction_amount), 0) AS total_sales_amount
+                FROM unnest(%s::text[], %s::text[]) AS previous(product_hash_key, product_category)
+                JOIN sales_link sl ON sl.product_hash_key = previous.product_hash_key
+                GROUP BY 1
+            ) moved
+            WHERE m.product_category = moved.product_category
+        """, ([key for key, _ in moved], [category for _, category in moved]))
+        # A category left without sales disappears, as on a rebuild
+        cursor.execute("DELETE FROM mart_sales_by_category WHERE product_category = ANY(%s) AND transaction_count <= 0",
+                       (old_categories,))
+    if recounted:
+        cursor.execute(MART_UPSERTS['mart_sales_by_category'].format(where="sl.product_hash_key = ANY(%s)"),
+                       (recounted,))
+    return len(recounted)
+
+def rebuild_marts(cursor):
+    """Rebuild every mart from the full sales_link history.
+
+    Only needed once to backfill marts for data loaded before they existed;
+    regular loads keep them current through apply_sales_delta.
+    """
+    cursor.execute(f"TRUNCATE {', '.join(MART_TABLES)};")
+    rebuilt = {}
+    for mart_table, upsert_query in MART_UPSERTS.items():
+        cursor.execute(upsert_query.format(where="TRUE"))
+        rebuilt[mart_table] = cursor.rowcount
+    return rebuilt
+
+def main():
+    try:
+        # Load configuration and connect to the database
+        config = load_config("src/database/config.yaml")
+        connection = connect_to_database(config)
+
+        if connection:
+            cursor = connection.cursor()
+
+            # Create the marts if needed and backfill them from existing history
+            create_mart_tables(cursor)
+            rebuilt = rebuild_marts(cursor)
+            connection.commit()
+
+            logging.info(f"Aggregate marts rebuilt: {rebuilt}")
+            print(f"Aggregate marts rebuilt: {rebuilt}")
+
+            cursor.close()
+            close_connection(connection)
+
+    except Exception as e:
+        logging.error(f"Error rebuilding aggregate marts: {e}")
+        print(f"Error rebuilding aggregate marts: {e}")
+
+if __name__ == "__main__":
+    main()
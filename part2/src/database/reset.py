@@ -0,0 +1,227 @@
+import argparse
+import logging
+import os
+import shutil
+import time
+
+import psycopg2
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection
+    from logging_utils import configure_logging
+    from marts import MART_TABLES
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection
+    from src.database.logging_utils import configure_logging
+    from src.database.marts import MART_TABLES
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# Every table a load writes to
+VAULT_TABLES = [
+    'sales_transactions_satellite',
+    'sales_link',
+    'products_satellite',
+    'customers_satellite',
+    'products_hub',
+    'customers_hub',
+    'load_journal',
+    'load_dead_letter',
+] + MART_TABLES
+
+# Where main.py keeps the previous customer and product snapshots when config.yaml does not say
+SNAPSHOT_DIR = 'data/snapshots'
+
+def existing_tables(cursor, tables):
+    """Return the subset of the tables that exist."""
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename = ANY(%s)",
+                   (list(tables),))
+    found = {row[0] for row in cursor.fetchall()}
+    return [table for table in tables if table in found]
+
+def drop_partitions(cursor, table):
+    """Drop every partition of a partitioned table and return their names.
+
+    Dropping a partition is a catalog operation: it frees the space at once and
+    leaves no dead tuples behind. Loads recreate partitions as they need them.
+    """
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND p.relkind = 'p'
+    """, (table,))
+    partitions = [row[0] for row in cursor.fetchall()]
+    for partition in partitions:
+        cursor.execute(f"DROP TABLE IF EXISTS {partition};")
+    return partitions
+
+def snapshot_directory(config):
+    """Directory of the previous snapshots, from the snapshots section of config.yaml."""
+    return (config.get('snapshots') or {}).get('directory', SNAPSHOT_DIR)
+
+def reset_tables(conn, tables=VAULT_TABLES, snapshot_dir=SNAPSHOT_DIR):
+    """Empty the tables with partition drops and a single TRUNCATE ... CASCADE.
+
+    The previous snapshots in snapshot_dir are removed as well: diffed against
+    them, the next load would find nothing new for the emptied hubs.
+    """
+    cursor = None
+    try:
+        start = time.perf_counter()
+        cursor = conn.cursor()
+
+        tables = existing_tables(cursor, tables)
+        for table in tables:
+            dropped = drop_partitions(cursor, table)
+            if dropped:
+                logging.info(f"Dropped {len(dropped)} partitions of {table}.")
+
+        if tables:
+            cursor.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE;")
+        conn.commit()
+
+        if snapshot_dir and os.path.isdir(snapshot_dir):
+            shutil.rmtree(snapshot_dir)
+            logging.info(f"Removed the previous snapshots in {snapshot_dir}.")
+
+        logging.info(f"Tables reset in {time.perf_counter() - start:.2f}s: {', '.join(tables)}")
+        print(f"Tables reset in {time.perf_counter() - start:.2f}s: {', '.join(tables)}")
+        return True
+
+    except Exception as e:
+        logging.error(f"Error resetting tables: {e}")
+        print(f"Error resetting tables: {e}")
+        conn.rollback()
+        return False
+
+    finally:
+        if cursor:
+            cursor.close()
+
+def connect_to_maintenance_database(config):
+    """Connect to the maintenance database in autocommit mode.
+
+    CREATE/DROP DATABASE cannot run inside a transaction, nor while connected
+    to the database being copied or dropped.
+    """
+    maintenance_config = {'database': dict(config['database'])}
+    maintenance_config['database']['dbname'] = config['database'].get('maintenance_dbname', 'template1')
+    conn = connect_to_database(maintenance_config)
+    if conn:
+        conn.autocommit = True
+    return conn
+
+def terminate_connections(cursor, dbname):
+    """Disconnect every other session from a database."""
+    cursor.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()",
+                   (dbname,))
+
+def copy_strategy(cursor):
+    """Prefer a plain file copy on servers that offer a choice (PostgreSQL 15+).
+
+    The default WAL_LOG strategy writes every block to WAL, which is slow for a
+    large dataset; FILE_COPY copies the data files after a checkpoint.
+    """
+    cursor.execute("SHOW server_version_num;")
+    return " STRATEGY FILE_COPY" if int(cursor.fetchone()[0]) >= 150000 else ""
+
+def drop_template_database(cursor, name):
+    """Drop a database, clearing its template flag first if needed."""
+    cursor.execute("SELECT datistemplate FROM pg_database WHERE datname = %s", (name,))
+    result = cursor.fetchone()
+    if result is None:
+        return
+    if result[0]:
+        cursor.execute(f'ALTER DATABASE "{name}" WITH IS_TEMPLATE false;')
+    terminate_connections(cursor, name)
+    cursor.execute(f'DROP DATABASE "{name}";')
+
+def snapshot_database(config, snapshot_name):
+    """Copy the configured database into a template database named snapshot_name."""
+    dbname = config['database']['dbname']
+    conn = connect_to_maintenance_database(config)
+    if not conn:
+        return False
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        drop_template_database(cursor, snapshot_name)
+        terminate_connections(cursor, dbname)
+        cursor.execute(f'CREATE DATABASE "{snapshot_name}" TEMPLATE "{dbname}"{copy_strategy(cursor)};')
+
+        # Mark it as a template and lock it so nothing modifies the snapshot by accident
+        cursor.execute(f'ALTER DATABASE "{snapshot_name}" WITH IS_TEMPLATE true ALLOW_CONNECTIONS false;')
+
+        logging.info(f"Snapshot '{snapshot_name}' of '{dbname}' created in {time.perf_counter() - start:.2f}s.")
+        print(f"Snapshot '{snapshot_name}' of '{dbname}' created in {time.perf_counter() - start:.2f}s.")
+        return True
+
+    except psycopg2.Error as e:
+        logging.error(f"Error creating snapshot '{snapshot_name}': {e}")
+        print(f"Error creating snapshot '{snapshot_name}': {e}")
+        return False
+
+    finally:
+        close_connection(conn, cursor)
+
+def restore_database(config, snapshot_name):
+    """Replace the configured database with a clone of the snapshot."""
+    dbname = config['database']['dbname']
+    conn = connect_to_maintenance_database(config)
+    if not conn:
+        return False
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (snapshot_name,))
+        if cursor.fetchone() is None:
+            logging.error(f"Snapshot '{snapshot_name}' does not exist.")
+            print(f"Snapshot '{snapshot_name}' does not exist.")
+            return False
+
+        terminate_connections(cursor, dbname)
+        cursor.execute(f'DROP DATABASE IF EXISTS "{dbname}";')
+        cursor.execute(f'CREATE DATABASE "{dbname}" TEMPLATE "{snapshot_name}"{copy_strategy(cursor)};')
+
+        logging.info(f"Database '{dbname}' restored from snapshot '{snapshot_name}' in {time.perf_counter() - start:.2f}s.")
+        print(f"Database '{dbname}' restored from snapshot '{snapshot_name}' in {time.perf_counter() - start:.2f}s.")
+        return True
+
+    except psycopg2.Error as e:
+        logging.error(f"Error restoring snapshot '{snapshot_name}': {e}")
+        print(f"Error restoring snapshot '{snapshot_name}': {e}")
+        return False
+
+    finally:
+        close_connection(conn, cursor)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reset the vault, or snapshot and restore a loaded database.")
+    parser.add_argument('action', choices=['truncate', 'snapshot', 'restore'])
+    parser.add_argument('--name', default='vault_snapshot', help='Name of the snapshot database.')
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        if not config:
+            return
+
+        if args.action == 'truncate':
+            connection = connect_to_database(config)
+            if connection:
+                reset_tables(connection, snapshot_dir=snapshot_directory(config))
+                close_connection(connection)
+        elif args.action == 'snapshot':
+            snapshot_database(config, args.name)
+        else:
+            restore_database(config, args.name)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import zlib
+from datetime import date, timedelta
+
+try:
+    from database_utils import load_config, connect_to_database, close_connection
+    from logging_utils import configure_logging
+    from reset import reset_tables, snapshot_directory
+except ImportError:
+    from src.database.database_utils import load_config, connect_to_database, close_connection
+    from src.database.logging_utils import configure_logging
+    from src.database.reset import reset_tables, snapshot_directory
+
+# Configure logging
+configure_logging('data_vault.log')
+
+SOURCES = ['Online', 'In-store', 'Mobile App']
+
+# Messages of main.py counted per loader
+RETRY_MESSAGE = re.compile(r"Retrying a batch after a (\w+)")
+ERROR_MESSAGE = re.compile(r"Error inserting data into \w+: (.*)")
+
+def stable_hash(key):
+    """Hash of a key that is the same in every run, unlike hash() of a str."""
+    return zlib.crc32(key.encode())
+
+def write_rows(path, rows):
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+def overlapping_files(keys, loaders, overlap, make_row, directory, prefix):
+    """Write one file per loader: its own share of the keys plus a share of every other loader's keys.
+
+    Every key is in at least one file, and about overlap of each file's keys
+    are also in other files, in a different order and with different attributes.
+    """
+    paths = []
+    shares = [keys[index::loaders] for index in range(loaders)]
+    for index in range(loaders):
+        borrowed = [key for other, share in enumerate(shares) if other != index
+                    for key in random.sample(share, int(len(share) * overlap / max(1, loaders - 1)))]
+        file_keys = shares[index] + borrowed
+        random.shuffle(file_keys)
+        path = os.path.join(directory, f"{prefix}_{index}.csv")
+        write_rows(path, [make_row(key) for key in file_keys])
+        paths.append(path)
+    return paths
+
+def generate_files(directory, loaders, rows, overlap):
+    """Write the customer, product and sales files of the loaders; returns {table_name: [paths]}."""
+    os.makedirs(directory, exist_ok=True)
+    customers = [f"stress-customer-{number}" for number in range(rows)]
+    products = [f"stress-product-{number}" for number in range(max(1, rows // 10))]
+    transactions = [f"stress-transaction-{number}" for number in range(rows * 5)]
+    first_day = date.today() - timedelta(days=365)
+    return {
+        'customers_hub': overlapping_files(customers, loaders, overlap, lambda key: [
+            key, f"Name {random.randint(1, 10 ** 6)}", f"{key}@example.com", f"{random.randint(1, 999)} Main Street",
+            random.choice(SOURCES)], directory, 'customers'),
+        'products_hub': overlapping_files(products, loaders, overlap, lambda key: [
+            key, f"product {random.randint(1, 10 ** 6)}", random.choice(['Books', 'Toys', 'Electronics']),
+            random.choice(['Sony', 'HP', 'Nike']), 'Retailer'], directory, 'products'),
+        # A transaction keeps its attributes across files, as a replayed source would
+        'sales_link': overlapping_files(transactions, loaders, overlap, lambda key: [
+            key, customers[stable_hash(key) % len(customers)], products[stable_hash(key) % len(products)],
+            (first_day + timedelta(days=stable_hash(key) % 365)).isoformat(), f"{stable_hash(key) % 100000 / 100:.2f}",
+            SOURCES[stable_hash(key) % len(SOURCES)]], directory, 'sales'),
+    }
+
+def run_loaders(jobs, concurrent):
+    """Run one `main.py --file` process per (table_name, path) at the same time.
+
+    Returns (seconds, retries per kind, [(path, error)] of the loads that failed).
+    """
+    start = time.perf_counter()
+    processes = []
+    for table_name, path in jobs:
+        command = [sys.executable, 'main.py', '--file', path, '--table', table_name] + (['--concurrent'] if concurrent else [])
+        processes.append((path, subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)))
+
+    retries, failures = {}, []
+    for path, process in processes:
+        output, _ = process.communicate()
+        for kind in RETRY_MESSAGE.findall(output):
+            retries[kind] = retries.get(kind, 0) + 1
+        errors = ERROR_MESSAGE.findall(output)
+        if errors or process.returncode:
+            failures.append((path, errors[0] if errors else f"exit status {process.returncode}"))
+    return time.perf_counter() - start, retries, failures
+
+def count_problems(cursor, files):
+    """Check the vault after the loads; returns {problem: count} of the checks that failed."""
+    expected = {}
+    for table_name, paths in files.items():
+        keys = set()
+        for path in paths:
+            with open(path, newline='') as file:
+                keys.update(row[0] for row in csv.reader(file))
+        expected[table_name] = len(keys)
+
+    checks = {
+        'customers without a hub row': ("SELECT %s - COUNT(*) FROM customers_hub", [expected['customers_hub']]),
+        'products without a hub row': ("SELECT %s - COUNT(*) FROM products_hub", [expected['products_hub']]),
+        'transactions missing from sales_link': ("SELECT %s - COUNT(*) FROM sales_link", [expected['sales_link']]),
+        'customers with no current satellite row': ("""
+            SELECT COUNT(*) FROM customers_hub h
+            WHERE NOT EXISTS (SELECT 1 FROM customers_satellite s WHERE s.customer_hash_key = h.customer_hash_key AND s.end_date IS NULL)
+        """, []),
+        'customers with several current satellite rows': ("""
+            SELECT COUNT(*) FROM (SELECT customer_hash_key FROM customers_satellite WHERE end_date IS NULL
+                                  GROUP BY 1 HAVING COUNT(*) > 1) AS duplicated
+        """, []),
+        'products with no current satellite row': ("""
+            SELECT COUNT(*) FROM products_hub h
+            WHERE NOT EXISTS (SELECT 1 FROM products_satellite s WHERE s.product_hash_key = h.product_hash_key AND s.end_date IS NULL)
+        """, []),
+        'products with several current satellite rows': ("""
+            SELECT COUNT(*) FROM (SELECT product_hash_key FROM products_satellite WHERE end_date IS NULL
+                                  GROUP BY 1 HAVING COUNT(*) > 1) AS duplicated
+        """, []),
+        'transactions with a satellite row count other than one': ("""
+            SELECT COUNT(*) FROM sales_link l
+            WHERE (SELECT COUNT(*) FROM sales_transactions_satellite s WHERE s.transaction_hash_key = l.transaction_hash_key) <> 1
+        """, []),
+        'transactions counted differently by mart_sales_by_source': ("""
+            SELECT ABS((SELECT COUNT(*) FROM sales_link) - (SELECT COALESCE(SUM(transaction_count), 0) FROM mart_sales_by_source))
+        """, []),
+        'loads not completed in load_journal': ("SELECT %s - COUNT(*) FROM load_journal WHERE completed",
+                                                [sum(len(paths) for paths in files.values())]),
+    }
+    problems = {}
+    for problem, (sql, params) in checks.items():
+        cursor.execute(sql, params)
+        count = cursor.fetchone()[0]
+        if count:
+            problems[problem] = count
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent loaders on overlapping files and check the vault they leave. "
+                                                 "Empties the vault tables first.")
+    parser.add_argument('--loaders', type=int, default=4, help='Loaders per table run at the same time.')
+    parser.add_argument('--rows', type=int, default=2000, help='Customers generated; products and sales scale with it.')
+    parser.add_argument('--overlap', type=float, default=0.5, help="Share of each file's keys also loaded by other loaders.")
+    parser.add_argument('--mode', choices=['concurrent', 'default', 'both'], default='both',
+                        help='Write mode of the loaders: the concurrency mode of main.py, the default one, or each in turn.')
+    parser.add_argument('--directory', default='data/stress', help='Where the generated files are written.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        config = load_config("src/database/config.yaml")
+        random.seed(args.seed)
+        files = generate_files(args.directory, args.loaders, args.rows, args.overlap)
+
+        failed = False
+        for mode in (['concurrent', 'default'] if args.mode == 'both' else [args.mode]):
+            connection = connect_to_database(config)
+            reset_tables(connection, snapshot_dir=snapshot_directory(config))
+
+            # The hubs are loaded before the sales that reference them; each phase runs all its loaders at once
+            hub_jobs = [(table_name, path) for table_name in ('customers_hub', 'products_hub') for path in files[table_name]]
+            hub_seconds, hub_retries, hub_failures = run_loaders(hub_jobs, mode == 'concurrent')
+            sales_seconds, sales_retries, sales_failures = run_loaders([('sales_link', path) for path in files['sales_link']],
+                                                                      mode == 'concurrent')
+
+            cursor = connection.cursor()
+            problems = count_problems(cursor, files)
+            connection.rollback()
+            close_connection(connection, cursor)
+
+            failures = hub_failures + sales_failures
+            # The default mode is only run for comparison and is expected to deadlock, so it does not fail the check
+            if mode == 'concurrent':
+                failed = failed or bool(failures or problems)
+            summary = (f"{mode} mode: {len(hub_jobs)} hub loaders in {hub_seconds:.2f}s (retries: {hub_retries or 'none'}), "
+                       f"{len(files['sales_link'])} sales loaders in {sales_seconds:.2f}s (retries: {sales_retries or 'none'}), "
+                       f"{len(failures)} failed loads, problems: {problems or 'none'}")
+            logging.info(summary)
+            print(summary)
+            for path, error in failures:
+                print(f"  {path}: {error}")
+        return 1 if failed else 0
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from datetime import datetime
+from operator import itemgetter
+
+from psycopg2.extras import execute_values
+
+try:
+    from .logging_utils import configure_logging
+    from .marts import apply_sales_delta
+    from ..hash_keys import generate_hash_key, generate_concat_hash
+except ImportError:
+    from src.database.logging_utils import configure_logging
+    from src.database.marts import apply_sales_delta
+    from src.hash_keys import generate_hash_key, generate_concat_hash
+
+# Configure logging
+configure_logging('data_vault.log')
+
+# Source recorded for the sales handed over by the part1 ETL
+ETL_SOURCE = 'ETL'
+
+def create_hub_stubs(cursor, hub_table, hash_key_column, id_column, keys, page_size=1000):
+    """Insert hub rows holding only the business key for the (hash_key, business_key) pairs not in the hub yet.
+
+    A later hub load adds their satellites, as ON CONFLICT keeps the stubs.
+    """
+    execute_values(cursor, f"""
+        INSERT INTO {hub_table} ({hash_key_column}, {id_column}) VALUES %s
+        ON CONFLICT ({hash_key_column}) DO NOTHING
+    """, sorted(set(keys)), page_size=page_size)
+
+def load_sales_frame(cursor, frame, source=ETL_SOURCE, page_size=1000):
+    """Load a DataFrame of cleaned sales into sales_link, sales_transactions_satellite and the marts.
+
+    frame has the columns transaction_id, customer_id (in clear), product_id
+    and sale_date (datetime64) of the part1 ETL. The hub and link hash keys
+    and the hash diffs are computed from the columns, and customers and
+    products not in their hubs yet get stub hub rows; the sales of a stub
+    product join mart_sales_by_category once a product load adds its
+    satellite. The ETL has no amounts, so transaction_amount is NULL. Transactions already in sales_link are
+    skipped. Runs in the caller's transaction; returns the number of new
+    transactions.
+    """
+    customer_ids = frame['customer_id'].astype(str).tolist()
+    product_ids = frame['product_id'].astype(str).tolist()
+    transaction_dates = frame['sale_date'].dt.strftime('%Y-%m-%d').tolist()
+    transaction_keys = [generate_hash_key(key) for key in frame['transaction_id'].astype(str).tolist()]
+    customer_keys = [generate_hash_key(key) for key in customer_ids]
+    product_keys = [generate_hash_key(key) for key in product_ids]
+    load_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    create_hub_stubs(cursor, 'customers_hub', 'customer_hash_key', 'customer_id', zip(customer_keys, customer_ids), page_size)
+    create_hub_stubs(cursor, 'products_hub', 'product_hash_key', 'product_id', zip(product_keys, product_ids), page_size)
+
+    # A transaction repeated in the frame is loaded once, from its last row; rows go in hash key order like the hub loads
+    link_params = {transaction_key: (transaction_key, customer_key, product_key, transaction_date, None, load_date, source)
+                   for transaction_key, customer_key, product_key, transaction_date
+                   in zip(transaction_keys, customer_keys, product_keys, transaction_dates)}
+    if not link_params:
+        return 0
+    inserted = execute_values(cursor, """
+        INSERT INTO sales_link
+        (transaction_hash_key, customer_hash_key, product_hash_key, transaction_date, transaction_amount, load_date, source)
+        VALUES %s
+        ON CONFLICT (transaction_hash_key) DO NOTHING
+        RETURNING transaction_hash_key
+    """, sorted(link_params.values(), key=itemgetter(0)), page_size=page_size, fetch=True)
+    new_transaction_keys = [row[0] for row in inserted]
+
+    # Only new transactions get a satellite row; the hash diff is that of a sales row loaded from CSV
+    satellite_params = [(key, load_date, None, load_date, source,
+                         generate_concat_hash(link_params[key][3], source))
+                        for key in sorted(new_transaction_keys)]
+    if satellite_params:
+        execute_values(cursor, """
+            INSERT INTO sales_transactions_satellite
+            (transaction_hash_key, start_date, end_date, load_date, source, hash_diff)
+            VALUES %s
+        """, satellite_params, page_size=page_size)
+
+    # Fold the new transactions into the marts in the same transaction
+    apply_sales_delta(cursor, new_transaction_keys)
+    return len(new_transaction_keys)
@@ -0,0 +1,52 @@
+import logging
+
+try:
+    from logging_utils import configure_logging
+except ImportError:
+    from .logging_utils import configure_logging
+
+# Configure logging
+configure_logging('data_vault.log')
+
+def parse_queries(file_path):
+    """Split a SQL file into named queries.
+
+    Each statement is named after the last '--' comment line above it, so the
+    reports in sample_queries.sql keep the descriptions they are written with.
+    Returns a list of (name, sql) tuples in file order.
+    """
+    queries = []
+    seen_names = {}
+    comment = None
+    statement_lines = []
+
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                stripped = line.strip()
+                if not statement_lines and stripped.startswith('--'):
+                    comment = stripped.lstrip('-').strip().rstrip(':').strip() or comment
+                    continue
+                if not stripped and not statement_lines:
+                    continue
+
+                statement_lines.append(line.rstrip())
+                if stripped.endswith(';'):
+                    sql = '\n'.join(statement_lines).rstrip(';').strip()
+                    name = comment or f"query_{len(queries) + 1}"
+
+                    # Keep names unique so they can key a baseline
+                    seen_names[name] = seen_names.get(name, 0) + 1
+                    if seen_names[name] > 1:
+                        name = f"{name} ({seen_names[name]})"
+
+                    queries.append((name, sql))
+                    statement_lines = []
+                    comment = None
+
+        return queries
+
+    except Exception as e:
+        logging.error(f"Error parsing queries from {file_path}: {e}")
+        print(f"Error parsing queries from {file_path}: {e}")
+        return []
@@ -1,14 +1,19 @@
 from faker import Faker
+import argparse
 import csv
 import random
 import logging
 
+try:
+    from database.logging_utils import configure_logging
+except ImportError:
+    from src.database.logging_utils import configure_logging
+
 # Initialize Faker generator
 fake = Faker()
 
 # Configure logging
-logging.basicConfig(filename='data_vault.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging('data_vault.log')
 
 # Define a list of product categories, brands, and types
 product_categories = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys', 'Sports & Outdoors']
@@ -76,26 +81,33 @@ def write_to_csv(data, filename):
         logging.error(f"Error writing data to CSV file: {e}")
         print(f"Error writing data to CSV file: {e}")
 
-try:
-    # Generate mock customer data
-    num_customers = 1000
-    customer_data = generate_customer_data(num_customers)
-    customer_ids = [customer[0] for customer in customer_data]
-
-    # Generate mock product data
-    num_products = 100
-    product_data = generate_product_data(num_products)
-    product_ids = [product[0] for product in product_data]
-
-    # Generate mock sales data
-    num_sales = 10000
-    sales_data = generate_sales_data(num_sales, customer_data, product_data)
-
-    # Write mock data to CSV files
-    write_to_csv(customer_data, 'data/customer_data.csv')
-    write_to_csv(product_data, 'data/product_data.csv')
-    write_to_csv(sales_data, 'data/sales_data.csv')
-
-except Exception as e:
-    logging.error(f"An error occurred: {e}")
-    print(f"An error occurred: {e}")
+def main():
+    parser = argparse.ArgumentParser(description="Generate mock customer, product and sales data.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier for the number of generated records (1 = 1000 customers, 100 products, 10000 sales).')
+    args = parser.parse_args()
+
+    try:
+        # Generate mock customer data
+        num_customers = max(1, int(1000 * args.scale))
+        customer_data = generate_customer_data(num_customers)
+
+        # Generate mock product data
+        num_products = max(1, int(100 * args.scale))
+        product_data = generate_product_data(num_products)
+
+        # Generate mock sales data
+        num_sales = max(1, int(10000 * args.scale))
+        sales_data = generate_sales_data(num_sales, customer_data, product_data)
+
+        # Write mock data to CSV files
+        write_to_csv(customer_data, 'data/customer_data.csv')
+        write_to_csv(product_data, 'data/product_data.csv')
+        write_to_csv(sales_data, 'data/sales_data.csv')
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import hashlib
+
+def generate_hash_key(id):
+    """Generate a hash key using MD5."""
+    return hashlib.md5(str(id).encode()).hexdigest()
+
+def generate_concat_hash(*fields):
+    """Concatenate fields and generate hash difference."""
+    concatenated_fields = ''.join(str(field) for field in fields)
+    return hashlib.md5(concatenated_fields.encode()).hexdigest()
+
+# Columns hashed per target table: (column of the hash key, columns of the hash diff)
+HASHED_COLUMNS = {
+    'products_hub': (0, (1, 2, 3)),
+    'customers_hub': (0, (1, 2, 3)),
+    'sales_link': (0, (3, 5)),
+}
+
+def hash_rows(table_name, rows):
+    """Return the (hash_keys, hash_diffs) columns of a batch of rows.
+
+    A row too short for the hash diff gets None; the loader rejects it anyway.
+    """
+    key_index, diff_indexes = HASHED_COLUMNS[table_name]
+    min_length = max(diff_indexes) + 1
+    hash_keys, hash_diffs = [], []
+    for row in rows:
+        hash_keys.append(generate_hash_key(row[key_index]) if len(row) > key_index else None)
+        hash_diffs.append(generate_concat_hash(*(row[index] for index in diff_indexes)) if len(row) >= min_length else None)
+    return hash_keys, hash_diffs
+
+class BatchHashes:
+    """Hash keys and hash diffs computed ahead for a batch of rows, e.g. by a reader process.
+
+    key() and diff() take the same arguments as generate_hash_key and
+    generate_concat_hash and only hash values that were not computed ahead.
+    """
+
+    def __init__(self, keys=None, diffs=None):
+        self.keys = keys or {}
+        self.diffs = diffs or {}
+
+    @classmethod
+    def from_rows(cls, table_name, rows, hash_keys, hash_diffs):
+        """Hashes of a list of rows, with the columns of hash_rows."""
+        key_index, diff_indexes = HASHED_COLUMNS[table_name]
+        keys = {row[key_index]: hash_key for row, hash_key in zip(rows, hash_keys) if hash_key is not None}
+        diffs = {tuple(row[index] for index in diff_indexes): hash_diff
+                 for row, hash_diff in zip(rows, hash_diffs) if hash_diff is not None}
+        return cls(keys, diffs)
+
+    @classmethod
+    def from_columns(cls, table_name, columns, hash_keys, hash_diffs):
+        """Hashes of a batch held as columns of values, with the columns of hash_rows."""
+        key_index, diff_indexes = HASHED_COLUMNS[table_name]
+        keys = dict(zip(columns[key_index], hash_keys))
+        diffs = dict(zip(zip(*(columns[index] for index in diff_indexes)), hash_diffs))
+        return cls(keys, diffs)
+
+    def key(self, id):
+        hash_key = self.keys.get(id)
+        return hash_key if hash_key is not None else generate_hash_key(id)
+
+    def diff(self, *fields):
+        hash_diff = self.diffs.get(fields)
+        return hash_diff if hash_diff is not None else generate_concat_hash(*fields)
@@ -0,0 +1,22 @@
+import importlib.util
+import os
+import sys
+
+# Both parts profile with part1's src/profiling.py; the vault loads run it from its path
+PROFILING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'part1', 'src', 'profiling.py')
+
+# Module name part1's profiling.py is imported under, so it does not clash with this module
+PROFILING_MODULE = 'part1_profiling'
+
+def import_profiling(path=PROFILING_FILE):
+    """Import part1's src/profiling.py from its path, once per process."""
+    if PROFILING_MODULE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PROFILING_MODULE, os.path.abspath(path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[PROFILING_MODULE] = module
+        spec.loader.exec_module(module)
+    return sys.modules[PROFILING_MODULE]
+
+import_profiling()
+from part1_profiling import (PROFILE_MODES, add_profile_argument, profiling_settings, start_profiling, stop_profiling,
+                             start_worker_profiling, stage)
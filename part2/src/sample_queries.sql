@@ -52,3 +52,33 @@ FROM sales_link sl
 GROUP BY transaction_month
 ORDER BY transaction_month;
 
+
+
+-- The same reports answered from the aggregate marts (kept current by every load):
+-- Count the number of sales transactions by source (mart):
+SELECT source, transaction_count
+FROM mart_sales_by_source;
+
+
+-- Find the total sales amount for each product category (mart):
+SELECT product_category, total_sales_amount
+FROM mart_sales_by_category;
+
+
+-- List the top 10 customers with the highest total transaction amounts (mart):
+SELECT cs.customer_name, top.total_transaction_amount
+FROM (
+    -- Ranked on mart_sales_by_customer_amount_idx first; only the ten winners are joined for their names
+    SELECT customer_hash_key, total_transaction_amount
+    FROM mart_sales_by_customer
+    ORDER BY total_transaction_amount DESC
+    LIMIT 10
+) top
+LEFT JOIN customers_satellite cs ON top.customer_hash_key = cs.customer_hash_key AND cs.end_date IS NULL
+ORDER BY top.total_transaction_amount DESC;
+
+
+-- Identify the trend of total sales amount over time (mart):
+SELECT transaction_month, total_sales_amount
+FROM mart_sales_by_month
+ORDER BY transaction_month;
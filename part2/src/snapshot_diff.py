@@ -0,0 +1,167 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+try:
+    from database.logging_utils import configure_logging
+    from compressed_input import open_text_input, strip_compression, compression_suffix
+except ImportError:
+    from src.database.logging_utils import configure_logging
+    from src.compressed_input import open_text_input, strip_compression, compression_suffix
+
+# Configure logging
+configure_logging('data_vault.log')
+
+def row_digest(row):
+    """Digest of all fields of a row, to tell changed rows from unchanged ones."""
+    return hashlib.md5('\x1f'.join(row).encode()).digest()
+
+def partition_file(csv_file, directory, partitions, key_index=0):
+    """Spread the rows of a CSV file over partition files by the hash of their key.
+
+    Returns the paths of the partition files. Every key lands in the same
+    partition for every file, so two snapshots can be compared partition by
+    partition with one partition in memory at a time.
+    """
+    paths = [os.path.join(directory, f"{index}.csv") for index in range(partitions)]
+    files = [open(path, 'w', newline='', encoding='utf-8') for path in paths]
+    try:
+        writers = [csv.writer(file) for file in files]
+        with open_text_input(csv_file) as source:
+            for row in csv.reader(source):
+                if not row:
+                    continue
+                key = row[key_index] if len(row) > key_index else ''
+                writers[zlib.crc32(key.encode()) % partitions].writerow(row)
+    finally:
+        for file in files:
+            file.close()
+    return paths
+
+def read_partition(path, key_index=0):
+    """Return {key: row} of a partition file; the last row of a repeated key wins, as in the loader."""
+    rows = {}
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.reader(file):
+            rows[row[key_index] if len(row) > key_index else ''] = row
+    return rows
+
+def diff_snapshots(previous_file, current_file, delta_file, deleted_file, partitions=16, key_index=0):
+    """Compare two snapshots of a CSV file with a hash-partitioned diff.
+
+    Writes the inserted and changed rows to delta_file, in the format of the
+    snapshot, and the keys missing from the current snapshot to deleted_file.
+    Memory is bounded by the size of one partition, not of the snapshots.
+    Returns the number of inserted, changed, deleted and unchanged keys.
+    """
+    counts = {'inserted': 0, 'changed': 0, 'deleted': 0, 'unchanged': 0}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(delta_file) or None) as work_dir:
+        previous_dir = os.path.join(work_dir, 'previous')
+        current_dir = os.path.join(work_dir, 'current')
+        os.makedirs(previous_dir)
+        os.makedirs(current_dir)
+        previous_paths = partition_file(previous_file, previous_dir, partitions, key_index)
+        current_paths = partition_file(current_file, current_dir, partitions, key_index)
+
+        with open(delta_file, 'w', newline='', encoding='utf-8') as delta, \
+                open(deleted_file, 'w', newline='', encoding='utf-8') as deleted:
+            delta_writer = csv.writer(delta)
+            deleted_writer = csv.writer(deleted)
+            for previous_path, current_path in zip(previous_paths, current_paths):
+                previous_digests = {key: row_digest(row) for key, row in read_partition(previous_path, key_index).items()}
+                for key, row in read_partition(current_path, key_index).items():
+                    digest = previous_digests.pop(key, None)
+                    if digest is None:
+                        counts['inserted'] += 1
+                        delta_writer.writerow(row)
+                    elif digest != row_digest(row):
+                        counts['changed'] += 1
+                        delta_writer.writerow(row)
+                    else:
+                        counts['unchanged'] += 1
+
+                # Keys left over are gone from the current snapshot
+                for key in previous_digests:
+                    counts['deleted'] += 1
+                    deleted_writer.writerow([key])
+    return counts
+
+def file_signature(csv_file):
+    stat = os.stat(csv_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def snapshot_paths(csv_file, snapshot_dir):
+    """Paths of the previous snapshot, delta, deleted keys and manifest of a source file.
+
+    The previous snapshot of a .gz or .zst file is kept compressed.
+    """
+    name = os.path.splitext(os.path.basename(strip_compression(csv_file)))[0]
+    return {
+        'previous': os.path.join(snapshot_dir, f"{name}.previous.csv{compression_suffix(csv_file)}"),
+        'delta': os.path.join(snapshot_dir, f"{name}.delta.csv"),
+        'deleted': os.path.join(snapshot_dir, f"{name}.deleted.csv"),
+        'manifest': os.path.join(snapshot_dir, f"{name}.manifest.json"),
+    }
+
+def prepare_delta(csv_file, snapshot_dir, partitions=16):
+    """Return (delta_file, deleted_file) to load instead of the full snapshot csv_file.
+
+    Without a previous snapshot, the whole file is the delta. A delta already
+    computed for the same pair of snapshots is reused as is, so a load that
+    stopped halfway resumes from its journal checkpoint.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    paths = snapshot_paths(csv_file, snapshot_dir)
+    if not os.path.exists(paths['previous']):
+        return csv_file, None
+
+    manifest = {'previous': file_signature(paths['previous']), 'current': file_signature(csv_file)}
+    if os.path.exists(paths['manifest']) and os.path.exists(paths['delta']):
+        with open(paths['manifest']) as file:
+            if json.load(file) == manifest:
+                logging.info(f"Reusing the delta of {csv_file} computed earlier.")
+                return paths['delta'], paths['deleted']
+
+    start = time.perf_counter()
+    counts = diff_snapshots(paths['previous'], csv_file, paths['delta'], paths['deleted'], partitions)
+    with open(paths['manifest'], 'w') as file:
+        json.dump(manifest, file)
+    logging.info(f"Snapshot diff of {csv_file} in {time.perf_counter() - start:.2f}s: {counts}")
+    print(f"Snapshot diff of {csv_file} in {time.perf_counter() - start:.2f}s: {counts}")
+    return paths['delta'], paths['deleted']
+
+def promote_snapshot(csv_file, snapshot_dir):
+    """Keep the loaded snapshot as the previous one of the next diff and drop the delta.
+
+    Returns the path of the previous snapshot, for the caller to record in the vault.
+    """
+    paths = snapshot_paths(csv_file, snapshot_dir)
+    shutil.copyfile(csv_file, paths['previous'])
+    for name in ('delta', 'deleted', 'manifest'):
+        if os.path.exists(paths[name]):
+            os.remove(paths[name])
+    return paths['previous']
+
+def discard_snapshot(csv_file, snapshot_dir):
+    """Remove the previous snapshot, delta and manifest of a source file, so its next load is a full one."""
+    for path in snapshot_paths(csv_file, snapshot_dir).values():
+        if os.path.exists(path):
+            os.remove(path)
+
+def read_deleted_keys(deleted_file, batch_size=1000):
+    """Yield the deleted keys in batches."""
+    with open(deleted_file, newline='', encoding='utf-8') as file:
+        batch = []
+        for row in csv.reader(file):
+            batch.append(row[0])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch